@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+📏 Capture Path Allocation Benchmark
+Compares per-frame allocations of the old capture path (a new array from
+cap.read(), another from cvtColor and a new VideoFrame per frame) with the
+pooled in-place path in webrtc_server.py. Uses a synthetic camera, so no
+hardware is needed.
+
+Usage: python bench_capture_alloc.py [--frames 300] [--width 1280] [--height 720]
+"""
+
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from av import VideoFrame
+
+import webrtc_media
+import webrtc_server
+
+
+class SyntheticCapture:
+    """Stands in for cv2.VideoCapture: copies a test pattern into the caller's buffer"""
+
+    def __init__(self, width, height):
+        self.pattern = cv2.resize(
+            np.random.default_rng(0).integers(0, 255, (90, 160, 3), dtype=np.uint8),
+            (width, height),
+        )
+
+    def read(self, image=None):
+        # Like OpenCV: write into ``image`` when it fits, otherwise allocate
+        if image is None or image.shape != self.pattern.shape:
+            image = np.empty_like(self.pattern)
+        np.copyto(image, self.pattern)
+        return True, image
+
+
+def legacy_frame(capture, state):
+    """One frame the way the server used to do it"""
+    _, image = capture.read()
+    yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420)
+    return VideoFrame.from_ndarray(yuv, format="yuv420p")
+
+
+def pooled_frame(capture, state):
+    """One frame through the pooled path: read and convert in place, refill a reused VideoFrame"""
+    pool = state['pool']
+    buffer = pool.acquire()
+    capture.read(buffer.image)
+    webrtc_server.convert_frame(buffer.image, buffer.yuv)
+    height, width = buffer.image.shape[:2]
+    frame = state['frame'] = webrtc_media.reusable_frame(state.get('frame'), width, height)
+    webrtc_media.copy_into_frame(frame, buffer.yuv)
+    buffer.release()
+    return frame
+
+
+def measure(name, frame_fn, capture, state, frames, warmup=30):
+    for _ in range(warmup):
+        frame_fn(capture, state)
+
+    traced_bytes = 0
+    tracemalloc.start()
+    faults_before = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    started = time.perf_counter()
+    for _ in range(frames):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        frame_fn(capture, state)
+        traced_bytes += tracemalloc.get_traced_memory()[1] - baseline
+    elapsed = time.perf_counter() - started
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults_before
+    tracemalloc.stop()
+
+    return {
+        'path': name,
+        'frames': frames,
+        'allocated_bytes_per_frame': round(traced_bytes / frames),
+        'page_faults_per_frame': round(faults / frames, 2),
+        'ms_per_frame': round(elapsed / frames * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture path allocation benchmark")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=webrtc_server.CAPTURE_WIDTH)
+    parser.add_argument('--height', type=int, default=webrtc_server.CAPTURE_HEIGHT)
+    parser.add_argument('--fps', type=int, default=webrtc_server.CAPTURE_FPS)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    capture = SyntheticCapture(args.width, args.height)
+    pool = webrtc_server.BufferPool(args.width, args.height)
+    results = [
+        measure('legacy', legacy_frame, capture, {}, args.frames),
+        measure('pooled', pooled_frame, capture, {'pool': pool}, args.frames),
+    ]
+    results[1]['pool_buffers'] = pool.allocated
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("=" * 60)
+    print(f"📏 Capture allocations per frame ({args.width}x{args.height}, {args.frames} frames)")
+    print("=" * 60)
+    print("Traced bytes are NumPy/OpenCV frame arrays; libav allocations show up as page faults")
+    for result in results:
+        churn = result['allocated_bytes_per_frame'] * args.fps / 1e6
+        print(f"\n{result['path']}:")
+        print(f"   Allocated: {result['allocated_bytes_per_frame']:,} bytes/frame ({churn:.0f} MB/s at {args.fps} fps)")
+        print(f"   Page faults: {result['page_faults_per_frame']}/frame")
+        print(f"   Time: {result['ms_per_frame']} ms/frame")
+        if 'pool_buffers' in result:
+            print(f"   Pool buffers: {result['pool_buffers']}")
+
+
+if __name__ == "__main__":
+    main()
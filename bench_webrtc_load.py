@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+📈 WebRTC Load Benchmark
+Starts N headless aiortc viewers against webrtc_server.py and measures
+time-to-answer, time-to-first-frame, received fps, jitter, glass-to-glass
+latency and server CPU for each peer count. By default a local server is launched on the built-in
+synthetic camera, so no webcam is needed.
+
+Every step negotiates its peers at once, gives them --warmup seconds to
+connect and then measures all of them over the same --duration window, the
+same window server CPU is sampled over. Peers answer the server's latency
+probe on a "latency" data channel, echoing when each frame was decoded.
+
+Usage: python bench_webrtc_load.py [--peers 1,2,4,8] [--duration 10] [--json report.json]
+       python bench_webrtc_load.py --url http://raspberrypi:8080   # server already running
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import aiohttp
+
+SERVER_START_TIMEOUT = 30.0   # Seconds to wait for a launched server's /health
+FIRST_FRAME_TIMEOUT = 15.0    # A peer without a frame by then counts as failed
+SETTLE_TIMEOUT = 15.0         # Seconds to wait for the previous step's sessions to close
+DECODED_KEPT = 64             # Decoded frame times kept for latency echoes that arrive late
+LATENCY_STAGES = ('capture', 'convert', 'encode', 'network', 'total')
+
+
+def percentiles(values):
+    """p50 / p95 / max of a list of values, or None if it is empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+    return {'p50': round(pick(0.5), 1), 'p95': round(pick(0.95), 1), 'max': round(ordered[-1], 1)}
+
+
+def frame_stats(arrivals, window_start, window_end):
+    """Received fps and jitter (mean deviation of frame intervals) within the window"""
+    times = [t for t in arrivals if window_start <= t <= window_end]
+    if len(times) < 2:
+        return {'frames': len(times), 'fps': 0.0, 'jitter_ms': None}
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    mean = sum(intervals) / len(intervals)
+    jitter = sum(abs(interval - mean) for interval in intervals) / len(intervals)
+    return {
+        'frames': len(times),
+        'fps': round((len(times) - 1) / (times[-1] - times[0]), 2),
+        'jitter_ms': round(jitter * 1000, 2),
+    }
+
+
+async def run_peer(url, device_id, camera_id, window_start, window_end):
+    """One viewer: offer, answer, then timestamp every decoded frame until the window closes"""
+    from aiortc import RTCPeerConnection, RTCSessionDescription
+    from aiortc.mediastreams import MediaStreamError
+
+    pc = RTCPeerConnection()
+    receiver = pc.addTransceiver('video', direction='recvonly').receiver
+    latency_channel = pc.createDataChannel('latency')
+    arrivals = []
+    first_frame = asyncio.Event()
+    consumers = []
+    result = {'device_id': device_id, 'ok': False, 'latency': []}
+    decoded = OrderedDict()  # RTP timestamp -> decode time (ms)
+    mapped = set()           # Frame IDs the server asked about before they were decoded
+
+    def echo(frame_id, decoded_at):
+        latency_channel.send(json.dumps({'type': 'rendered', 'id': frame_id, 'at': decoded_at}))
+
+    @latency_channel.on('message')
+    def on_latency_message(message):
+        data = json.loads(message)
+        if data['type'] == 'ping':
+            latency_channel.send(json.dumps({'type': 'pong', 't': data['t'], 'now': time.monotonic() * 1000}))
+        elif data['type'] == 'frame':
+            if data['id'] in decoded:
+                echo(data['id'], decoded[data['id']])
+            else:
+                mapped.add(data['id'])
+        elif data['type'] == 'latency' and window_start <= time.monotonic() <= window_end:
+            result['latency'].append(data['stages'])
+
+    async def consume(track):
+        try:
+            while True:
+                frame = await track.recv()
+                now = time.monotonic()
+                arrivals.append(now)
+                first_frame.set()
+                # The probe's frame ID is the RTP timestamp, which aiortc rebases to the
+                # first one received (browsers expose it as is)
+                frame_id = (frame.pts + receiver._RTCRtpReceiver__timestamp_mapper._origin) % 2**32
+                if frame_id in mapped:
+                    mapped.discard(frame_id)
+                    echo(frame_id, now * 1000)
+                else:
+                    decoded[frame_id] = now * 1000
+                    while len(decoded) > DECODED_KEPT:
+                        decoded.popitem(last=False)
+        except MediaStreamError:
+            pass
+
+    @pc.on('track')
+    def on_track(track):
+        consumers.append(asyncio.ensure_future(consume(track)))
+
+    started = time.monotonic()
+    try:
+        await pc.setLocalDescription(await pc.createOffer())
+        offer = {'deviceId': device_id, 'sdp': pc.localDescription.sdp, 'type': 'offer'}
+        if camera_id:
+            offer['cameraId'] = camera_id
+        offer_sent = time.monotonic()
+        async with aiohttp.ClientSession() as http:
+            async with http.post(url + '/signal', json=offer) as response:
+                answer = await response.json()
+                if response.status != 200:
+                    result['error'] = answer.get('error', f"HTTP {response.status}")
+                    return result
+        result['time_to_answer_ms'] = round((time.monotonic() - offer_sent) * 1000, 1)
+        await pc.setRemoteDescription(RTCSessionDescription(answer['sdp'], 'answer'))
+
+        try:
+            await asyncio.wait_for(first_frame.wait(), FIRST_FRAME_TIMEOUT)
+        except asyncio.TimeoutError:
+            result['error'] = 'no frame received'
+            return result
+        result['time_to_first_frame_ms'] = round((arrivals[0] - started) * 1000, 1)
+        await asyncio.sleep(max(window_end - time.monotonic(), 0))
+        result.update(frame_stats(arrivals, window_start, window_end))
+        result['ok'] = True
+        return result
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+    finally:
+        for consumer in consumers:
+            consumer.cancel()
+        await pc.close()
+
+
+def run_peer_group(url, device_ids, camera_id, window_start, window_end):
+    """Run several peers in this (client) process; returns their results and our CPU time"""
+    async def run():
+        return await asyncio.gather(*(
+            run_peer(url, device_id, camera_id, window_start, window_end) for device_id in device_ids
+        ))
+    cpu_started = time.process_time()
+    results = asyncio.run(run())
+    return results, time.process_time() - cpu_started
+
+
+def warm_client():
+    """Pool initializer: load aiortc up front so it does not count against time-to-first-frame"""
+    import aiortc  # noqa: F401
+
+
+async def fetch_health(http, url):
+    async with http.get(url + '/health', timeout=aiohttp.ClientTimeout(total=5)) as response:
+        return await response.json()
+
+
+def server_cpu_seconds(health):
+    """CPU time of the server, including worker processes in multi-process mode"""
+    seconds = health.get('process_cpu_seconds', 0.0)
+    processes = health.get('processes') or {}
+    seconds += sum(worker['cpu_seconds'] for worker in processes.get('workers', {}).values())
+    return seconds
+
+
+async def wait_for_idle(http, url, baseline):
+    """Wait until the server is back to ``baseline`` sessions after a step"""
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    while time.monotonic() < deadline:
+        if (await fetch_health(http, url))['active_connections'] <= baseline:
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+
+async def run_step(pool, http, url, peers, args, step_index):
+    loop = asyncio.get_running_loop()
+    step_started = time.monotonic()
+    window_start = step_started + args.warmup
+    window_end = window_start + args.duration
+
+    # Spread the peers round-robin over the client processes
+    groups = [[] for _ in range(min(args.processes, peers))]
+    for index in range(peers):
+        groups[index % len(groups)].append(f"loadtest-{step_index}-{index}")
+    futures = [
+        loop.run_in_executor(pool, run_peer_group, url, group, args.camera, window_start, window_end)
+        for group in groups
+    ]
+
+    await asyncio.sleep(max(window_start - time.monotonic(), 0))
+    cpu_started = server_cpu_seconds(await fetch_health(http, url))
+    await asyncio.sleep(max(window_end - time.monotonic(), 0))
+    health = await fetch_health(http, url)
+    server_cpu = server_cpu_seconds(health) - cpu_started
+
+    results, client_cpu = [], 0.0
+    for group_results, group_cpu in await asyncio.gather(*futures):
+        results.extend(group_results)
+        client_cpu += group_cpu
+    ok = [result for result in results if result['ok']]
+    jitters = [result['jitter_ms'] for result in ok if result['jitter_ms'] is not None]
+    latency = []
+    for result in results:
+        samples = result.pop('latency')
+        result['latency_samples'] = len(samples)
+        latency.extend(samples)
+    return {
+        'peers': peers,
+        'connected': len(ok),
+        'failed': len(results) - len(ok),
+        'errors': sorted({result['error'] for result in results if 'error' in result}),
+        'time_to_answer_ms': percentiles([r['time_to_answer_ms'] for r in results if 'time_to_answer_ms' in r]),
+        'time_to_first_frame_ms': percentiles([r['time_to_first_frame_ms'] for r in ok]),
+        'fps': {
+            'mean': round(statistics.mean(r['fps'] for r in ok), 2),
+            'min': min(r['fps'] for r in ok),
+        } if ok else None,
+        'jitter_ms': {'mean': round(statistics.mean(jitters), 2), 'max': max(jitters)} if jitters else None,
+        # Capture to decode on the client, as measured by the server's latency probe
+        'glass_to_glass_ms': {
+            stage: percentiles([stages[stage] for stages in latency]) for stage in LATENCY_STAGES
+        } if latency else None,
+        'server_cpu_percent': round(server_cpu / args.duration * 100, 1),
+        'server_capture_fps': {
+            camera_id: camera['fps'] for camera_id, camera in health.get('cameras', {}).items()
+        },
+        # A saturated client makes every other number pessimistic
+        'client_cpu_percent': round(client_cpu / (time.monotonic() - step_started) * 100, 1),
+        'per_peer': results,
+    }
+
+
+def start_server(args):
+    """Launch webrtc_server.py on the synthetic camera; returns the process and its log path"""
+    env = dict(
+        os.environ,
+        WEBRTC_CAMERAS=f"0={args.source}",
+        WEBRTC_PORT=str(args.port),
+        WEBRTC_MAX_SESSIONS=str(sum(args.peers) + 1),
+        WEBRTC_CAPTURE_WIDTH=str(args.width),
+        WEBRTC_CAPTURE_HEIGHT=str(args.height),
+        WEBRTC_CAPTURE_FPS=str(args.fps),
+    )
+    if args.workers is not None:
+        env['WEBRTC_WORKERS'] = str(args.workers)
+    log = tempfile.NamedTemporaryFile('w', prefix='webrtc_server_', suffix='.log', delete=False)
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(server_dir, 'webrtc_server.py')],
+        cwd=server_dir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, log.name
+
+
+async def wait_for_server(http, url, process):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            return await fetch_health(http, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"No /health answer from {url} within {SERVER_START_TIMEOUT:.0f}s")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def benchmark(args):
+    process = log_path = None
+    url = args.url
+    if url is None:
+        process, log_path = start_server(args)
+        url = f"http://127.0.0.1:{args.port}"
+    pool = ProcessPoolExecutor(
+        max_workers=args.processes, mp_context=multiprocessing.get_context('spawn'),
+        initializer=warm_client,
+    )
+    try:
+        async with aiohttp.ClientSession() as http:
+            health = await wait_for_server(http, url, process)
+            baseline = health['active_connections']
+            steps = []
+            for step_index, peers in enumerate(args.peers):
+                print(f"▶️  {peers} peer(s)...", file=sys.stderr, flush=True)
+                steps.append(await run_step(pool, http, url, peers, args, step_index))
+                if not await wait_for_idle(http, url, baseline):
+                    print("⚠️  Sessions from the last step are still open; the next step may read high",
+                          file=sys.stderr)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=15)
+
+    return {
+        'tool': 'bench_webrtc_load',
+        'version': 2,
+        'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'host': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'server': {
+            'url': url,
+            'launched': process is not None,
+            'log': log_path,
+            'source': args.source if process is not None else None,
+            'relay_mode': health.get('relay_mode'),
+            'workers': len((health.get('processes') or {}).get('workers', {})) or None,
+        },
+        'config': {
+            'peers': args.peers,
+            'warmup_s': args.warmup,
+            'duration_s': args.duration,
+            'client_processes': args.processes,
+            'camera': args.camera,
+            'capture': f"{args.width}x{args.height}@{args.fps}" if process is not None else None,
+        },
+        'steps': steps,
+    }
+
+
+def print_report(report):
+    print("=" * 78)
+    print(f"📈 WebRTC load test against {report['server']['url']} ({report['host']['machine']}, "
+          f"{report['host']['cpus']} CPUs, rev {report['git_revision']})")
+    print("=" * 78)
+    print(f"{'peers':>5} {'ok':>4} {'answer p50/p95':>15} {'first frame p50/p95':>20} "
+          f"{'fps mean/min':>13} {'jitter':>7} {'g2g p50/p95':>13} {'srv CPU':>8} {'cli CPU':>8}")
+    for step in report['steps']:
+        answer = step['time_to_answer_ms'] or {'p50': 0, 'p95': 0}
+        first = step['time_to_first_frame_ms'] or {'p50': 0, 'p95': 0}
+        fps = step['fps'] or {'mean': 0, 'min': 0}
+        jitter = step['jitter_ms']['mean'] if step['jitter_ms'] else 0
+        glass = step['glass_to_glass_ms']['total'] if step['glass_to_glass_ms'] else {'p50': 0, 'p95': 0}
+        print(f"{step['peers']:>5} {step['connected']:>4} "
+              f"{answer['p50']:>7.0f}/{answer['p95']:<5.0f}ms {first['p50']:>10.0f}/{first['p95']:<6.0f}ms "
+              f"{fps['mean']:>6.1f}/{fps['min']:<6.1f} {jitter:>5.1f}ms "
+              f"{glass['p50']:>6.0f}/{glass['p95']:<4.0f}ms "
+              f"{step['server_cpu_percent']:>7.0f}% {step['client_cpu_percent']:>7.0f}%")
+        if step['glass_to_glass_ms']:
+            print("      ⏱️  " + ", ".join(
+                f"{stage} {step['glass_to_glass_ms'][stage]['p50']:.0f}ms"
+                for stage in LATENCY_STAGES if stage != 'total'
+            ) + " (p50)")
+        for error in step['errors']:
+            print(f"      ❌ {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebRTC synthetic-peer load test")
+    parser.add_argument('--peers', default='1,2,4,8',
+                        type=lambda value: [int(n) for n in value.split(',')],
+                        help="Comma-separated peer counts, one step each")
+    parser.add_argument('--duration', type=float, default=10.0, help="Measured seconds per step")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Seconds peers get to connect before measuring")
+    parser.add_argument('--processes', type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                        help="Client processes the peers are spread over")
+    parser.add_argument('--url', help="Test a running server instead of launching one")
+    parser.add_argument('--camera', help="cameraId to request (default camera if unset)")
+    parser.add_argument('--port', type=int, default=8181, help="Port for the launched server")
+    parser.add_argument('--source', default='synthetic', help="Camera device for the launched server")
+    parser.add_argument('--workers', type=int, help="WEBRTC_WORKERS for the launched server")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--json', metavar='PATH', help="Write the report as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+        return
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    print_report(report)
+    if args.json:
+        print(f"\n💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
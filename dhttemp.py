@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 DHT11 Temperature & Humidity Sensor Control Script
-Runs on Raspberry Pi - Only handles sensor on/off control
+Runs on Raspberry Pi - Handles sensor on/off control and samples the DHT11
+locally (DHT_DRIVER=simulated runs it without a Pi)
 
 ⚠️  IMPORTANT: Blocked User Access Control
     - All authorization is handled on the backend API
@@ -15,14 +16,18 @@ Runs on Raspberry Pi - Only handles sensor on/off control
     - Therefore, this script doesn't need additional blocking logic
 """
 
+import os
+import math
 import time
 import json
+import queue
+import random
+import statistics
 import requests
 import threading
+from collections import deque
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-import board
-import adafruit_dht
 
 # ============================================
 # Configuration
@@ -30,9 +35,25 @@ import adafruit_dht
 BACKEND_URL = "https://web-production-3d9a.up.railway.app"  # Your Railway backend
 DEVICE_ID = "3d49c55d-bbfd-4bd0-9663-8728d64743ac"  # Raspberry Pi device ID from admin portal
 SENSOR_ID = 6  # DHT11 Sensor ID (integer)
-DHT_PIN = board.D4  # GPIO4
+DHT_PIN = os.environ.get("DHT_PIN", "D4")  # board pin name (GPIO4)
 STATUS_CHECK_INTERVAL = 5  # Check backend status every 5 seconds
 
+# Sensor sampling: a dedicated thread reads the DHT11 and keeps the latest
+# filtered value in memory, so HTTP requests never touch the GPIO
+DHT_DRIVER = os.environ.get("DHT_DRIVER", "adafruit")  # "adafruit" reads the GPIO, "simulated" runs anywhere
+SAMPLE_INTERVAL = 3.0      # Seconds between samples (the DHT11 needs at least 1 s between reads)
+READ_RETRIES = 2           # Extra attempts after a failed read (checksum, timeout) within one sample
+RETRY_DELAY = 1.1          # Seconds between attempts
+MEDIAN_WINDOW = 5          # Raw readings the median filter runs over
+TEMPERATURE_RANGE = (0, 60)  # Plausible readings (°C); anything outside is discarded as a glitch
+HUMIDITY_RANGE = (1, 100)    # Plausible readings (%RH)
+
+# Sensor state and control acknowledgements are pushed to webrtc_server.py on
+# this Pi, which forwards them to viewers over the WebRTC data channel
+TELEMETRY_URL = "http://127.0.0.1:8080/telemetry"  # None to disable
+TELEMETRY_SOURCE = "dht11"
+TELEMETRY_BATCH_WINDOW = 0.01  # Seconds to wait for more updates before posting them together
+
 def get_local_ip():
     """Get the local IP address of this Raspberry Pi"""
     import socket
@@ -74,11 +95,225 @@ def register_device_ip():
         print(f"⚠️  Error registering IP: {e}")
         print(f"   (This is OK - continuing without IP registration)")
 
+# ============================================
+# Telemetry Push
+# ============================================
+class TelemetryPublisher:
+    """Pushes sensor values and control acknowledgements to webrtc_server.py
+
+    publish() never blocks the caller: updates are queued and a background
+    thread posts them, merging whatever arrived within
+    TELEMETRY_BATCH_WINDOW into one request over a kept-alive connection.
+    If the video server is not running, updates are dropped.
+    """
+
+    def __init__(self, url, source):
+        self.url = url
+        self.source = source
+        self.queue = queue.Queue()
+        self.http = requests.Session()
+        self.reachable = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.url:
+            self.thread.start()
+
+    def publish(self, values=None, event=None):
+        if self.url:
+            self.queue.put((values, event))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            time.sleep(TELEMETRY_BATCH_WINDOW)
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            values, events = {}, []
+            for item_values, event in batch:
+                values.update(item_values or {})
+                if event:
+                    events.append(event)
+            self._post({'source': self.source, 'values': values, 'events': events})
+
+    def _post(self, payload):
+        try:
+            response = self.http.post(self.url, json=payload, timeout=2)
+            response.raise_for_status()
+            if not self.reachable:
+                print("📟 Telemetry push to video server restored")
+            self.reachable = True
+        except Exception as e:
+            # Only report the change, not every failed post
+            if self.reachable:
+                print(f"⚠️  Telemetry push to video server failed: {e}")
+            self.reachable = False
+
+# ============================================
+# Sensor Drivers
+# ============================================
+class AdafruitDHT11:
+    """The real sensor on DHT_PIN via adafruit_dht (imported here so other drivers run off-Pi)"""
+    name = "adafruit"
+
+    def __init__(self, pin_name=DHT_PIN):
+        import board
+        import adafruit_dht
+        self.device = adafruit_dht.DHT11(getattr(board, pin_name))
+
+    def read(self):
+        """(temperature °C, humidity %RH); raises RuntimeError on checksum or timing failures"""
+        return self.device.temperature, self.device.humidity
+
+    def close(self):
+        self.device.exit()
+
+class SimulatedDHT11:
+    """Stand-in sensor: slow daily drift at DHT11 resolution, with the real part's failure modes
+
+    About one read in six fails the way the DHT11 does (checksum or missing
+    data) and one in forty returns a spike, so retries and the median
+    filter get exercised without hardware.
+    """
+    name = "simulated"
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def read(self):
+        roll = self.random.random()
+        if roll < 0.1:
+            raise RuntimeError("Checksum did not validate. Try again.")
+        if roll < 0.17:
+            raise RuntimeError("A full buffer was not returned. Try again.")
+        phase = time.time() / 86400 * 2 * math.pi
+        temperature = 22 + 4 * math.sin(phase) + self.random.gauss(0, 0.4)
+        humidity = 55 - 10 * math.sin(phase) + self.random.gauss(0, 1.0)
+        if roll > 0.975:
+            temperature += self.random.choice((-15, 15))
+        return round(temperature), round(humidity)
+
+    def close(self):
+        pass
+
+SENSOR_DRIVERS = {driver.name: driver for driver in (AdafruitDHT11, SimulatedDHT11)}
+
+# ============================================
+# Sensor Sampling
+# ============================================
+class SensorSampler:
+    """Reads the DHT11 on its own thread and keeps the latest filtered value
+
+    Every SAMPLE_INTERVAL (while the sensor is enabled) the driver is read,
+    retrying up to READ_RETRIES times on the DHT11's usual checksum and
+    timing failures. Readings outside the plausible range are discarded,
+    and the published value is the median of the last MEDIAN_WINDOW good
+    readings, so a single bad read never reaches clients. ``latest`` is
+    replaced with a new dict for every sample and never modified, so
+    request handlers read it without a lock. A changed value is also
+    pushed to the video server as telemetry.
+    """
+
+    def __init__(self, driver_name=DHT_DRIVER, interval=SAMPLE_INTERVAL):
+        if driver_name not in SENSOR_DRIVERS:
+            raise ValueError(f"Unknown DHT_DRIVER {driver_name!r} (expected one of {', '.join(SENSOR_DRIVERS)})")
+        self.driver_class = SENSOR_DRIVERS[driver_name]
+        self.interval = interval
+        self.driver = None
+        self.latest = None
+        self.temperatures = deque(maxlen=MEDIAN_WINDOW)
+        self.humidities = deque(maxlen=MEDIAN_WINDOW)
+        self.stats = {'samples': 0, 'reads': 0, 'failed_reads': 0, 'discarded': 0, 'missed_samples': 0}
+        self.last_error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="dht-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=RETRY_DELAY * (READ_RETRIES + 1) + 1)
+        if self.driver:
+            self.driver.close()
+            self.driver = None
+
+    def _run(self):
+        print(f"🌡️  Sampling DHT11 every {self.interval:g}s ({self.driver_class.name} driver)")
+        while not self._stop.is_set():
+            started = time.monotonic()
+            if sensor_enabled:
+                try:
+                    self._sample()
+                except Exception as e:
+                    # Anything but a failed read (e.g. the GPIO could not be opened): start over
+                    print(f"❌ DHT11 driver error: {e}")
+                    self.last_error = str(e)
+                    if self.driver:
+                        self.driver.close()
+                    self.driver = None
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def _read(self):
+        """One good (temperature, humidity) reading, or None after READ_RETRIES retries"""
+        if self.driver is None:
+            self.driver = self.driver_class()
+        for attempt in range(READ_RETRIES + 1):
+            if attempt and self._stop.wait(RETRY_DELAY):
+                return None
+            self.stats['reads'] += 1
+            try:
+                temperature, humidity = self.driver.read()
+            except RuntimeError as e:
+                self.stats['failed_reads'] += 1
+                self.last_error = str(e)
+                continue
+            if temperature is None or humidity is None \
+                    or not TEMPERATURE_RANGE[0] <= temperature <= TEMPERATURE_RANGE[1] \
+                    or not HUMIDITY_RANGE[0] <= humidity <= HUMIDITY_RANGE[1]:
+                self.stats['discarded'] += 1
+                continue
+            return temperature, humidity
+        return None
+
+    def _sample(self):
+        reading = self._read()
+        if reading is None:
+            self.stats['missed_samples'] += 1
+            return
+        self.temperatures.append(reading[0])
+        self.humidities.append(reading[1])
+        previous = self.latest
+        self.latest = {
+            'temperature': statistics.median(self.temperatures),
+            'humidity': statistics.median(self.humidities),
+            'raw_temperature': reading[0],
+            'raw_humidity': reading[1],
+            'window': len(self.temperatures),
+            'sampled_at': time.time(),
+        }
+        self.stats['samples'] += 1
+        if previous is None or (previous['temperature'], previous['humidity']) \
+                != (self.latest['temperature'], self.latest['humidity']):
+            telemetry.publish({'temperature': self.latest['temperature'], 'humidity': self.latest['humidity']})
+
+    def snapshot(self):
+        """The latest filtered reading with its age, or None before the first one"""
+        latest = self.latest
+        if latest is None:
+            return None
+        return {**latest, 'age': round(time.time() - latest['sampled_at'], 1)}
+
+    def status(self):
+        return {'driver': self.driver_class.name, **self.stats, 'last_error': self.last_error}
+
 # ============================================
 # Global State
 # ============================================
 sensor_enabled = True
-dht = None
+telemetry = TelemetryPublisher(TELEMETRY_URL, TELEMETRY_SOURCE)
+sampler = SensorSampler()
 
 # ============================================
 # HTTP Request Handler
@@ -100,10 +335,18 @@ class SensorHandler(BaseHTTPRequestHandler):
                 'enabled': sensor_enabled,
                 'device_id': DEVICE_ID,
                 'sensor_id': SENSOR_ID,
+                'reading': sampler.snapshot(),
                 'timestamp': time.time()
             }
             self._send_response(200, response)
         
+        elif path == '/sensor/latest':
+            reading = sampler.snapshot()
+            if reading is None:
+                self._send_response(503, {'error': 'No reading yet', 'enabled': sensor_enabled})
+            else:
+                self._send_response(200, {**reading, 'enabled': sensor_enabled})
+        
         elif path == '/sensor/control':
             action = query.get('action', [''])[0]
             
@@ -112,18 +355,20 @@ class SensorHandler(BaseHTTPRequestHandler):
                 print("✅ Sensor turned ON")
                 response = {'status': 'Sensor turned ON', 'enabled': True}
                 self._send_response(200, response)
+                publish_control_ack(action)
             
             elif action == 'off':
                 sensor_enabled = False
                 print("⏸️  Sensor turned OFF")
                 response = {'status': 'Sensor turned OFF', 'enabled': False}
                 self._send_response(200, response)
+                publish_control_ack(action)
             
             else:
                 self._send_response(400, {'error': 'Invalid action. Use ?action=on or ?action=off'})
         
         elif path == '/health':
-            self._send_response(200, {'status': 'ok', 'sensor_enabled': sensor_enabled})
+            self._send_response(200, {'status': 'ok', 'sensor_enabled': sensor_enabled, 'sampler': sampler.status()})
         
         else:
             self._send_response(404, {'error': 'Not found'})
@@ -140,6 +385,13 @@ class SensorHandler(BaseHTTPRequestHandler):
         """Suppress default logging"""
         pass
 
+def publish_control_ack(action):
+    """Tell viewers a control command was applied"""
+    telemetry.publish(
+        {'enabled': sensor_enabled},
+        {'type': 'control_ack', 'action': action, 'enabled': sensor_enabled, 'timestamp': time.time()},
+    )
+
 # ============================================
 # Check Sensor Status from Backend
 # ============================================
@@ -164,6 +416,7 @@ def check_sensor_status():
                         sensor_enabled = backend_enabled
                         status = "ON" if sensor_enabled else "OFF"
                         print(f"🔄 Sensor state updated from backend: {status}")
+                        telemetry.publish({'enabled': sensor_enabled})
                     
                     return backend_enabled
         
@@ -200,6 +453,7 @@ def start_http_server(port=5000):
     print(f"🌐 HTTP Server started on port {port}")
     print(f"📍 Control Endpoints:")
     print(f"   - GET http://localhost:{port}/sensor/status")
+    print(f"   - GET http://localhost:{port}/sensor/latest")
     print(f"   - GET http://localhost:{port}/sensor/control?action=on")
     print(f"   - GET http://localhost:{port}/sensor/control?action=off")
     print(f"   - GET http://localhost:{port}/health")
@@ -212,12 +466,19 @@ def start_http_server(port=5000):
 if __name__ == "__main__":
     try:
         print("🚀 Initializing DHT11 Sensor Control...")
-        print("ℹ️  This script only handles sensor on/off control")
+        print("ℹ️  This script handles sensor on/off control and samples the sensor locally")
         print("ℹ️  No sensor data will be sent to backend")
         
         # Register device IP with backend
         register_device_ip()
         
+        # Push state changes to webrtc_server.py as they happen
+        telemetry.start()
+        telemetry.publish({'enabled': sensor_enabled})
+        
+        # Sample the DHT11 on its own thread; handlers serve the latest value
+        sampler.start()
+        
         # Start HTTP server in background thread
         server_thread = threading.Thread(target=start_http_server, args=(5000,), daemon=True)
         server_thread.start()
@@ -230,6 +491,5 @@ if __name__ == "__main__":
     
     finally:
         print("🔌 Cleaning up...")
-        if dht:
-            dht.exit()
+        sampler.stop()
         print("✅ Goodbye!")
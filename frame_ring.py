@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+🧵 Shared-memory Frame Ring
+Hands frames from one capture process to several server processes without
+pickling: the writer copies each frame into the next slot of a
+multiprocessing.shared_memory block and readers copy the newest slot out
+"""
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+RING_SLOTS = 4          # Frames kept; a reader has RING_SLOTS - 1 frames of slack before a slot is reused
+HEADER_SIZE = 64        # latest seq, camera state, reconnects
+SLOT_HEADER_SIZE = 64   # slot seq, capture timestamp, read start time
+RING_POLL_INTERVAL = 0.004  # Seconds a reader sleeps between checks for a new frame
+
+# Camera states as stored in the header (see CameraSupervisor.state)
+CAMERA_STATES = ['closed', 'open', 'reconnecting']
+
+def _aligned(size, alignment=64):
+    return (size + alignment - 1) // alignment * alignment
+
+class FrameRing:
+    """Fixed-geometry ring of recent frames in shared memory
+
+    Each slot holds a BGR image and its I420 conversion. While a slot is
+    being written its sequence number is cleared, and readers check it
+    before and after copying, so a slot that is reused mid-read is skipped
+    instead of returned torn. ``lock`` is a multiprocessing.Lock shared by
+    every process; it is only held around header reads and writes, which
+    orders them across cores. Readers poll for new frames instead of
+    waiting on a multiprocessing.Condition, whose notify_all() blocks until
+    every waiter wakes and would hang the writer if a reader were killed.
+    """
+    def __init__(self, name, width, height, lock, slots=RING_SLOTS, create=False):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.lock = lock
+        self.image_shape = (height, width, 3)
+        self.yuv_shape = (height * 3 // 2, width)
+        image_size = height * width * 3
+        yuv_size = self.yuv_shape[0] * width
+        slot_size = _aligned(SLOT_HEADER_SIZE + image_size + yuv_size)
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=HEADER_SIZE + slots * slot_size if create else 0
+        )
+        buf = self.shm.buf
+        self._header = np.ndarray((HEADER_SIZE // 8,), dtype=np.uint64, buffer=buf)
+        self._slot_seq = []
+        self._slot_time = []  # (capture timestamp, read start time)
+        self.images = []
+        self.yuvs = []
+        for slot in range(slots):
+            offset = HEADER_SIZE + slot * slot_size
+            self._slot_seq.append(np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=offset))
+            self._slot_time.append(np.ndarray((2,), dtype=np.float64, buffer=buf, offset=offset + 8))
+            self.images.append(np.ndarray(
+                self.image_shape, dtype=np.uint8, buffer=buf, offset=offset + SLOT_HEADER_SIZE
+            ))
+            self.yuvs.append(np.ndarray(
+                self.yuv_shape, dtype=np.uint8, buffer=buf, offset=offset + SLOT_HEADER_SIZE + image_size
+            ))
+        if create:
+            self._header[:] = 0
+            for slot_seq in self._slot_seq:
+                slot_seq[0] = 0
+        self.seq = int(self._header[0])
+        self.torn_reads = 0
+
+    @property
+    def latest_seq(self):
+        with self.lock:
+            return int(self._header[0])
+
+    def write(self, image, yuv, timestamp, read_started=None):
+        """Copy a frame into the next slot and wake readers (writer process only)"""
+        seq = self.seq + 1
+        slot = seq % self.slots
+        with self.lock:
+            self._slot_seq[slot][0] = 0
+        np.copyto(self.images[slot], image)
+        np.copyto(self.yuvs[slot], yuv)
+        self._slot_time[slot][0] = timestamp
+        self._slot_time[slot][1] = timestamp if read_started is None else read_started
+        with self.lock:
+            self._slot_seq[slot][0] = seq
+            self._header[0] = seq
+        self.seq = seq
+
+    def read(self, after_seq, image_out, yuv_out, timeout=None):
+        """Copy the newest frame newer than ``after_seq`` into the outputs
+
+        ``image_out`` may be None to copy only the I420 planes. Returns
+        (seq, timestamp, read_started), or None on timeout or if the slot
+        was reused while it was being copied.
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            with self.lock:
+                seq = int(self._header[0])
+                slot = seq % self.slots
+                slot_seq = int(self._slot_seq[slot][0])
+                timestamp, read_started = (float(t) for t in self._slot_time[slot])
+            if seq > after_seq:
+                break
+            if timeout is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(RING_POLL_INTERVAL)
+        if slot_seq != seq:
+            return None
+        if image_out is not None:
+            np.copyto(image_out, self.images[slot])
+        np.copyto(yuv_out, self.yuvs[slot])
+        with self.lock:
+            intact = int(self._slot_seq[slot][0]) == seq
+        if not intact:
+            self.torn_reads += 1
+            return None
+        return seq, timestamp, read_started
+
+    def set_camera_status(self, state, reconnects):
+        self._header[1] = CAMERA_STATES.index(state) if state in CAMERA_STATES else 0
+        self._header[2] = reconnects
+
+    def camera_status(self):
+        return {
+            'state': CAMERA_STATES[int(self._header[1])],
+            'reconnects': int(self._header[2]),
+            'ring': self.name,
+        }
+
+    def close(self):
+        # Drop our views first; SharedMemory refuses to close with exports alive
+        self._header = None
+        self._slot_seq = self._slot_time = self.images = self.yuvs = []
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
@@ -20,16 +20,47 @@ DEVICE_IDENTIFIER = "LAPTOP-14678VIP"
 ENDPOINT = "https://us-central1-sensor-app-2a69b.cloudfunctions.net/receiveMLAlert"
 BATCH_ENDPOINT = "https://us-central1-sensor-app-2a69b.cloudfunctions.net/receiveMLAlertBatch"
 
+# Local WebRTC server that keeps the pre-event clip buffer (see webrtc_server.py)
+WEBRTC_SERVER_URL = "http://localhost:8080"
 
-def send_single_alert(
+
+def capture_clip(pre_roll: float = 5.0, post_roll: float = 3.0) -> dict:
+    """
+    Ask the WebRTC server to cut a clip around now
+    
+    Args:
+        pre_roll: Seconds before now to include
+        post_roll: Seconds after now to include
+    
+    Returns:
+        Clip info (clipId, url, screenshots), or None if the server is unreachable.
+        screenshots is empty when the server knows no absolute URL for itself
+        (see WEBRTC_PUBLIC_URL)
+    """
+    
+    try:
+        response = requests.post(
+            f"{WEBRTC_SERVER_URL}/clips",
+            json={"preRoll": pre_roll, "postRoll": post_roll},
+            timeout=5
+        )
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️  No clip attached: {e}")
+        return None
+
+
+def build_alert(
     objects: list,
     risk_label: str = "medium",
     description: str = None,
     confidence: float = 0.85,
-    screenshots: list = None
+    screenshots: list = None,
+    clip: dict = None
 ) -> dict:
     """
-    Send a single ML alert to the endpoint
+    Build the alert payload accepted by receiveMLAlert and receiveMLAlertBatch
     
     Args:
         objects: List of detected objects e.g., ["person", "car"]
@@ -37,26 +68,61 @@ def send_single_alert(
         description: Alert description
         confidence: Confidence score (0-1)
         screenshots: List of screenshot URLs
+        clip: Clip from capture_clip(); referenced by ID, its screenshots
+              are used when none are given
     
     Returns:
-        Response from the endpoint
+        Alert dictionary
     """
     
-    payload = {
+    alert = {
         "deviceId": DEVICE_ID,
         "userId": USER_ID,
         "deviceIdentifier": DEVICE_IDENTIFIER,
         "detectedObjects": objects,
         "riskLabel": risk_label,
         "description": [description] if description else [],
-        "screenshots": screenshots or [],
+        "screenshots": screenshots or (clip["screenshots"] if clip else []),
         "confidenceScore": confidence
     }
+    if clip:
+        alert["clipId"] = clip["clipId"]
+        if "://" in clip["url"]:
+            alert["clipUrl"] = clip["url"]
+    return alert
+
+
+def send_single_alert(
+    objects: list,
+    risk_label: str = "medium",
+    description: str = None,
+    confidence: float = 0.85,
+    screenshots: list = None,
+    clip: dict = None
+) -> dict:
+    """
+    Send a single ML alert to the endpoint
+    
+    Args:
+        objects: List of detected objects e.g., ["person", "car"]
+        risk_label: Risk level - "critical", "high", "medium", "low"
+        description: Alert description
+        confidence: Confidence score (0-1)
+        screenshots: List of screenshot URLs
+        clip: Clip from capture_clip() to reference
+    
+    Returns:
+        Response from the endpoint
+    """
+    
+    payload = build_alert(objects, risk_label, description, confidence, screenshots, clip)
     
     print(f"\n📤 Sending alert...")
     print(f"   Objects: {', '.join(objects)}")
     print(f"   Risk: {risk_label.upper()}")
     print(f"   Confidence: {confidence * 100:.0f}%")
+    if clip:
+        print(f"   Clip: {clip['clipId']}")
     
     try:
         response = requests.post(ENDPOINT, json=payload, timeout=10)
@@ -80,7 +146,7 @@ def send_batch_alerts(alerts: list) -> dict:
     Send multiple alerts in batch
     
     Args:
-        alerts: List of alert dictionaries
+        alerts: List of alert dictionaries (see build_alert)
     
     Returns:
         Response from the endpoint
@@ -130,7 +196,8 @@ def test_alerts():
         objects=["person"],
         risk_label="high",
         description="Unauthorized person detected at entrance",
-        confidence=0.92
+        confidence=0.92,
+        clip=capture_clip()
     )
     time.sleep(2)
     
@@ -140,7 +207,8 @@ def test_alerts():
         objects=["person", "weapon", "vehicle"],
         risk_label="critical",
         description="Suspicious activity with multiple threats detected",
-        confidence=0.88
+        confidence=0.88,
+        clip=capture_clip()
     )
     time.sleep(2)
     
@@ -150,7 +218,8 @@ def test_alerts():
         objects=["vehicle"],
         risk_label="medium",
         description="Vehicle in restricted area",
-        confidence=0.78
+        confidence=0.78,
+        clip=capture_clip()
     )
     time.sleep(2)
     
@@ -160,7 +229,8 @@ def test_alerts():
         objects=["person", "bicycle"],
         risk_label="low",
         description="Normal pedestrian activity",
-        confidence=0.85
+        confidence=0.85,
+        clip=capture_clip()
     )
     
     print("\n" + "="*60)
@@ -196,7 +266,8 @@ def send_custom_alert():
         objects=objects,
         risk_label=risk_label,
         description=description,
-        confidence=confidence
+        confidence=confidence,
+        clip=capture_clip()
     )
 
 
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+🧠 On-device ML Inference
+Taps frames from the WebRTC server's frame bus, runs a pluggable detector in
+worker processes and sends detections to receiveMLAlertBatch
+"""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from ml_alert_sender import build_alert, send_batch_alerts
+
+logger = logging.getLogger(__name__)
+
+# Detector, as "module:Class"; the class is constructed once in every worker
+DETECTOR_SPEC = os.environ.get('ML_DETECTOR', 'ml_inference:StubDetector')
+
+# Inference settings
+INFERENCE_WORKERS = int(os.environ.get('ML_WORKERS', 2))      # Detector processes
+INFERENCE_FPS = float(os.environ.get('ML_FPS', 4))            # Frames sampled per second
+INFERENCE_BATCH_SIZE = int(os.environ.get('ML_BATCH_SIZE', 4))  # Frames per micro-batch
+INFERENCE_BATCH_WINDOW = 0.5   # Longest a partial batch waits for more frames (s)
+INFERENCE_INPUT_WIDTH = 320    # Frames are shrunk to this width before leaving the server process
+
+# Alert settings
+MIN_CONFIDENCE = float(os.environ.get('ML_MIN_CONFIDENCE', 0.6))
+ALERT_COOLDOWN = 30.0         # Seconds before the same set of objects is alerted again
+ALERT_FLUSH_INTERVAL = 5.0    # Seconds between batch posts to receiveMLAlertBatch
+ALERT_BATCH_MAX = 20          # Alerts per batch post
+
+# Highest-risk object decides the alert's risk label
+RISK_LABELS = {'weapon': 'critical', 'person': 'high', 'vehicle': 'medium'}
+RISK_ORDER = ['low', 'medium', 'high', 'critical']
+
+class Detector:
+    """Base class for pluggable detectors
+
+    ``detect()`` takes a batch of BGR images and returns one list of
+    detections per image. A detection is a dict with ``label``,
+    ``confidence`` and ``box`` (x0, y0, x1, y1 as fractions of the frame).
+    Detectors are constructed inside each worker process, so load models in
+    ``__init__`` rather than at import time.
+    """
+    name = 'detector'
+
+    def detect(self, images):
+        raise NotImplementedError
+
+class StubDetector(Detector):
+    """CPU-only stand-in model: reports a 'person' wherever the frame has a bright blob
+
+    Deterministic and dependency-free, for tests and for running the
+    pipeline on hardware without a real model.
+    """
+    name = 'stub'
+    BRIGHTNESS = 200      # Grey level counted as "bright"
+    MIN_AREA = 0.01       # Fraction of the frame that must be bright
+
+    def detect(self, images):
+        return [self._detect_one(image) for image in images]
+
+    def _detect_one(self, image):
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        mask = grey >= self.BRIGHTNESS
+        area = float(mask.mean())
+        if area < self.MIN_AREA:
+            return []
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        height, width = grey.shape
+        return [{
+            'label': 'person',
+            'confidence': round(min(0.5 + area * 5, 0.99), 3),
+            'box': (cols[0] / width, rows[0] / height, (cols[-1] + 1) / width, (rows[-1] + 1) / height),
+        }]
+
+def resolve_detector(spec):
+    """Return the detector class named by a "module:Class" spec"""
+    module_name, _, class_name = spec.partition(':')
+    detector_class = getattr(importlib.import_module(module_name), class_name or 'Detector')
+    if not issubclass(detector_class, Detector):
+        raise TypeError(f"{spec} is not a Detector")
+    return detector_class
+
+# Worker-process side: one detector per process, built by the pool initializer
+_worker_detector = None
+
+def _init_worker(spec):
+    global _worker_detector
+    _worker_detector = resolve_detector(spec)()
+
+def _detect_batch(images):
+    return _worker_detector.detect(images)
+
+def shrink(image, width=INFERENCE_INPUT_WIDTH):
+    """Scale a frame down to the inference input width, keeping its aspect"""
+    height = round(image.shape[0] * width / image.shape[1])
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+class InferenceStage:
+    """Runs detection on sampled bus frames and batches the resulting alerts
+
+    Frames are sampled at INFERENCE_FPS, shrunk to INFERENCE_INPUT_WIDTH as
+    they arrive (so their capture buffers are released straight away) and
+    grouped into micro-batches of up to INFERENCE_BATCH_SIZE, or whatever
+    arrived within INFERENCE_BATCH_WINDOW. Batches run in a process pool, one in flight per
+    worker, so detection never competes with the encoder for the GIL.
+    Alerts are flushed to receiveMLAlertBatch every ALERT_FLUSH_INTERVAL.
+    ``clip_source``, if given, is called for each alert and returns the
+    clip (see webrtc_server's ClipStore) the alert should reference.
+    """
+    def __init__(self, bus, detector_spec=DETECTOR_SPEC, workers=INFERENCE_WORKERS,
+                 send_alerts=send_batch_alerts, clip_source=None):
+        self.bus = bus
+        self.detector_spec = detector_spec
+        self.detector_name = resolve_detector(detector_spec).name  # Fail fast on a bad spec
+        self.workers = workers
+        self.send_alerts = send_alerts
+        self.clip_source = clip_source
+        self.pool = None
+        self.frames_inferred = 0
+        self.batches = 0
+        self.detections = 0
+        self.infer_seconds = 0.0
+        self.alerts_sent = 0
+        self.alerts_failed = 0
+        self._pending = []
+        self._last_alert = {}
+        self._slots = asyncio.Semaphore(workers)
+        self._tasks = set()
+        self._runners = []
+
+    def start(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.detector_spec,),
+        )
+        self._runners = [asyncio.create_task(self._run()), asyncio.create_task(self._flush_loop())]
+        logger.info(f"🧠 Inference started: {self.detector_spec} on {self.workers} workers")
+
+    async def stop(self):
+        for task in self._runners + list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._runners, *self._tasks, return_exceptions=True)
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        subscription = self.bus.subscribe()
+        batch = []
+        batch_started = 0.0
+        next_sample = 0.0
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(batch_started + INFERENCE_BATCH_WINDOW - time.monotonic(), 0)
+            frame = await subscription.next_frame(timeout)
+            if frame is not None and frame.timestamp >= next_sample:
+                next_sample = frame.timestamp + 1 / INFERENCE_FPS
+                if not batch:
+                    batch_started = time.monotonic()
+                # Shrunk at once, so no pooled capture buffer waits in a batch or for a worker
+                frame.retain()
+                try:
+                    image = await loop.run_in_executor(None, shrink, frame.image)
+                finally:
+                    frame.release()
+                batch.append((frame.timestamp, image))
+            if batch and (len(batch) >= INFERENCE_BATCH_SIZE
+                          or time.monotonic() - batch_started >= INFERENCE_BATCH_WINDOW):
+                await self._slots.acquire()
+                task = asyncio.create_task(self._infer(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                batch = []
+
+    async def _infer(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            started = time.monotonic()
+            results = await loop.run_in_executor(self.pool, _detect_batch, [image for _, image in batch])
+            self.infer_seconds += time.monotonic() - started
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Inference batch failed: {e}")
+            return
+        finally:
+            self._slots.release()
+        self.frames_inferred += len(batch)
+        self.batches += 1
+        for (timestamp, _), detections in zip(batch, results):
+            self._collect(timestamp, detections)
+
+    def _collect(self, timestamp, detections):
+        """Turn one frame's detections into a pending alert, honouring the cooldown"""
+        detections = [d for d in detections if d['confidence'] >= MIN_CONFIDENCE]
+        if not detections:
+            return
+        self.detections += len(detections)
+        objects = sorted({d['label'] for d in detections})
+        key = tuple(objects)
+        if timestamp - self._last_alert.get(key, -ALERT_COOLDOWN) < ALERT_COOLDOWN:
+            return
+        self._last_alert[key] = timestamp
+        risk = max((RISK_LABELS.get(label, 'low') for label in objects), key=RISK_ORDER.index)
+        confidence = max(d['confidence'] for d in detections)
+        self._pending.append(build_alert(
+            objects, risk, f"{', '.join(objects)} detected on camera ({self.detector_name})",
+            round(confidence, 2), clip=self.clip_source() if self.clip_source else None,
+        ))
+        logger.info(f"🚨 Detected {', '.join(objects)} ({risk}, {confidence:.0%})")
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(ALERT_FLUSH_INTERVAL)
+            while self._pending:
+                alerts = self._pending[:ALERT_BATCH_MAX]
+                del self._pending[:ALERT_BATCH_MAX]
+                result = await loop.run_in_executor(None, self.send_alerts, alerts)
+                if result is None:
+                    self.alerts_failed += len(alerts)
+                else:
+                    self.alerts_sent += len(alerts)
+
+    def status(self):
+        return {
+            'detector': self.detector_spec,
+            'workers': self.workers,
+            'frames_inferred': self.frames_inferred,
+            'batches': self.batches,
+            'detections': self.detections,
+            'pending_alerts': len(self._pending),
+            'alerts_sent': self.alerts_sent,
+            'alerts_failed': self.alerts_failed,
+        }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+📼 Segmented Recorder
+Writes a camera's already-encoded H.264 stream to fixed-length MPEG-TS
+segments on disk, indexed by time in a SegmentIndex and trimmed to a disk
+budget. Imported when recording starts, since it needs av.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+
+from segment_index import SegmentIndex
+from webrtc_server import (
+    RECORD_BUDGET_BYTES, RECORD_QUEUE_SIZE, RECORD_SEGMENT_SECONDS,
+)
+from webrtc_media import VIDEO_TIME_BASE
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.bin'
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f'{segment:010d}.ts')
+
+class SegmentRecorder:
+    """Subscribes to one SharedEncoder like a viewer and writes its packets to disk
+
+    Packets are copied as they arrive and muxed, not re-encoded, on a
+    dedicated thread. Segments start on a keyframe, and a new one is cut at
+    the first keyframe after ``segment_seconds``, so segments run that long
+    plus at most one keyframe interval and each can be played on its own.
+    Packet timestamps are the encoder's, continuous across segments, so
+    consecutive segments can also be concatenated as they are.
+
+    Each finished segment is added to the directory's SegmentIndex with
+    its wall-clock start and end. Once the segments exceed ``budget_bytes``
+    the oldest are deleted. If the disk falls behind by RECORD_QUEUE_SIZE
+    packets, packets are dropped until the next keyframe.
+    """
+    def __init__(self, feed, directory, rung, segment_seconds=RECORD_SEGMENT_SECONDS,
+                 budget_bytes=RECORD_BUDGET_BYTES):
+        self.feed = feed
+        self.directory = directory
+        self.rung = rung
+        self.segment_seconds = segment_seconds
+        self.budget_bytes = budget_bytes
+        self.encoder = None
+        self.index = None
+        self.bytes = 0
+        self.segments_written = 0
+        self.segments_deleted = 0
+        self.dropped_packets = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recorder')
+        self._pending = 0
+        self._waiting_for_keyframe = True
+        # Only touched on the recorder thread
+        self._container = None
+        self._stream = None
+        self._segment = None
+        self._segment_start = None
+        self._segment_end = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = SegmentIndex(os.path.join(self.directory, INDEX_FILE), writable=True)
+        self._remove_orphans()
+        self.bytes = self.index.total_bytes()
+        self.encoder = self.feed.shared_encoder(self.rung)
+        self.feed.add_viewer()  # Recording watches all the time, so this camera never idles
+        self.encoder.subscribe(self)
+        logger.info(f"📼 Recording camera {self.feed.id} ({self.rung['name']}) to {self.directory}")
+
+    def _remove_orphans(self):
+        """Delete segment files the index does not know, e.g. one cut short by a crash"""
+        kept = range(self.index.first, self.index.next)
+        for name in os.listdir(self.directory):
+            stem, extension = os.path.splitext(name)
+            if extension == '.ts' and stem.isdigit() and int(stem) not in kept:
+                os.remove(os.path.join(self.directory, name))
+
+    def push(self, packets, timestamp, stamps=None):
+        """Queue a frame's packets for the recorder thread (called by the SharedEncoder)"""
+        # Capture timestamps are monotonic; the index is searched by wall-clock time,
+        # taken afresh so a clock corrected by NTP is followed from the next segment on
+        wall = timestamp + time.time() - time.monotonic()
+        for packet in packets:
+            if self._waiting_for_keyframe:
+                if not packet.is_keyframe:
+                    continue
+                self._waiting_for_keyframe = False
+            if self._pending >= RECORD_QUEUE_SIZE:
+                # The disk is not keeping up; leave a gap rather than queue without bound
+                self.dropped_packets += 1
+                self._waiting_for_keyframe = True
+                self.encoder.catch_up(self)
+                return
+            self._pending += 1
+            # An asyncio future, so the done callback runs back on the event loop
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, self._write, bytes(packet), packet.pts, packet.is_keyframe,
+                wall,
+            )
+            future.add_done_callback(self._written)
+
+    def _written(self, future):
+        self._pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"❌ Error recording camera {self.feed.id}: {future.exception()}")
+
+    def _write(self, data, pts, keyframe, wall):
+        # A clock stepped back by NTP also cuts, or the segment would run until it caught up
+        if self._container is not None and keyframe and not 0 <= wall - self._segment_start < self.segment_seconds:
+            self._finish_segment()
+        if self._container is None:
+            if not keyframe:
+                return
+            self._open_segment(wall)
+        packet = av.Packet(data)
+        packet.pts = packet.dts = pts
+        packet.time_base = VIDEO_TIME_BASE
+        packet.is_keyframe = keyframe
+        packet.stream = self._stream
+        self._container.mux(packet)
+        self._segment_end = wall + 1 / self.encoder.fps
+
+    def _open_segment(self, wall):
+        self._segment = self.index.next
+        self._container = av.open(segment_path(self.directory, self._segment), 'w', format='mpegts')
+        self._stream = self._container.add_stream('h264', rate=self.encoder.fps)
+        self._stream.width = self.encoder.width
+        self._stream.height = self.encoder.height
+        self._stream.time_base = VIDEO_TIME_BASE
+        self._segment_start = wall
+
+    def _finish_segment(self):
+        if self._container is None:
+            return
+        self._container.close()
+        self._container = None
+        size = os.path.getsize(segment_path(self.directory, self._segment))
+        while len(self.index) >= self.index.capacity:
+            self._delete_oldest()
+        self.index.append(self._segment_start, self._segment_end, size)
+        self.index.flush()
+        self.segments_written += 1
+        self.bytes += size
+        while self.bytes > self.budget_bytes and len(self.index) > 1:
+            self._delete_oldest()
+
+    def _delete_oldest(self):
+        # Dropped from the index before the file goes, so readers never list a segment being deleted
+        _, _, segment, size = self.index.drop_oldest()
+        try:
+            os.remove(segment_path(self.directory, segment))
+        except FileNotFoundError:
+            pass
+        self.bytes -= size
+        self.segments_deleted += 1
+
+    async def stop(self):
+        if self.encoder is not None:
+            self.encoder.unsubscribe(self)
+            self.feed.remove_viewer()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._finish_segment)
+        await loop.run_in_executor(None, self.executor.shutdown, True)
+        if self.index is not None:
+            self.index.close()
+        logger.info(f"📼 Recording of camera {self.feed.id} stopped")
+
+    def status(self):
+        index = self.index
+        oldest = index.record(index.first) if index is not None and len(index) else None
+        newest = index.record(index.next - 1) if index is not None and len(index) else None
+        return {
+            'rung': self.rung['name'],
+            'segments': len(index) if index is not None else 0,
+            'bytes': self.bytes,
+            'budget_bytes': self.budget_bytes,
+            'oldest': int(oldest[0] * 1000) if oldest else None,
+            'newest': int(newest[1] * 1000) if newest else None,
+            'segments_written': self.segments_written,
+            'segments_deleted': self.segments_deleted,
+            'dropped_packets': self.dropped_packets,
+        }
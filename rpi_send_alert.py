@@ -9,13 +9,25 @@ import json
 import time
 from datetime import datetime
 
+from ml_alert_sender import capture_clip
+
 # Configuration - Update these with your values
 RAILWAY_API_URL = "https://web-production-07eda.up.railway.app/api/alerts"  # Your Railway URL
 DEVICE_ID = "3d49c55d-bbfd-4bd0-9663-8728d64743ac"  # Your Raspberry Pi device ID (CORRECTED)
 DEVICE_NAME = "raspberrypi"
 
-def send_alert(risk_level="Medium", description="Test alert from Raspberry Pi"):
-    """Send an alert to the Railway API"""
+def send_alert(risk_level="Medium", description="Test alert from Raspberry Pi", clip=None):
+    """Send an alert to the Railway API, referencing a clip from capture_clip() if given"""
+    
+    additional_data = {
+        "test": True,
+        "source": "raspberry_pi",
+        "sent_at": datetime.now().isoformat()
+    }
+    if clip:
+        additional_data["clip_id"] = clip["clipId"]
+        if "://" in clip["url"]:
+            additional_data["clip_url"] = clip["url"]
     
     alert_payload = {
         "deviceId": DEVICE_ID,
@@ -25,16 +37,12 @@ def send_alert(risk_level="Medium", description="Test alert from Raspberry Pi"):
             "risk_label": risk_level,
             "predicted_risk": risk_level,
             "description": [description, f"Sent from {DEVICE_NAME}"],
-            "screenshot": [],
+            "screenshot": clip["screenshots"] if clip else [],
             "device_identifier": DEVICE_NAME,
             "timestamp": int(time.time() * 1000),
             "model_version": "v1.0",
             "confidence_score": 0.85,
-            "additional_data": {
-                "test": True,
-                "source": "raspberry_pi",
-                "sent_at": datetime.now().isoformat()
-            }
+            "additional_data": additional_data
         }
     }
     
@@ -111,7 +119,7 @@ def main():
     ]
     
     for risk_level, description in alerts:
-        send_alert(risk_level, description)
+        send_alert(risk_level, description, clip=capture_clip())
         print()
         time.sleep(2)  # Wait 2 seconds between alerts
     
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+🗂️ Recording Segment Index
+Compact memory-mapped time index of recorded segments: one fixed-size
+record per segment, so "what was recorded around T" is a binary search
+over the mapped file instead of a scan of the recordings directory, and
+any process can answer it by mapping the same file
+"""
+
+import mmap
+import os
+import struct
+
+INDEX_MAGIC = b'SEGIDX2\0'
+INDEX_CAPACITY = 65536   # Segments kept in the index; about a week of 10 s segments
+HEADER = struct.Struct('<8sQQQQ')  # magic, capacity, first kept segment, next segment, first segment in time order
+RECORD = struct.Struct('<ddQQ')    # start, end (wall-clock seconds), segment number, bytes
+
+class SegmentIndex:
+    """Ring of segment records in a memory-mapped file
+
+    Segment numbers only grow; segment ``n`` lives in slot ``n % capacity``
+    and the header holds the oldest kept and the next segment number. The
+    writer fills a record before advancing ``next`` and advances ``first``
+    before deleting a segment's file, so a reader in another process never
+    sees a record that is half written, only (rarely) one whose file was
+    just removed.
+
+    Times are wall-clock, which can step backwards (a Pi without an RTC
+    boots with a stale clock until NTP corrects it). The header also holds
+    ``ordered``, the segment from which times are known to increase: it
+    moves to any segment that starts before the previous one ended.
+    between() binary-searches from there and scans the older records.
+    """
+    def __init__(self, path, capacity=INDEX_CAPACITY, writable=False):
+        self.path = path
+        self.writable = writable
+        if writable and not os.path.exists(path):
+            with open(path, 'wb') as index_file:
+                index_file.write(HEADER.pack(INDEX_MAGIC, capacity, 0, 0, 0))
+                index_file.truncate(HEADER.size + capacity * RECORD.size)
+        self._file = open(path, 'r+b' if writable else 'rb')
+        self._map = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        )
+        magic, self.capacity, _, _, _ = HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"Not a segment index: {path}")
+
+    @property
+    def first(self):
+        return HEADER.unpack_from(self._map, 0)[2]
+
+    @property
+    def next(self):
+        return HEADER.unpack_from(self._map, 0)[3]
+
+    def __len__(self):
+        _, _, first, next_segment, _ = HEADER.unpack_from(self._map, 0)
+        return next_segment - first
+
+    def record(self, segment):
+        """(start, end, segment, bytes) of a segment number"""
+        return RECORD.unpack_from(self._map, HEADER.size + segment % self.capacity * RECORD.size)
+
+    def _set_header(self, first, next_segment, ordered):
+        HEADER.pack_into(self._map, 0, INDEX_MAGIC, self.capacity, first, next_segment, ordered)
+
+    def append(self, start, end, size):
+        """Add the next segment's record; returns its number (writer only)"""
+        _, _, first, segment, ordered = HEADER.unpack_from(self._map, 0)
+        # The clock went back: only segments written since can be binary-searched
+        if end < start:
+            ordered = segment + 1
+        elif segment > first and start < self.record(segment - 1)[1]:
+            ordered = segment
+        if segment - first >= self.capacity:
+            first += 1  # Full: the oldest record is overwritten
+            self._set_header(first, segment, ordered)
+        RECORD.pack_into(self._map, HEADER.size + segment % self.capacity * RECORD.size,
+                         start, end, segment, size)
+        self._set_header(first, segment + 1, ordered)
+        return segment
+
+    def drop_oldest(self):
+        """Forget the oldest segment and return its record (writer only)"""
+        _, _, first, next_segment, ordered = HEADER.unpack_from(self._map, 0)
+        if first >= next_segment:
+            return None
+        record = self.record(first)
+        self._set_header(first + 1, next_segment, ordered)
+        return record
+
+    def between(self, start, end):
+        """Records of the segments that overlap [start, end], oldest first"""
+        _, _, first, next_segment, ordered = HEADER.unpack_from(self._map, 0)
+        ordered = min(max(first, ordered), next_segment)
+        # Written before the clock last went back: no order to rely on
+        records = [
+            record for record in map(self.record, range(first, ordered))
+            if record[1] > start and record[0] <= end
+        ]
+        # First segment that ends after ``start``; from ``ordered`` on, ends grow with segment numbers
+        low, high = ordered, next_segment
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[1] <= start:
+                low = middle + 1
+            else:
+                high = middle
+        for segment in range(low, next_segment):
+            record = self.record(segment)
+            if record[0] > end:
+                break
+            records.append(record)
+        return records
+
+    def total_bytes(self):
+        return sum(self.record(segment)[3] for segment in range(self.first, self.next))
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,14 @@
+"""
+Shared setup for the unit tests: the modules under test live at the top of
+the repository, and webrtc_server configures its cameras at import time, so
+a synthetic camera is set up before anything imports it.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('WEBRTC_CAMERAS', 'test=synthetic')
+os.environ.setdefault('WEBRTC_STUN_SERVERS', 'none')
+os.environ.setdefault('WEBRTC_PREWARM_PEERS', '0')
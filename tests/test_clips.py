@@ -0,0 +1,28 @@
+import time
+
+import webrtc_server
+from webrtc_server import Clip
+
+def make_clip():
+    return Clip('test', time.monotonic(), 5.0, 3.0)
+
+def test_clip_links_use_absolute_public_url(monkeypatch):
+    monkeypatch.setattr(webrtc_server, 'PUBLIC_URL', 'https://cam.example.net/')
+    monkeypatch.setattr(webrtc_server, '_public_url', None)
+    clip = make_clip()
+    info = clip.to_json()
+    assert info['url'] == f"https://cam.example.net/clips/{clip.id}"
+    assert info['screenshots'] == [f"https://cam.example.net/clips/{clip.id}/event.jpg"]
+
+def test_clip_without_absolute_base_has_no_screenshots(monkeypatch):
+    monkeypatch.setattr(webrtc_server, '_public_url', '')
+    clip = make_clip()
+    info = clip.to_json()
+    assert info['url'] == f"/clips/{clip.id}"
+    assert info['screenshots'] == []
+
+def test_relative_public_url_falls_back_to_lan_address(monkeypatch):
+    monkeypatch.setattr(webrtc_server, 'PUBLIC_URL', '/camera')
+    monkeypatch.setattr(webrtc_server, '_public_url', None)
+    base = webrtc_server.public_url()
+    assert base is None or (base.startswith('http://') and base.endswith(f":{webrtc_server.SERVER_PORT}"))
@@ -0,0 +1,65 @@
+from webrtc_server import (BUDGET_HEADROOM, BUDGET_UP_INTERVALS, CPU_BUDGET, ENCODE_BUDGET, ENCODER_PROFILES,
+                           EncoderBudget)
+
+def check(budget, cpu, encode_load=0.0, busiest='test/shared'):
+    budget.cpu, budget.encode_load, budget.busiest = cpu, encode_load, busiest
+    budget.evaluate()
+    return budget.profile['name']
+
+def test_no_step_before_the_first_measurement():
+    budget = EncoderBudget(auto=False)
+    budget.evaluate()
+    assert budget.profile is ENCODER_PROFILES[0]
+    assert budget.changes == {'down': 0, 'up': 0}
+
+def test_steps_down_at_once_when_over_budget():
+    budget = EncoderBudget(auto=False)
+    assert check(budget, CPU_BUDGET + 0.1) == ENCODER_PROFILES[1]['name']
+    assert check(budget, 0.1, ENCODE_BUDGET + 0.1) == ENCODER_PROFILES[2]['name']
+    # Already on the cheapest profile
+    assert check(budget, CPU_BUDGET + 0.1) == ENCODER_PROFILES[2]['name']
+    assert budget.changes == {'down': 2, 'up': 0}
+    assert 'test/shared' in budget.status()['changes'][-1]['reason']
+
+def test_steps_up_only_after_enough_checks_with_headroom():
+    budget = EncoderBudget(auto=False)
+    check(budget, CPU_BUDGET + 0.1)
+    low = CPU_BUDGET * BUDGET_HEADROOM / 2
+    for _ in range(BUDGET_UP_INTERVALS - 1):
+        assert check(budget, low) == ENCODER_PROFILES[1]['name']
+    assert check(budget, low) == ENCODER_PROFILES[0]['name']
+    # Never above the starting profile
+    for _ in range(BUDGET_UP_INTERVALS):
+        check(budget, low)
+    assert budget.profile is ENCODER_PROFILES[0]
+    assert budget.changes == {'down': 1, 'up': 1}
+
+def test_a_check_without_headroom_restarts_the_count():
+    budget = EncoderBudget(auto=False)
+    check(budget, CPU_BUDGET + 0.1)
+    low = CPU_BUDGET * BUDGET_HEADROOM / 2
+    for _ in range(BUDGET_UP_INTERVALS - 1):
+        check(budget, low)
+    check(budget, CPU_BUDGET * (1 + BUDGET_HEADROOM) / 2)  # Within budget, short of headroom
+    for _ in range(BUDGET_UP_INTERVALS - 1):
+        assert check(budget, low) == ENCODER_PROFILES[1]['name']
+    assert check(budget, low) == ENCODER_PROFILES[0]['name']
+
+def test_starting_profile_is_the_ceiling():
+    budget = EncoderBudget(start=ENCODER_PROFILES[1]['name'], auto=False)
+    for _ in range(BUDGET_UP_INTERVALS):
+        check(budget, 0.0)
+    assert budget.profile is ENCODER_PROFILES[1]
+
+def test_measure_reports_the_busiest_encoder(monkeypatch):
+    budget = EncoderBudget(auto=False)
+    encoders = {'fast': [0.0, 0], 'slow': [0.0, 0]}
+    monkeypatch.setattr(budget, '_encoders_now',
+                        lambda: ((name, name, 20, seconds, frames) for name, (seconds, frames) in encoders.items()))
+    budget.measure()
+    assert (budget.encode_load, budget.busiest) == (0.0, None)
+    encoders['fast'] = [0.1, 10]   # 10 ms a frame at 20 fps
+    encoders['slow'] = [0.4, 10]   # 40 ms a frame at 20 fps
+    budget.measure()
+    assert budget.busiest == 'slow'
+    assert abs(budget.encode_load - 0.8) < 1e-9
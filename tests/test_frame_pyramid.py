@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+
+from webrtc_server import BufferPool, convert_frame
+
+def filled_buffer(pool, seed):
+    buffer = pool.acquire()
+    buffer.image[:] = np.random.default_rng(seed).integers(0, 255, buffer.image.shape, dtype=np.uint8)
+    convert_frame(buffer.image, buffer.yuv)
+    return buffer
+
+def test_each_size_is_scaled_once_and_shared():
+    pool = BufferPool(320, 240)
+    buffer = filled_buffer(pool, 0)
+    first = buffer.pyramid.level(buffer.yuv, 160, 120)
+    assert first.shape == (180, 160)
+    assert buffer.pyramid.level(buffer.yuv, 160, 120) is first
+    assert buffer.pyramid.level(buffer.yuv, 320, 240) is buffer.yuv
+    assert pool.status()['scaled_frames'] == {'160x120': 1}
+
+def test_reused_buffer_is_scaled_again_into_the_same_array():
+    pool = BufferPool(320, 240)
+    buffer = filled_buffer(pool, 0)
+    first = buffer.pyramid.level(buffer.yuv, 160, 120).copy()
+    buffer.release()
+    again = filled_buffer(pool, 1)
+    assert again is buffer
+    second = again.pyramid.level(again.yuv, 160, 120)
+    assert not np.array_equal(first, second)
+    assert pool.status()['scaled_frames'] == {'160x120': 2}
+
+def test_counts_stay_exact_under_concurrent_scaling_and_reads():
+    pool = BufferPool(320, 240)
+    buffers = [filled_buffer(pool, seed) for seed in range(4)]
+    sizes = [(160, 120), (80, 60), (240, 180)]
+    rounds = 50
+    done = threading.Event()
+    errors = []
+
+    def scale(buffer):
+        for _ in range(rounds):
+            buffer.pyramid.reset()
+            for width, height in sizes:
+                buffer.pyramid.level(buffer.yuv, width, height)
+
+    def read():
+        while not done.is_set():
+            try:
+                pool.status()
+            except RuntimeError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    workers = [threading.Thread(target=scale, args=(buffer,)) for buffer in buffers]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    done.set()
+    reader.join()
+    assert not errors
+    counts = pool.status()['scaled_frames']
+    assert counts == {f'{width}x{height}': len(buffers) * rounds for width, height in sizes}
@@ -0,0 +1,76 @@
+import multiprocessing
+import uuid
+
+import numpy as np
+import pytest
+
+import frame_ring
+from frame_ring import FrameRing
+
+WIDTH, HEIGHT = 64, 48
+
+@pytest.fixture
+def rings():
+    name = f'test-ring-{uuid.uuid4().hex[:8]}'
+    lock = multiprocessing.Lock()
+    writer = FrameRing(name, WIDTH, HEIGHT, lock, create=True)
+    reader = FrameRing(name, WIDTH, HEIGHT, lock)
+    yield writer, reader
+    reader.close()
+    writer.close()
+    writer.unlink()
+
+def frame(value):
+    image = np.full((HEIGHT, WIDTH, 3), value, dtype=np.uint8)
+    yuv = np.full((HEIGHT * 3 // 2, WIDTH), value, dtype=np.uint8)
+    return image, yuv
+
+def outputs():
+    return np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8), np.empty((HEIGHT * 3 // 2, WIDTH), dtype=np.uint8)
+
+def test_reader_gets_the_newest_frame(rings):
+    writer, reader = rings
+    for value in (10, 20, 30):
+        writer.write(*frame(value), timestamp=100.0 + value, read_started=99.0 + value)
+    image, yuv = outputs()
+    assert reader.read(0, image, yuv, timeout=0.1) == (3, 130.0, 129.0)
+    assert (image == 30).all() and (yuv == 30).all()
+    assert reader.latest_seq == 3
+
+def test_read_times_out_without_a_newer_frame(rings):
+    writer, reader = rings
+    writer.write(*frame(1), timestamp=1.0)
+    image, yuv = outputs()
+    assert reader.read(1, image, yuv, timeout=0.02) is None
+
+def test_yuv_only_read(rings):
+    writer, reader = rings
+    writer.write(*frame(7), timestamp=1.0)
+    _, yuv = outputs()
+    assert reader.read(0, None, yuv, timeout=0.1)[0] == 1
+    assert (yuv == 7).all()
+
+def test_slot_reused_mid_read_is_reported_torn(rings, monkeypatch):
+    writer, reader = rings
+    writer.write(*frame(1), timestamp=1.0)
+    image, yuv = outputs()
+    real_copyto = np.copyto
+    state = {'lapped': False}
+
+    def copyto_while_writer_laps(destination, source):
+        real_copyto(destination, source)
+        if destination is image and not state['lapped']:
+            # The writer goes all the way round the ring while the reader is copying
+            state['lapped'] = True
+            for value in range(2, 2 + writer.slots):
+                writer.write(*frame(value), timestamp=float(value))
+
+    monkeypatch.setattr(frame_ring.np, 'copyto', copyto_while_writer_laps)
+    assert reader.read(0, image, yuv, timeout=0.1) is None
+    assert state['lapped']
+    assert reader.torn_reads == 1
+
+def test_camera_status_is_shared(rings):
+    writer, reader = rings
+    writer.set_camera_status('reconnecting', 3)
+    assert reader.camera_status() == {'state': 'reconnecting', 'reconnects': 3, 'ring': writer.name}
@@ -0,0 +1,32 @@
+from webrtc_server import QUALITY_LADDER, quality_ladder
+
+def test_16x9_capture_keeps_the_standard_ladder():
+    ladder = quality_ladder(1280, 720, 30)
+    assert [rung['name'] for rung in ladder] == ['720p30', '540p30', '360p20', '240p15']
+    assert [rung['bitrate'] for rung in ladder] == [step['bitrate'] for step in QUALITY_LADDER]
+    assert ladder[-1]['width'] == 426
+
+def test_rungs_follow_the_capture_aspect_ratio():
+    for rung in quality_ladder(640, 480, 30):
+        assert rung['width'] * 3 == rung['height'] * 4
+        assert rung['width'] % 2 == 0 and rung['height'] % 2 == 0
+
+def test_top_rung_is_the_capture_at_full_frame_rate():
+    ladder = quality_ladder(640, 360, 30)
+    assert (ladder[0]['width'], ladder[0]['height'], ladder[0]['fps']) == (640, 360, 30)
+    assert [rung['name'] for rung in ladder] == ['360p30', '240p15']
+
+def test_rung_frame_rates_never_exceed_the_capture():
+    ladder = quality_ladder(1280, 720, 10)
+    assert all(rung['fps'] <= 10 for rung in ladder)
+    assert [rung['height'] for rung in ladder] == [720, 540, 360, 240]
+
+def test_names_are_unique_per_size():
+    sizes = {}
+    for width, height in ((1280, 720), (640, 480), (1920, 1080), (320, 240)):
+        for rung in quality_ladder(width, height, 30):
+            assert sizes.setdefault(rung['name'], (rung['width'], rung['height'])) == (rung['width'], rung['height'])
+
+def test_bitrate_scales_with_pixel_rate():
+    full, half_rate = quality_ladder(1280, 720, 30)[0], quality_ladder(1280, 720, 15)[0]
+    assert half_rate['bitrate'] * 2 == full['bitrate']
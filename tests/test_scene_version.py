@@ -0,0 +1,33 @@
+import time
+
+import numpy as np
+
+from webrtc_server import CapturedFrame, SceneVersion
+
+def frame(seq, image):
+    return CapturedFrame(seq, time.monotonic(), image, None)
+
+def scene(seed=0):
+    return np.random.default_rng(seed).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+
+def test_static_scene_keeps_its_version_despite_sensor_noise():
+    versions = SceneVersion()
+    base = scene()
+    noise = np.random.default_rng(1)
+    seen = set()
+    for seq in range(1, 30):
+        jitter = noise.integers(-2, 3, base.shape)
+        seen.add(versions.update(frame(seq, np.clip(base + jitter, 0, 255).astype(np.uint8))))
+    assert seen == {1}
+
+def test_visible_change_moves_to_a_new_version():
+    versions = SceneVersion()
+    assert versions.update(frame(1, scene(0))) == 1
+    assert versions.update(frame(2, scene(5))) == 2
+    # Back to the first picture is still a change from the current one
+    assert versions.update(frame(3, scene(0))) == 3
+
+def test_same_frame_is_not_measured_twice():
+    versions = SceneVersion()
+    captured = frame(7, scene())
+    assert versions.update(captured) == versions.update(captured) == 1
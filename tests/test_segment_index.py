@@ -0,0 +1,72 @@
+import pytest
+
+from segment_index import SegmentIndex
+
+@pytest.fixture
+def index(tmp_path):
+    index = SegmentIndex(str(tmp_path / 'index.bin'), capacity=8, writable=True)
+    yield index
+    index.close()
+
+def fill(index, starts, length=10.0, size=100):
+    for start in starts:
+        index.append(start, start + length, size)
+
+def segments(records):
+    return [record[2] for record in records]
+
+def test_between_returns_overlapping_segments_oldest_first(index):
+    fill(index, [0, 10, 20, 30, 40])
+    assert segments(index.between(15, 25)) == [1, 2]
+    assert segments(index.between(10, 10)) == [1]
+    assert segments(index.between(-5, 100)) == [0, 1, 2, 3, 4]
+    assert index.between(50, 60) == []
+
+def test_ring_wraps_and_forgets_the_oldest(index):
+    fill(index, [10 * n for n in range(12)])
+    assert len(index) == 8
+    assert (index.first, index.next) == (4, 12)
+    assert segments(index.between(0, 1000)) == list(range(4, 12))
+    assert index.record(11)[:3] == (110.0, 120.0, 11)
+    assert index.total_bytes() == 800
+
+def test_drop_oldest(index):
+    fill(index, [0, 10, 20])
+    assert index.drop_oldest()[2] == 0
+    assert segments(index.between(0, 100)) == [1, 2]
+    index.drop_oldest()
+    index.drop_oldest()
+    assert index.drop_oldest() is None
+    assert len(index) == 0
+
+def test_clock_stepping_back_does_not_hide_segments(index):
+    # Recorded with a stale clock, then NTP moves it back by an hour
+    fill(index, [3600, 3610, 3620])
+    fill(index, [0, 10, 20])
+    assert segments(index.between(3605, 3615)) == [0, 1]
+    assert segments(index.between(5, 15)) == [3, 4]
+    assert segments(index.between(0, 4000)) == list(range(6))
+
+def test_clock_step_inside_a_segment(index):
+    fill(index, [0, 10])
+    index.append(20, 5, 100)  # Started at 20, ended after a step back
+    fill(index, [6, 16])
+    assert segments(index.between(17, 19)) == [1, 4]
+    assert segments(index.between(7, 8)) == [0, 3]
+
+def test_reader_sees_the_writer(index, tmp_path):
+    fill(index, [0, 10])
+    index.flush()
+    reader = SegmentIndex(str(tmp_path / 'index.bin'))
+    try:
+        assert segments(reader.between(0, 100)) == [0, 1]
+        index.append(20, 30, 100)
+        assert segments(reader.between(25, 26)) == [2]
+    finally:
+        reader.close()
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not-an-index.bin'
+    path.write_bytes(b'\0' * 4096)
+    with pytest.raises(ValueError):
+        SegmentIndex(str(path))
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import webrtc_server
+from webrtc_server import LatencyProbe
+
+class FakeTrack:
+    def __init__(self):
+        self.frame_stamps = OrderedDict()
+
+def test_probe_skips_a_sender_without_the_internals(monkeypatch, caplog):
+    monkeypatch.setattr(webrtc_server, 'missing_sender_internals', set())
+    feed = webrtc_server.get_camera()
+    sender = SimpleNamespace()
+    with caplog.at_level(logging.WARNING):
+        LatencyProbe(feed).watch(sender, FakeTrack())
+        LatencyProbe(feed).watch(sender, FakeTrack())
+    assert not hasattr(sender, '_next_encoded_frame')
+    assert sum('latency probe disabled' in record.message for record in caplog.records) == 1
+
+def test_probe_learns_the_rtp_origin_from_the_sender():
+    feed = webrtc_server.get_camera()
+    sent = []
+
+    async def next_encoded_frame(codec):
+        return SimpleNamespace(timestamp=len(sent) * 3000)
+
+    sender = SimpleNamespace(_next_encoded_frame=next_encoded_frame, _RTCRtpSender__rtp_timestamp=None)
+    probe = LatencyProbe(feed)
+    probe.watch(sender, FakeTrack())
+
+    async def scenario():
+        for _ in range(3):
+            encoded = await sender._next_encoded_frame(None)
+            sent.append(encoded)
+            sender._RTCRtpSender__rtp_timestamp = 1000 + encoded.timestamp
+
+    asyncio.run(scenario())
+    assert probe._origin == 1000
@@ -0,0 +1,97 @@
+import pytest
+
+import dhttemp
+from dhttemp import MEDIAN_WINDOW, READ_RETRIES, SensorSampler, SimulatedDHT11
+
+class ScriptedDHT11:
+    """Returns (or raises) the readings in ``script`` in order"""
+    name = "scripted"
+    script = []
+
+    def __init__(self):
+        self.readings = iter(self.script)
+
+    def read(self):
+        reading = next(self.readings)
+        if isinstance(reading, Exception):
+            raise reading
+        return reading
+
+    def close(self):
+        pass
+
+class FakeTelemetry:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, values=None, event=None):
+        self.published.append(values)
+
+@pytest.fixture
+def telemetry(monkeypatch):
+    telemetry = FakeTelemetry()
+    monkeypatch.setattr(dhttemp, 'telemetry', telemetry)
+    monkeypatch.setattr(dhttemp, 'RETRY_DELAY', 0)
+    monkeypatch.setitem(dhttemp.SENSOR_DRIVERS, ScriptedDHT11.name, ScriptedDHT11)
+    return telemetry
+
+def sampler(monkeypatch, *script):
+    monkeypatch.setattr(ScriptedDHT11, 'script', list(script))
+    return SensorSampler(ScriptedDHT11.name)
+
+def test_published_value_is_the_median_of_the_window(monkeypatch, telemetry):
+    readings = [(20, 50), (35, 52), (21, 51), (22, 49), (19, 90), (23, 53), (24, 54)]
+    sensor = sampler(monkeypatch, *readings)
+    sensor._sample()
+    assert sensor.snapshot()['temperature'] == 20
+    sensor._sample()
+    sensor._sample()
+    # One spike never moves the median
+    assert (sensor.latest['temperature'], sensor.latest['raw_temperature']) == (21, 21)
+    for _ in range(4):
+        sensor._sample()
+    assert sensor.latest['window'] == MEDIAN_WINDOW
+    assert (sensor.latest['temperature'], sensor.latest['humidity']) == (22, 53)
+    assert sensor.stats['samples'] == len(readings)
+
+def test_out_of_range_readings_are_discarded(monkeypatch, telemetry):
+    sensor = sampler(monkeypatch, (-5, 50), (22, 0), (None, 50), (22, 50))
+    sensor._sample()
+    assert sensor.stats['discarded'] == READ_RETRIES + 1
+    assert sensor.stats['missed_samples'] == 1
+    assert sensor.snapshot() is None
+    sensor._sample()
+    assert (sensor.latest['temperature'], sensor.latest['window']) == (22, 1)
+
+def test_failed_reads_are_retried_within_a_sample(monkeypatch, telemetry):
+    sensor = sampler(monkeypatch, RuntimeError("Checksum did not validate. Try again."), (23, 45))
+    sensor._sample()
+    assert sensor.stats == {'samples': 1, 'reads': 2, 'failed_reads': 1, 'discarded': 0, 'missed_samples': 0}
+    assert sensor.last_error == "Checksum did not validate. Try again."
+    assert sensor.latest['temperature'] == 23
+
+def test_only_changed_values_are_published(monkeypatch, telemetry):
+    sensor = sampler(monkeypatch, (22, 50), (22, 50), (26, 50), (26, 50))
+    for _ in range(4):
+        sensor._sample()
+    assert telemetry.published == [{'temperature': 22, 'humidity': 50}, {'temperature': 24, 'humidity': 50}]
+
+def test_snapshot_reports_its_age(monkeypatch, telemetry):
+    sensor = sampler(monkeypatch, (22, 50))
+    sensor._sample()
+    monkeypatch.setattr(dhttemp.time, 'time', lambda: sensor.latest['sampled_at'] + 12.34)
+    snapshot = sensor.snapshot()
+    assert snapshot['age'] == 12.3
+    assert 'age' not in sensor.latest
+
+def test_simulated_sensor_stays_in_range(telemetry):
+    sensor = SensorSampler(SimulatedDHT11.name)
+    sensor.driver = SimulatedDHT11(seed=1)
+    for _ in range(200):
+        sensor._sample()
+    assert sensor.stats['samples'] + sensor.stats['missed_samples'] == 200
+    assert 15 <= sensor.latest['temperature'] <= 30
+
+def test_unknown_driver_is_rejected():
+    with pytest.raises(ValueError):
+        SensorSampler("missing")
@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+import webrtc_server
+from webrtc_server import Session, SessionLimitError, SessionRegistry, SignalingChannel
+
+class FakePeer:
+    def __init__(self, state='new'):
+        self.connectionState = state
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+        self.connectionState = 'closed'
+
+def make_session(device_id, camera_id='test', state='new'):
+    return Session(device_id, FakePeer(state), SignalingChannel(), camera_id)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+@pytest.fixture
+def feed(monkeypatch):
+    """A fresh default camera, so no test inherits another's stopped pipeline"""
+    feed = webrtc_server.CameraFeed(webrtc_server.DEFAULT_CAMERA, 'synthetic', 320, 240, 15)
+    monkeypatch.setitem(webrtc_server.cameras, feed.id, feed)
+    return feed
+
+def test_add_and_lookup():
+    registry = SessionRegistry(max_sessions=4)
+    session = make_session('phone')
+    run(registry.add(session))
+    assert len(registry) == 1
+    assert registry.lookup(session.id) is session
+    assert registry.lookup(device_id='phone', camera_id='test') is session
+    assert registry.lookup(device_id='phone', camera_id='other') is None
+
+def test_new_offer_replaces_same_device_and_camera():
+    registry = SessionRegistry(max_sessions=4)
+    first, second, other_camera = make_session('phone'), make_session('phone'), make_session('phone', 'other')
+
+    async def scenario():
+        await registry.add(first)
+        await registry.add(other_camera)
+        await registry.add(second)
+
+    run(scenario())
+    assert first.pc.closed and not second.pc.closed and not other_camera.pc.closed
+    assert registry.lookup(device_id='phone', camera_id='test') is second
+    assert len(registry) == 2
+    assert registry.evictions['replaced'] == 1
+
+def test_capacity_evicts_least_recently_active_unconnected():
+    registry = SessionRegistry(max_sessions=2)
+    connected, idle, newcomer = make_session('a', state='connected'), make_session('b'), make_session('c')
+
+    async def scenario():
+        await registry.add(connected)
+        await registry.add(idle)
+        await registry.add(newcomer)
+
+    run(scenario())
+    assert idle.pc.closed and not connected.pc.closed
+    assert set(registry.sessions) == {connected.id, newcomer.id}
+    assert registry.evictions['capacity'] == 1
+
+def test_capacity_full_of_connected_sessions_rejects():
+    registry = SessionRegistry(max_sessions=1)
+    run(registry.add(make_session('a', state='connected')))
+    with pytest.raises(SessionLimitError):
+        run(registry.add(make_session('b')))
+    assert len(registry) == 1
+
+def test_sweep_expires_only_idle_unconnected():
+    registry = SessionRegistry(max_sessions=4, idle_ttl=10)
+    stale, fresh, connected = make_session('a'), make_session('b'), make_session('c', state='connected')
+    stale.last_activity -= 60
+    connected.last_activity -= 60
+
+    async def scenario():
+        for session in (stale, fresh, connected):
+            await registry.add(session)
+        await registry.sweep()
+
+    run(scenario())
+    assert set(registry.sessions) == {fresh.id, connected.id}
+    assert registry.evictions['expired'] == 1
+
+def test_remove_keeps_newer_session_for_device():
+    registry = SessionRegistry(max_sessions=4)
+    old, new = make_session('phone'), make_session('phone')
+
+    async def scenario():
+        await registry.add(old)
+        await registry.add(new)
+
+    run(scenario())
+    assert registry.remove(old) is False
+    assert registry.lookup(device_id='phone', camera_id='test') is new
+
+def test_failed_offer_releases_session_and_viewer(monkeypatch, feed):
+    registry = SessionRegistry(max_sessions=4)
+    monkeypatch.setattr(webrtc_server, 'sessions', registry)
+
+    async def scenario():
+        with pytest.raises(Exception):
+            await webrtc_server.negotiate('phone', {'sdp': 'v=0 not an offer'})
+        try:
+            assert len(registry) == 0
+            assert registry.evictions['failed'] == 1
+            assert feed.viewers == 0
+        finally:
+            await feed.stop()
+
+    run(scenario())
+
+def test_failed_connection_closes_the_peer(monkeypatch, feed):
+    from aiortc import RTCPeerConnection
+
+    registry = SessionRegistry(max_sessions=4)
+    monkeypatch.setattr(webrtc_server, 'sessions', registry)
+
+    async def scenario():
+        client = RTCPeerConnection()
+        client.addTransceiver('video', direction='recvonly')
+        await client.setLocalDescription(await client.createOffer())
+        try:
+            await webrtc_server.negotiate('phone', {'sdp': client.localDescription.sdp})
+            session = registry.lookup(device_id='phone', camera_id=feed.id)
+            closed = []
+            close = session.pc.close
+
+            async def recording_close():
+                closed.append(True)
+                await close()
+
+            session.pc.close = recording_close
+            # What aiortc reports when ICE or DTLS gives up; the handler runs
+            # straight away so ICE checks cannot move the state on first
+            session.pc._RTCPeerConnection__connectionState = 'failed'
+            for handler in session.pc.listeners('connectionstatechange'):
+                await handler()
+            assert closed
+            assert len(registry) == 0
+            assert registry.evictions['failed'] == 1
+            assert feed.viewers == 0
+        finally:
+            await client.close()
+            await feed.stop()
+
+    run(scenario())
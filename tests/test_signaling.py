@@ -0,0 +1,56 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import webrtc_server
+from webrtc_server import Session, SessionRegistry, SignalingChannel
+
+ANSWER = {'type': 'answer', 'sdp': 'v=0', 'sessionId': 'abc'}
+
+class FakePeer:
+    connectionState = 'new'
+
+    async def close(self):
+        pass
+
+def poll_request(session, wait):
+    return SimpleNamespace(query={'sessionId': session.id, 'wait': str(wait)})
+
+def registered_session(monkeypatch):
+    registry = SessionRegistry(max_sessions=4)
+    monkeypatch.setattr(webrtc_server, 'sessions', registry)
+    session = Session('phone', FakePeer(), SignalingChannel(), 'test')
+    registry.sessions[session.id] = session
+    return session
+
+def test_poll_after_the_answer_was_delivered_does_not_block(monkeypatch):
+    session = registered_session(monkeypatch)
+
+    async def scenario():
+        await session.channel.set_answer(ANSWER)
+        first = await webrtc_server.handle_poll(poll_request(session, 30))
+        started = time.monotonic()
+        second = await asyncio.wait_for(webrtc_server.handle_poll(poll_request(session, 30)), 1)
+        return first, second, time.monotonic() - started
+
+    first, second, elapsed = asyncio.run(scenario())
+    assert json.loads(first.text) == json.loads(second.text) == ANSWER
+    assert elapsed < 0.5
+
+def test_poll_during_negotiation_waits_for_the_answer(monkeypatch):
+    session = registered_session(monkeypatch)
+
+    async def scenario():
+        poll = asyncio.ensure_future(webrtc_server.handle_poll(poll_request(session, 30)))
+        await asyncio.sleep(0.05)
+        assert not poll.done()
+        await session.channel.set_answer(ANSWER)
+        return await asyncio.wait_for(poll, 1)
+
+    assert json.loads(asyncio.run(scenario()).text) == ANSWER
+
+def test_poll_without_an_answer_times_out_empty(monkeypatch):
+    session = registered_session(monkeypatch)
+    response = asyncio.run(webrtc_server.handle_poll(poll_request(session, 0.05)))
+    assert json.loads(response.text) == {}
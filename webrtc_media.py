@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+🎞️ WebRTC Media
+Video tracks and shared H.264 encoders fed from webrtc_server's frame bus.
+Imported on first use so the server can answer HTTP before aiortc, av and
+the codec libraries have loaded.
+"""
+
+import asyncio
+import fractions
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+import numpy as np
+from aiortc import MediaStreamTrack, RTCRtpSender
+from aiortc.mediastreams import MediaStreamError
+from av import VideoFrame
+
+from webrtc_server import (
+    CAPTURE_FPS, CAPTURE_THREADS, ENCODER_PROFILES, FAST_JOIN, FRAME_TIMEOUT, LATE_FRAME_THRESHOLD, RELAY_BITRATE,
+    RELAY_GOP_CACHE, RELAY_QUEUE_SIZE, Histogram, fallback_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+# Output intervals kept per track for fps/jitter measurement
+PACER_WINDOW = 90
+# Frames a track remembers capture stamps for until the RTP sender takes them
+FRAME_STAMPS_KEPT = 32
+
+VIDEO_TIME_BASE = fractions.Fraction(1, 90000)
+
+# Scales and copies frames for per-peer tracks, keeping that pixel work off the event loop
+track_executor = ThreadPoolExecutor(max_workers=CAPTURE_THREADS, thread_name_prefix='track')
+
+def copy_into_frame(video_frame, yuv):
+    """Copy an I420 array into an existing VideoFrame's planes, honouring line padding"""
+    width, height = video_frame.width, video_frame.height
+    flat = yuv.reshape(-1)
+    offset = 0
+    for plane, (plane_width, plane_height) in zip(
+        video_frame.planes, ((width, height), (width // 2, height // 2), (width // 2, height // 2))
+    ):
+        size = plane_width * plane_height
+        view = np.frombuffer(plane, dtype=np.uint8).reshape(plane.height, plane.line_size)
+        np.copyto(view[:, :plane_width], flat[offset:offset + size].reshape(plane_height, plane_width))
+        offset += size
+
+def remember_stamps(frame_stamps, pts, stamps):
+    """Keep a sent frame's capture stamps by pts, for the session's LatencyProbe"""
+    frame_stamps[pts] = stamps
+    while len(frame_stamps) > FRAME_STAMPS_KEPT:
+        frame_stamps.popitem(last=False)
+
+def reusable_frame(video_frame, width, height):
+    """Return ``video_frame`` if it already has this size, otherwise a new yuv420p frame"""
+    if video_frame is None or (video_frame.width, video_frame.height) != (width, height):
+        video_frame = VideoFrame(width=width, height=height, format='yuv420p')
+    return video_frame
+
+class FramePacer:
+    """Paces a track's output from capture timestamps and measures what it delivers
+
+    Frames are admitted on the capture clock rather than a fixed sleep: each
+    output slot is due one interval after the previous one and is filled by
+    the first frame captured around that time, and frames already older than
+    LATE_FRAME_THRESHOLD are dropped. pts values are derived from capture time,
+    so time spent reading, converting or encoding never accumulates as drift.
+    """
+    def __init__(self, fps):
+        self.fps = fps
+        self.sent_frames = 0
+        self.late_frames = 0
+        self._start = None
+        self._next_due = None
+        self._last_pts = -1
+        self._last_output = None
+        self._intervals = deque(maxlen=PACER_WINDOW)
+
+    def admit(self, timestamp):
+        """Whether a frame captured at ``timestamp`` should be sent"""
+        if time.monotonic() - timestamp > LATE_FRAME_THRESHOLD:
+            self.late_frames += 1
+            return False
+        interval = 1 / self.fps
+        if self._next_due is not None:
+            # A quarter interval of tolerance keeps e.g. 20fps from a 30fps camera at 20, not 15
+            if timestamp < self._next_due - interval / 4:
+                return False
+            if timestamp - self._next_due < interval:
+                self._next_due += interval
+                return True
+        # First frame, or far behind schedule: restart the schedule here
+        self._next_due = timestamp + interval
+        return True
+
+    def pts(self, timestamp):
+        """90 kHz presentation timestamp for a frame captured at ``timestamp``"""
+        if self._start is None:
+            self._start = timestamp
+        pts = max(int((timestamp - self._start) * 90000), self._last_pts + 1)
+        self._last_pts = pts
+        return pts
+
+    def record_output(self):
+        now = time.monotonic()
+        if self._last_output is not None:
+            self._intervals.append(now - self._last_output)
+        self._last_output = now
+        self.sent_frames += 1
+
+    def stats(self):
+        """Measured output fps and jitter (mean deviation of frame intervals)"""
+        if not self._intervals:
+            return {'output_fps': 0.0, 'jitter_ms': 0.0, 'late_frames': self.late_frames}
+        mean = sum(self._intervals) / len(self._intervals)
+        jitter = sum(abs(interval - mean) for interval in self._intervals) / len(self._intervals)
+        return {
+            'output_fps': round(1 / mean, 1) if mean else 0.0,
+            'jitter_ms': round(jitter * 1000, 1),
+            'late_frames': self.late_frames,
+        }
+
+class LocalVideoTrack(MediaStreamTrack):
+    """A video track that returns frames from a camera's frame bus"""
+    kind = 'video'
+
+    def __init__(self, feed, rung):
+        super().__init__()
+        self.feed = feed
+        self.subscription = feed.bus.subscribe()
+        feed.add_viewer()
+        self.rung = rung
+        self.pacer = FramePacer(rung['fps'])
+        self.frame_stamps = OrderedDict()
+        # Refilled for every frame: aiortc encodes each frame before asking for the next
+        self._frame = None
+
+    def set_rung(self, rung):
+        self.rung = rung
+        self.pacer.fps = rung['fps']
+
+    def stop(self):
+        if self.readyState == 'live':
+            self.feed.remove_viewer()
+        super().stop()
+
+    def _fill(self, captured, rung):
+        """Copy the frame at ``rung``'s size into the reused VideoFrame (on track_executor)"""
+        # Peers on the same rung share one scaled copy of the frame
+        yuv = captured.scaled(rung['width'], rung['height'])
+        video_frame = reusable_frame(self._frame, yuv.shape[1], yuv.shape[0] * 2 // 3)
+        copy_into_frame(video_frame, yuv)
+        return video_frame
+
+    async def recv(self):
+        if self.readyState != 'live':
+            raise MediaStreamError
+        stamps = None
+        while True:
+            captured = await self.subscription.next_frame(timeout=FRAME_TIMEOUT)
+            if captured is None:
+                # Camera is down: hold the last good frame, then the placeholder
+                captured = fallback_frame(self.feed.bus)
+                break
+            if self.pacer.admit(captured.timestamp):
+                stamps = captured.stamps()
+                break
+
+        # No await since next_frame(): the bus still holds this frame's buffer
+        captured.retain()
+        try:
+            video_frame = self._frame = await asyncio.get_running_loop().run_in_executor(
+                track_executor, self._fill, captured, self.rung
+            )
+        finally:
+            captured.release()
+        video_frame.pts = self.pacer.pts(captured.timestamp)
+        video_frame.time_base = VIDEO_TIME_BASE
+        if stamps is not None:
+            remember_stamps(self.frame_stamps, video_frame.pts, stamps)
+        self.pacer.record_output()
+        self.feed.capture_to_send.observe(time.monotonic() - captured.timestamp)
+        if self.pacer.sent_frames == 1:
+            self.emit('first_frame')
+        return video_frame
+
+class SharedEncoder:
+    """One H.264 encoder per camera and resolution, relayed to every subscriber
+
+    Frames are encoded once on a dedicated thread and the resulting packets
+    are fanned out to each RelayVideoTrack, so an extra viewer only costs RTP
+    packetization instead of a whole encoder. The encoder only runs while at
+    least one track is subscribed.
+
+    The frames since the last keyframe are cached (up to RELAY_GOP_CACHE),
+    so a track that joins or resyncs shortly after a keyframe is started
+    from the cache at once; otherwise a keyframe is forced for it.
+
+    Preset, keyframe interval and threads come from an encoder profile (see
+    EncoderBudget); a new profile reopens the codec on the next frame, which
+    starts with a keyframe.
+    """
+    def __init__(self, name, bus, width, height, fps=CAPTURE_FPS, bitrate=RELAY_BITRATE,
+                 profile=ENCODER_PROFILES[0]):
+        self.name = name
+        self.bus = bus
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.bitrate = bitrate
+        self.profile = profile
+        self.subscribers = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='encoder')
+        self.encode_time = Histogram()
+        self.frames_encoded = 0
+        self.bytes_encoded = 0
+        self.gop_replays = 0
+        self._codec = None
+        self._codec_profile = None  # Profile self._codec was opened with
+        self._frame = None  # Reused input frame; only touched on the encoder thread
+        self._force_keyframe = False
+        self._task = None
+        self._gop = []  # [(packets, timestamp, stamps)] since the last keyframe; empty once it outgrows the cache
+
+    def subscribe(self, track):
+        self.subscribers.add(track)
+        self.catch_up(track)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🎞️  Shared encoder started ({self.width}x{self.height})")
+
+    def unsubscribe(self, track):
+        self.subscribers.discard(track)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info(f"🎞️  Shared encoder idle ({self.width}x{self.height})")
+
+    def request_keyframe(self):
+        self._force_keyframe = True
+
+    def set_profile(self, profile):
+        """Encode with ``profile`` from the next frame on"""
+        self.profile = profile
+
+    def catch_up(self, track):
+        """Start ``track`` from the cached GOP if it is still fresh, else force a keyframe"""
+        if FAST_JOIN and self._gop and time.monotonic() - self._gop[0][1] <= LATE_FRAME_THRESHOLD:
+            for packets, timestamp, stamps in self._gop:
+                track.push(packets, timestamp, stamps)
+            self.gop_replays += 1
+            return
+        self.request_keyframe()
+
+    def _cache(self, packets, timestamp, stamps):
+        if any(packet.is_keyframe for packet in packets):
+            self._gop = []
+        elif not self._gop or len(self._gop) >= RELAY_GOP_CACHE:
+            # No keyframe cached to start from, or it is too old to be worth replaying
+            self._gop = []
+            return
+        self._gop.append((packets, timestamp, stamps))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        subscription = self.bus.subscribe()
+        pacer = FramePacer(self.fps)
+        while True:
+            captured = await subscription.next_frame(timeout=FRAME_TIMEOUT)
+            stamps = None
+            if captured is None:
+                # Camera is down: keep viewers fed with the last good frame or placeholder
+                captured = fallback_frame(self.bus)
+            elif not pacer.admit(captured.timestamp):
+                continue
+            else:
+                stamps = captured.stamps()
+            force_keyframe, self._force_keyframe = self._force_keyframe, False
+            started = time.perf_counter()
+            captured.retain()
+            try:
+                packets = await loop.run_in_executor(
+                    self.executor, self._encode, captured, force_keyframe
+                )
+            except Exception as e:
+                logger.error(f"❌ Error encoding frame: {e}")
+                continue
+            finally:
+                captured.release()
+            self.encode_time.observe(time.perf_counter() - started)
+            self.frames_encoded += 1
+            self.bytes_encoded += sum(packet.size for packet in packets)
+            self._cache(packets, captured.timestamp, stamps)
+            for track in list(self.subscribers):
+                track.push(packets, captured.timestamp, stamps)
+
+    def _encode(self, captured, force_keyframe):
+        # Scaled once per frame, shared with per-peer tracks on the same size
+        yuv = captured.scaled(self.width, self.height)
+        frame = self._frame = reusable_frame(self._frame, yuv.shape[1], yuv.shape[0] * 2 // 3)
+        copy_into_frame(frame, yuv)
+        # A shared origin keeps RTP timestamps continuous when a peer switches encoders
+        frame.pts = int((captured.timestamp - self.bus.epoch) * 90000)
+        frame.time_base = VIDEO_TIME_BASE
+        frame.pict_type = (
+            av.video.frame.PictureType.I if force_keyframe
+            else av.video.frame.PictureType.NONE
+        )
+
+        profile = self.profile
+        if self._codec is None or self._codec_profile is not profile:
+            self._codec = av.CodecContext.create('libx264', 'w')
+            self._codec.width = frame.width
+            self._codec.height = frame.height
+            self._codec.bit_rate = self.bitrate
+            self._codec.pix_fmt = 'yuv420p'
+            self._codec.time_base = VIDEO_TIME_BASE
+            self._codec.gop_size = profile['keyframe_interval']
+            self._codec.thread_count = profile['threads']
+            self._codec.options = {
+                'level': '31',
+                'tune': 'zerolatency',
+                'preset': profile['preset'],
+            }
+            self._codec.profile = 'Baseline'
+            self._codec_profile = profile
+
+        packets = self._codec.encode(frame)
+        for packet in packets:
+            packet.time_base = VIDEO_TIME_BASE
+        return packets
+
+class RelayVideoTrack(MediaStreamTrack):
+    """A video track that forwards pre-encoded packets from a SharedEncoder"""
+    kind = 'video'
+
+    def __init__(self, feed, rung):
+        super().__init__()
+        self.feed = feed
+        self.encoder = encoder = feed.shared_encoder(rung)
+        self._packets = asyncio.Queue(maxsize=RELAY_QUEUE_SIZE)
+        self._waiting_for_keyframe = True
+        self.pacer = FramePacer(encoder.fps)
+        self.frame_stamps = OrderedDict()
+        self.resyncs = 0
+        encoder.subscribe(self)
+        feed.add_viewer()
+
+    def set_rung(self, rung):
+        """Move to the shared encoder for another rung, resuming on its next keyframe"""
+        encoder = self.feed.shared_encoder(rung)
+        if encoder is self.encoder:
+            return
+        self.encoder.unsubscribe(self)
+        self.encoder = encoder
+        self.pacer.fps = encoder.fps
+        self._waiting_for_keyframe = True
+        encoder.subscribe(self)
+
+    def _resync(self):
+        """Drop everything queued and resume on the next keyframe"""
+        self.resyncs += 1
+        while not self._packets.empty():
+            self._packets.get_nowait()
+        self._waiting_for_keyframe = True
+        self.encoder.catch_up(self)
+
+    def push(self, packets, timestamp, stamps=None):
+        """Queue packets for this viewer, resyncing on a keyframe if it falls behind"""
+        for packet in packets:
+            if self._waiting_for_keyframe:
+                if not packet.is_keyframe:
+                    continue
+                self._waiting_for_keyframe = False
+            if self._packets.full():
+                # Dropping part of a GOP would corrupt decoding; start over on a keyframe
+                self._resync()
+                return
+            self._packets.put_nowait((packet, timestamp, stamps))
+
+    async def recv(self):
+        if self.readyState != 'live':
+            raise MediaStreamError
+        while True:
+            packet, timestamp, stamps = await self._packets.get()
+            if time.monotonic() - timestamp > LATE_FRAME_THRESHOLD:
+                # Late packets are dropped rather than delivered behind real time
+                self.pacer.late_frames += 1
+                self._resync()
+                continue
+            if stamps is not None:
+                remember_stamps(self.frame_stamps, packet.pts, stamps)
+            self.pacer.record_output()
+            self.feed.capture_to_send.observe(time.monotonic() - timestamp)
+            if self.pacer.sent_frames == 1:
+                self.emit('first_frame')
+            return packet
+
+    def stop(self):
+        if self.readyState == 'live':
+            self.feed.remove_viewer()
+        super().stop()
+        self.encoder.unsubscribe(self)
+
+def prefer_codecs(pc, names):
+    """Restrict video transceivers to the codecs in ``names`` (e.g. ('H264', 'VP8')), in that order"""
+    capabilities = RTCRtpSender.getCapabilities('video').codecs
+    codecs = [codec for name in names for codec in capabilities if codec.mimeType == f'video/{name}']
+    codecs += [codec for codec in capabilities if codec.mimeType == 'video/rtx']
+    for transceiver in pc.getTransceivers():
+        if transceiver.kind == 'video':
+            transceiver.setCodecPreferences(codecs)
+
+def prefer_h264(pc):
+    """Restrict video transceivers to H.264 so relayed packets can be sent as-is"""
+    prefer_codecs(pc, ('H264',))
@@ -5,37 +5,286 @@ Streams video from webcam via WebRTC
 """
 
 import asyncio
+import base64
+import bisect
+import importlib
+import importlib.util
 import json
 import logging
-from aiohttp import web
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate, VideoStreamTrack
-from av import VideoFrame
-import cv2
+import sys
+import time
+import aiohttp
+from aiohttp import WSMsgType, web
+import multiprocessing
+import numpy as np
+import os
+from frame_ring import FrameRing
+import signal
+import socket
 import threading
-from collections import defaultdict
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Store peer connections and signaling data
-pcs = {}
-signaling_data = defaultdict(lambda: {
-    'answer': None,
-    'candidates': []
-})
+# webrtc_media imports from this module; make that resolve to this copy
+# when it runs as a script (__main__, or __mp_main__ in worker processes)
+sys.modules.setdefault('webrtc_server', sys.modules[__name__])
+
+def lazy_import(name):
+    """Import a module on first attribute access, keeping startup fast"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Heavy media modules load on first use: cv2 when a camera opens, aiortc
+# and av with webrtc_media when the first peer connects (or when
+# preload_media() gets to them), so /health answers straight away
+cv2 = lazy_import('cv2')
+
+# Camera settings
+CAPTURE_WIDTH = int(os.environ.get('WEBRTC_CAPTURE_WIDTH', 1280))
+CAPTURE_HEIGHT = int(os.environ.get('WEBRTC_CAPTURE_HEIGHT', 720))
+CAPTURE_FPS = int(os.environ.get('WEBRTC_CAPTURE_FPS', 30))
+
+# Cameras: WEBRTC_CAMERAS="front=0,garage=/dev/video2", or a JSON list of
+# {"id", "device", "width", "height", "fps"} given inline or as a .json file
+# path. The first camera serves offers that do not name a cameraId.
+# The device "synthetic" is a moving test pattern (see SyntheticCapture).
+CAMERAS = os.environ.get('WEBRTC_CAMERAS', '')
+SYNTHETIC_DEVICE = 'synthetic'
+
+# Camera supervision
+CAMERA_FAILURE_THRESHOLD = 5   # Consecutive failed reads before the camera is reopened
+CAMERA_RETRY_INITIAL = 0.5     # First reopen delay (s), doubled after each failed attempt
+CAMERA_RETRY_MAX = 30.0        # Longest delay between reopen attempts (s)
+LAST_FRAME_HOLD = 5.0          # Seconds the last good frame is served before the placeholder
+CAMERA_IDLE_TIMEOUT = float(os.environ.get('WEBRTC_CAMERA_IDLE_TIMEOUT', 60))  # Seconds without viewers before a camera is released; 0 keeps it open
+CAMERA_WAKE_TIMEOUT = 5.0      # Longest a snapshot waits for an idle camera's first frame
+PLACEHOLDER_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'placeholder.png')
+
+# Capture pipeline settings
+CAPTURE_THREADS = int(os.environ.get('WEBRTC_CAPTURE_THREADS', 2))  # Threads for cap.read() / cvtColor
+FRAME_QUEUE_SIZE = int(os.environ.get('WEBRTC_FRAME_QUEUE_SIZE', 2))  # Frames queued before old ones are dropped
+
+# Motion gate: drop to an idle frame rate while the scene is static
+MOTION_GATE = os.environ.get('WEBRTC_MOTION_GATE', '0') == '1'
+MOTION_THRESHOLD = float(os.environ.get('WEBRTC_MOTION_THRESHOLD', 3.0))  # Mean abs. grey-level change
+MOTION_IDLE_FPS = 2.0      # Frame rate published while nothing moves
+MOTION_IDLE_AFTER = 2.0    # Seconds without motion before going idle
+MOTION_DOWNSCALE = 8       # Motion is measured on a 1/8-size grey copy
+
+# MJPEG / snapshot fallback for viewers that cannot use WebRTC
+MJPEG_QUALITY = int(os.environ.get('WEBRTC_MJPEG_QUALITY', 75))
+MJPEG_FPS = 15           # Highest rate a /mjpeg client is sent frames at
+MJPEG_BOUNDARY = 'frame'
+
+# Pre-event clips: recent JPEG frames kept in memory so alerts can carry them
+CLIP_FPS = float(os.environ.get('WEBRTC_CLIP_FPS', 5))  # 0 disables the ring buffer
+CLIP_BUFFER_BYTES = int(os.environ.get('WEBRTC_CLIP_BUFFER_BYTES', 16 * 1024 * 1024))
+CLIP_STORE_BYTES = int(os.environ.get('WEBRTC_CLIP_STORE_BYTES', 64 * 1024 * 1024))
+CLIP_PRE_ROLL = 5.0     # Default seconds kept before the trigger
+CLIP_POST_ROLL = 3.0    # Default seconds recorded after the trigger
+CLIP_MAX_ROLL = 30.0    # Longest pre- or post-roll a client may ask for
+PUBLIC_URL = os.environ.get('WEBRTC_PUBLIC_URL', '')  # Absolute base (http://host:port) for links placed in alerts; the LAN address if unset
+
+# Recording: the shared encoder's output cut into MPEG-TS segments on disk (see recorder.py)
+RECORD = os.environ.get('WEBRTC_RECORD', '0') == '1'
+RECORD_DIR = os.environ.get('WEBRTC_RECORD_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings'))
+RECORD_SEGMENT_SECONDS = float(os.environ.get('WEBRTC_RECORD_SEGMENT_SECONDS', 10))
+RECORD_BUDGET_BYTES = int(os.environ.get('WEBRTC_RECORD_BUDGET_BYTES', 2 * 1024 ** 3))  # Per camera; oldest segments go first
+RECORD_RUNG = os.environ.get('WEBRTC_RECORD_RUNG')  # Quality rung recorded (the camera's best rung if unset)
+RECORD_QUEUE_SIZE = 300   # Packets waiting for the disk before recording skips to the next keyframe
+RECORD_AROUND = 5.0       # Default seconds returned before and after the requested time
+RECORD_MAX_SPAN = 300.0   # Longest stretch one request may ask for (s)
+
+# On-device detection (see ml_inference.py), off unless requested
+ML_INFERENCE = os.environ.get('WEBRTC_ML_INFERENCE', '0') == '1'
+ML_CAMERA = os.environ.get('WEBRTC_ML_CAMERA')  # Camera to run detection on (default camera if unset)
+
+# Relay settings: one shared H.264 encoder per camera/resolution feeds every peer
+RELAY_MODE = os.environ.get('WEBRTC_RELAY_MODE', '1') == '1'
+RELAY_BITRATE = int(os.environ.get('WEBRTC_RELAY_BITRATE', 1500000))  # bits per second
+RELAY_QUEUE_SIZE = 30  # Packets buffered per viewer before it is resynced on a keyframe
+RELAY_GOP_CACHE = 8    # Frames since the last keyframe kept to start a new viewer without waiting for one
+
+# Per-peer quality ladder, best step first; see quality_ladder() for how a
+# camera's rungs are made from it. Bitrates are for 16:9 at that frame rate.
+QUALITY_LADDER = [
+    {'height': 720, 'fps': 30, 'bitrate': 1500000},
+    {'height': 540, 'fps': 30, 'bitrate': 1000000},
+    {'height': 360, 'fps': 20, 'bitrate': 500000},
+    {'height': 240, 'fps': 15, 'bitrate': 250000},
+]
+QUALITY_INTERVAL = 2.0       # Seconds between RTCP stats checks
+QUALITY_LOSS_DOWN = 0.10     # Fraction lost that triggers a step down
+QUALITY_RTT_DOWN = 0.40      # Round-trip time (s) that triggers a step down
+QUALITY_JITTER_DOWN = 0.05   # Receiver jitter (s) that triggers a step down
+QUALITY_LOSS_UP = 0.02       # Loss must stay under this to step up
+QUALITY_RTT_UP = 0.20        # RTT must stay under this to step up
+QUALITY_UP_INTERVALS = 5     # Consecutive healthy checks before stepping up
+
+# Encoder profiles, most expensive first. ``codecs`` orders the codecs offered to
+# per-peer encoders (relayed peers always use H.264), ``preset`` is the x264
+# preset, ``keyframe_interval`` is in frames and ``threads`` caps encoder threads.
+ENCODER_PROFILES = [
+    {'name': 'quality', 'codecs': ('H264', 'VP8'), 'preset': 'veryfast', 'keyframe_interval': 60, 'threads': 2},
+    {'name': 'balanced', 'codecs': ('H264', 'VP8'), 'preset': 'superfast', 'keyframe_interval': 90, 'threads': 2},
+    {'name': 'economy', 'codecs': ('H264', 'VP8'), 'preset': 'ultrafast', 'keyframe_interval': 120, 'threads': 1},
+]
+ENCODER_PROFILE = os.environ.get('WEBRTC_ENCODER_PROFILE', ENCODER_PROFILES[0]['name'])  # Starting profile, and the highest one stepped back up to
+ENCODER_AUTO = os.environ.get('WEBRTC_ENCODER_AUTO', '1') == '1'  # 0 stays on ENCODER_PROFILE
+CPU_BUDGET = float(os.environ.get('WEBRTC_CPU_BUDGET', 0.7))  # Share of all cores this process may use
+ENCODE_BUDGET = 0.8        # Share of each frame interval an encoder may spend encoding
+BUDGET_INTERVAL = 2.0      # Seconds between budget checks
+BUDGET_HEADROOM = 0.6      # Step up only while CPU and encode time stay under this share of their budgets
+BUDGET_UP_INTERVALS = 5    # Consecutive checks with headroom before stepping up
+BUDGET_HISTORY = 20        # Profile changes kept for /health
+
+# Multi-process mode: with WEBRTC_WORKERS > 0 one capture process writes
+# every camera into a shared-memory ring (see frame_ring.py), that many
+# worker processes serve peers from the rings, and this process routes
+# signaling to the least-loaded worker. 0 runs everything in one process.
+WORKERS = int(os.environ.get('WEBRTC_WORKERS', 0))
+WORKER_BASE_PORT = int(os.environ.get('WEBRTC_WORKER_BASE_PORT', 8090))  # Worker i listens on 127.0.0.1:BASE+i
+WORKER_POLL_INTERVAL = 2.0   # Seconds between worker load checks
+WORKER_START_POLL = 0.5      # Poll interval until every worker has answered once
+ROUTE_CACHE_SIZE = 1024      # Session -> worker routes remembered for trickle ICE and polling
+SERVER_PORT = int(os.environ.get('WEBRTC_PORT', 8080))
+
+# Signaling settings
+LONG_POLL_MAX = 30.0  # Longest a GET /signal?wait=... request waits for a pending answer (s)
+WS_HEARTBEAT = 20.0   # WebSocket ping interval (s), keeps tunnels from idling out
+
+# Fast join: pre-gathered peers, a cached GOP for new viewers and a poster image in the answer
+FAST_JOIN = os.environ.get('WEBRTC_FAST_JOIN', '1') == '1'
+PREWARM_PEERS = int(os.environ.get('WEBRTC_PREWARM_PEERS', 2))  # Peer connections kept with candidates gathered
+PREWARM_MAX_AGE = 30.0        # Seconds before an unused pre-gathered peer is replaced
+STUN_SERVERS = os.environ.get('WEBRTC_STUN_SERVERS')  # Comma-separated stun: URLs, "none" for host candidates only; aiortc's default if unset
+POSTER_WIDTH = 480            # Poster JPEG sent with the answer is scaled down to this width
+POSTER_QUALITY = 60
+POSTER_MAX_BYTES = 96 * 1024  # Larger posters are only offered by URL
+
+# Glass-to-glass latency: peers that open a "latency" data channel echo render times (see LatencyProbe)
+LATENCY_CHANNEL = 'latency'
+LATENCY_STAGES = ('capture', 'convert', 'encode', 'network', 'total')
+LATENCY_SAMPLE_INTERVAL = 0.2  # Seconds between frames sent to the client for echoing
+LATENCY_PING_INTERVAL = 2.0    # Seconds between clock-offset pings
+LATENCY_CLOCK_SAMPLES = 8      # Recent pings the clock offset is chosen from
+LATENCY_PENDING = 32           # Frames awaiting an echo, per peer
+LATENCY_WINDOW = 150           # Echoed frames kept per peer for percentiles
+
+# Telemetry: device-agent values pushed to peers over a "telemetry" data channel (see TelemetryHub)
+TELEMETRY_CHANNEL = 'telemetry'
+TELEMETRY_TICK = 0.05        # Shortest interval between telemetry messages; changes in between are merged
+TELEMETRY_MAX_EVENTS = 100   # Events held for one message; older ones are dropped
+
+# Session registry settings
+MAX_SESSIONS = int(os.environ.get('WEBRTC_MAX_SESSIONS', 16))  # Hard cap on concurrent sessions
+SESSION_IDLE_TTL = 120.0      # Seconds a session that is not connected may sit idle
+SESSION_SWEEP_INTERVAL = 15.0  # Seconds between idle-session sweeps
+
+# Metrics settings
+LATENCY_BUCKETS = (0.005, 0.01, 0.02, 0.033, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0)
+JOIN_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0)
+JOIN_WINDOW = 100         # Recent joins kept for the percentiles on /health
+GLASS_BUCKETS = (0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)
+LOOP_LAG_INTERVAL = 0.25  # Seconds between event-loop lag probes
+CAPTURE_FPS_WINDOW = 60   # Frames used to measure capture fps
+
+class Histogram:
+    """Prometheus-style histogram; observe() is O(log buckets), no locking
+
+    Only observe from the event loop thread.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels=None):
+        """Exposition lines for this histogram (without HELP/TYPE)"""
+        labels = labels or {}
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+def percentiles_ms(samples):
+    """p50 / p95 of a window of durations in seconds, in milliseconds, or None if it is empty"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+    return {'p50': round(pick(0.5) * 1000, 1), 'p95': round(pick(0.95) * 1000, 1)}
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+class MetricsWriter:
+    """Accumulates metric families in text exposition format"""
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        """Write a counter or gauge; ``samples`` is a list of (labels, value)"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{format_labels(labels)} {value}")
+
+    def histogram(self, name, help_text, histograms):
+        """Write a histogram family; ``histograms`` is a list of (labels, Histogram)"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in histograms:
+            self.lines.extend(histogram.samples(name, labels))
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+# Process-wide histograms (capture histograms live on each CameraFeed)
+loop_lag = Histogram()
 
 class VideoCapture:
     """Capture video from webcam"""
-    def __init__(self, device_id=0):
+    def __init__(self, device_id=0, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT, fps=CAPTURE_FPS):
         self.cap = cv2.VideoCapture(device_id)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_FPS, fps)
         logger.info(f"📹 Webcam initialized: {device_id}")
 
-    def read_frame(self):
-        ret, frame = self.cap.read()
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read_frame(self, out=None):
+        """Read a frame, into ``out`` when it matches the camera's frame size"""
+        ret, frame = self.cap.read(out)
         if ret:
             return frame
         return None
@@ -43,48 +292,2095 @@ class VideoCapture:
     def close(self):
         self.cap.release()
 
-# Global video capture
-video_capture = VideoCapture(0)
+class SyntheticCapture:
+    """Moving test pattern that stands in for a webcam (device "synthetic")
 
-async def send_video_frames(pc, device_id):
-    """Send video frames from webcam to peer"""
-    logger.info(f"🎬 Starting video stream for device: {device_id}")
-    
-    # Get video sender
-    video_sender = None
-    for sender in pc.getSenders():
-        if sender.track and sender.track.kind == 'video':
-            video_sender = sender
-            break
-    
-    if not video_sender:
-        logger.warning(f"⚠️  No video sender found for {device_id}")
-        return
+    A smooth pseudo-random scene scrolls across the frame at the configured
+    fps, so encoders get realistic motion without camera hardware. Used by
+    bench_webrtc_load.py.
+    """
+    SCROLL = 4  # Pixels per frame
+
+    def __init__(self, device_id=SYNTHETIC_DEVICE, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT, fps=CAPTURE_FPS):
+        self.width = width
+        self.height = height
+        self.interval = 1 / fps
+        noise = np.random.default_rng(0).integers(
+            0, 255, (max(height // 32, 2), max(width // 16, 2), 3), dtype=np.uint8
+        )
+        scene = cv2.resize(noise, (width * 2, height), interpolation=cv2.INTER_CUBIC)
+        # One frame width of wrap-around so every offset is a plain slice
+        self.scene = np.concatenate([scene, scene[:, :width]], axis=1)
+        self.offset = 0
+        self.next_due = time.monotonic()
+        logger.info(f"📹 Synthetic camera initialized: {width}x{height}@{fps}")
+
+    def is_opened(self):
+        return True
+
+    def read_frame(self, out=None):
+        delay = self.next_due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        # Like a camera, a late reader gets the next frame rather than a burst
+        self.next_due = max(self.next_due + self.interval, time.monotonic())
+        if out is None or out.shape != (self.height, self.width, 3):
+            out = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        np.copyto(out, self.scene[:, self.offset:self.offset + self.width])
+        self.offset = (self.offset + self.SCROLL) % (self.width * 2)
+        return out
+
+    def close(self):
+        pass
+
+class CameraSupervisor:
+    """Keeps the camera readable, reopening it with exponential backoff
+
+    ``read_frame()`` runs on the capture executor. After
+    CAMERA_FAILURE_THRESHOLD failed reads in a row the device is released and
+    reopened, waiting CAMERA_RETRY_INITIAL seconds before the first attempt and
+    doubling up to CAMERA_RETRY_MAX after each attempt that fails.
+    """
+    def __init__(self, device_id=0, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT, fps=CAPTURE_FPS):
+        self.device_id = device_id
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.capture = None
+        self.state = 'closed'
+        self.failures = 0
+        self.reconnects = 0
+        self.retry_delay = 0
+        self._stop_event = threading.Event()
+
+    def read_frame(self, out=None):
+        """Read a frame, or return None while the camera is failing"""
+        if self.capture is None and not self._open():
+            return None
+        frame = self.capture.read_frame(out)
+        if frame is not None:
+            self.failures = 0
+            return frame
+
+        self.failures += 1
+        if self.failures >= CAMERA_FAILURE_THRESHOLD:
+            logger.warning(f"⚠️  Camera {self.device_id} stopped returning frames, reopening")
+            self.capture.close()
+            self.capture = None
+            self.failures = 0
+            self.state = 'reconnecting'
+            self.retry_delay = CAMERA_RETRY_INITIAL
+        return None
+
+    def _open(self):
+        if self.retry_delay and self._stop_event.wait(self.retry_delay):
+            return False
+        if self._stop_event.is_set():
+            return False
+        source = SyntheticCapture if self.device_id == SYNTHETIC_DEVICE else VideoCapture
+        capture = source(self.device_id, self.width, self.height, self.fps)
+        if not capture.is_opened():
+            capture.close()
+            self.state = 'reconnecting'
+            self.retry_delay = min(max(self.retry_delay * 2, CAMERA_RETRY_INITIAL), CAMERA_RETRY_MAX)
+            logger.warning(f"⚠️  Could not open camera {self.device_id}, retrying in {self.retry_delay:.1f}s")
+            return False
+        if self.state == 'reconnecting':
+            self.reconnects += 1
+            logger.info(f"📹 Camera {self.device_id} reconnected")
+        self.capture = capture
+        self.state = 'open'
+        self.retry_delay = 0
+        return True
+
+    def status(self):
+        return {
+            'state': self.state,
+            'reconnects': self.reconnects,
+            'retry_delay': self.retry_delay,
+        }
+
+    def stop(self):
+        """Interrupt any backoff wait so the capture executor can shut down"""
+        self._stop_event.set()
+
+    def resume(self):
+        """Allow reads again after stop(), for a camera reopened after idling"""
+        self._stop_event.clear()
+        self.retry_delay = 0
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        self.state = 'closed'
+
+class CapturedFrame:
+    """A single timestamped frame published on the frame bus
+
+    ``image`` is the raw BGR frame from the camera and ``yuv`` the same frame
+    already converted to the encoder's native I420 layout. Both usually live
+    in a pooled FrameBuffer: a consumer that uses them across an ``await``
+    must ``retain()`` the frame first and ``release()`` it when done.
+
+    ``read_started``, ``timestamp`` and ``published`` are when cap.read()
+    was called, when it returned and when the converted frame reached the
+    bus, for latency measurement (see LatencyProbe).
+
+    Smaller copies for encoders and tracks come from ``scaled()``, which
+    every consumer of the frame shares (see FramePyramid).
+    """
+    __slots__ = ('seq', 'timestamp', 'image', 'yuv', 'buffer', 'read_started', 'published', 'pyramid')
+
+    def __init__(self, seq, timestamp, image, yuv, buffer=None, read_started=None, pyramid=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self.yuv = yuv
+        self.buffer = buffer
+        self.read_started = timestamp if read_started is None else read_started
+        self.published = time.monotonic()
+        if pyramid is None:
+            pyramid = buffer.pyramid if buffer is not None else FramePyramid()
+        self.pyramid = pyramid
+
+    def scaled(self, width, height):
+        """This frame's I420 planes at ``width`` x ``height`` (rounded down to even)
+
+        Valid for as long as the frame is; retain() it to use the result
+        across an await.
+        """
+        return self.pyramid.level(self.yuv, width, height)
+
+    def stamps(self):
+        """(read_started, timestamp, published), kept by tracks after the frame itself is gone"""
+        return self.read_started, self.timestamp, self.published
+
+    def retain(self):
+        if self.buffer is not None:
+            self.buffer.retain()
+
+    def release(self):
+        if self.buffer is not None:
+            self.buffer.release()
+
+class FrameBuffer:
+    """A preallocated BGR image and I420 array, recycled through a BufferPool
+
+    Reference counted on the event loop thread: the capture pipeline holds
+    the first reference, hands it to the frame bus on publish, and every
+    consumer that keeps the frame across an await adds its own. The buffer
+    returns to its pool when the last reference is released.
+    """
+    __slots__ = ('pool', 'image', 'yuv', 'refs', 'pyramid')
+
+    def __init__(self, pool, width, height):
+        self.pool = pool
+        self.image = np.empty((height, width, 3), dtype=np.uint8)
+        self.yuv = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        self.refs = 0
+        self.pyramid = FramePyramid(pool.scaled)
+
+    def retain(self):
+        self.refs += 1
+
+    def release(self):
+        self.refs -= 1
+        if self.refs == 0:
+            self.pool.recycle(self)
+
+class ScaleCounter:
+    """Frames scaled to each output size, counted from encoder and track threads
+
+    Every buffer's FramePyramid counts into its pool's counter, each under
+    its own pyramid lock, so the counts have a lock of their own that
+    readers also take for a consistent snapshot.
+    """
+    def __init__(self):
+        self._counts = {}  # (width, height) -> frames scaled to that size
+        self._lock = threading.Lock()
+
+    def add(self, size):
+        with self._lock:
+            self._counts[size] = self._counts.get(size, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+class BufferPool:
+    """Free list of FrameBuffers for one capture size
+
+    Grows only while every buffer is in use, so after warm-up the capture
+    path stops allocating frame memory altogether.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = []
+        self.allocated = 0
+        self.scaled = ScaleCounter()
+
+    def acquire(self):
+        """A buffer holding one reference for the caller"""
+        if self.free:
+            buffer = self.free.pop()
+            buffer.pyramid.reset()
+        else:
+            buffer = FrameBuffer(self, self.width, self.height)
+            self.allocated += 1
+        buffer.refs = 1
+        return buffer
+
+    def recycle(self, buffer):
+        if buffer.image.shape[:2] == (self.height, self.width):
+            self.free.append(buffer)
+        else:
+            # Left over from before a resize; let it be freed
+            self.allocated -= 1
+
+    def resize(self, width, height):
+        """Switch to a new capture size (the camera delivered something else)"""
+        logger.info(f"📐 Frame buffers resized to {width}x{height}")
+        self.width = width
+        self.height = height
+        self.allocated -= len(self.free)
+        self.free.clear()
+
+    def status(self):
+        return {
+            'allocated': self.allocated,
+            'free': len(self.free),
+            'scaled_frames': {f'{width}x{height}': count for (width, height), count in self.scaled.snapshot().items()},
+        }
+
+def i420_planes(yuv):
+    """Y, U and V views of a contiguous (height * 3 / 2, width) I420 array"""
+    width = yuv.shape[1]
+    height = yuv.shape[0] * 2 // 3
+    flat = yuv.reshape(-1)
+    luma = width * height
+    chroma = luma // 4
+    return (
+        flat[:luma].reshape(height, width),
+        flat[luma:luma + chroma].reshape(height // 2, width // 2),
+        flat[luma + chroma:luma + 2 * chroma].reshape(height // 2, width // 2),
+    )
+
+def scale_i420(yuv, out):
+    """Resize I420 ``yuv`` into ``out`` plane by plane, without going through BGR"""
+    shrinking = out.shape[1] < yuv.shape[1]
+    interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+    for source, target in zip(i420_planes(yuv), i420_planes(out)):
+        cv2.resize(source, (target.shape[1], target.shape[0]), dst=target, interpolation=interpolation)
+
+class FramePyramid:
+    """Scaled I420 copies of one frame, each size made at most once, on demand
+
+    Peers on different quality rungs want the same frame at different
+    sizes. The first consumer to ask for a size scales it, under a lock so
+    a consumer on another thread asking at the same time waits for that
+    result instead of scaling again; every later consumer gets the same
+    array. Sizes nobody asks for are never computed. The arrays belong to
+    the frame's FrameBuffer and are refilled, not reallocated, when the
+    buffer is reused for a later frame.
+    """
+    __slots__ = ('levels', 'ready', 'counts', 'lock')
+
+    def __init__(self, counts=None):
+        self.levels = {}    # (width, height) -> I420 array, kept across reset()
+        self.ready = set()  # Sizes scaled from the current frame
+        self.counts = counts  # ScaleCounter of the buffer's pool, if any
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Forget scaled sizes (the buffer now holds another frame)"""
+        self.ready.clear()
+
+    def level(self, yuv, width, height):
+        width, height = width & ~1, height & ~1
+        if (width, height) == (yuv.shape[1], yuv.shape[0] * 2 // 3):
+            return yuv
+        size = (width, height)
+        if size not in self.ready:
+            with self.lock:
+                if size not in self.ready:
+                    out = self.levels.get(size)
+                    if out is None:
+                        out = self.levels[size] = np.empty((height * 3 // 2, width), dtype=np.uint8)
+                    scale_i420(yuv, out)
+                    self.ready.add(size)
+                    if self.counts is not None:
+                        self.counts.add(size)
+        return self.levels[size]
+
+class FrameBus:
+    """Latest-frame bus: one capture pipeline publishes, every track subscribes
+
+    Only the newest frame is kept, so a slow subscriber skips frames instead
+    of building a backlog, and the number of subscribers never changes how
+    often the camera is read.
+    """
+    def __init__(self):
+        self._latest = None
+        self._seq = 0
+        self._updated = asyncio.Event()
+        # Common pts origin for every encoder reading this bus
+        self.epoch = time.monotonic()
+        # Served by fallback_frame() while the camera is down
+        self.placeholder = None
+
+    @property
+    def latest(self):
+        return self._latest
+
+    def publish(self, image, yuv, timestamp, buffer=None, read_started=None):
+        """Publish a frame (must run on the event loop thread)
+
+        The bus takes over the caller's reference on ``buffer`` and releases
+        it when the next frame replaces this one.
+        """
+        self._seq += 1
+        previous = self._latest
+        self._latest = CapturedFrame(self._seq, timestamp, image, yuv, buffer, read_started)
+        if previous is not None:
+            previous.release()
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def subscribe(self):
+        return FrameSubscription(self)
+
+class FrameSubscription:
+    """A subscriber's read position on the frame bus"""
+    def __init__(self, bus):
+        self.bus = bus
+        self.last_seq = 0
+
+    async def next_frame(self, timeout=None):
+        """Return the newest frame not yet seen, or None on timeout"""
+        while True:
+            frame = self.bus.latest
+            if frame is not None and frame.seq > self.last_seq:
+                self.last_seq = frame.seq
+                return frame
+            try:
+                await asyncio.wait_for(self.bus._updated.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+def convert_frame(image, out=None):
+    """Convert a BGR camera frame to planar I420, into ``out`` if given (runs on the capture executor)"""
+    return cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420, dst=out)
+
+def motion_thumbnail(image):
+    """Small greyscale copy of a BGR frame that motion is measured on"""
+    height, width = image.shape[:2]
+    small = cv2.resize(
+        image, (width // MOTION_DOWNSCALE, height // MOTION_DOWNSCALE),
+        interpolation=cv2.INTER_AREA,
+    )
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+def motion_score(grey, reference):
+    """Mean absolute grey-level change between two thumbnails (inf if there is nothing to compare)"""
+    if reference is None or reference.shape != grey.shape:
+        return float('inf')
+    return float(np.abs(np.subtract(grey, reference, dtype=np.int16)).mean())
+
+class MotionGate:
+    """Drops the capture pipeline to MOTION_IDLE_FPS while the scene is static
+
+    Each frame is shrunk to a small greyscale copy and compared with the copy
+    of the last frame that was let through, so slow movement still
+    accumulates into a detectable change. The first frame that differs by
+    MOTION_THRESHOLD or more is published immediately and full rate resumes.
+    """
+    def __init__(self, threshold=MOTION_THRESHOLD):
+        self.threshold = threshold
+        self.score = 0.0
+        self.active = True
+        self.gated_frames = 0
+        self._reference = None
+        self._last_motion = time.monotonic()
+        self._next_idle_frame = 0.0
+
+    def measure(self, image):
+        """Return (grey thumbnail, motion score); runs on the capture executor"""
+        grey = motion_thumbnail(image)
+        return grey, motion_score(grey, self._reference)
+
+    def admit(self, grey, score, timestamp):
+        """Whether this frame should continue down the pipeline"""
+        self.score = score if score != float('inf') else 0.0
+        if score >= self.threshold:
+            if not self.active:
+                logger.info(f"🏃 Motion detected (score {score:.1f}), resuming full rate")
+            self.active = True
+            self._last_motion = timestamp
+        elif self.active and timestamp - self._last_motion >= MOTION_IDLE_AFTER:
+            logger.info(f"💤 Scene static, dropping to {MOTION_IDLE_FPS:g} fps")
+            self.active = False
+
+        if self.active or timestamp >= self._next_idle_frame:
+            self._reference = grey
+            self._next_idle_frame = timestamp + 1 / MOTION_IDLE_FPS
+            return True
+        self.gated_frames += 1
+        return False
+
+    def status(self):
+        return {'active': self.active, 'score': round(self.score, 2), 'gated_frames': self.gated_frames}
+
+class CapturePipeline:
+    """Executor-backed capture and conversion stages feeding the frame bus
+
+    Blocking ``cap.read()`` and ``cv2.cvtColor()`` calls run on a dedicated
+    thread pool so the event loop only ever awaits finished frames. Frames
+    waiting between the two stages are held in a bounded queue; when it is
+    full the oldest frame is dropped. An optional MotionGate sits between
+    the stages so static frames are never converted or encoded.
+
+    Frames are read and converted in place into pooled FrameBuffers, so a
+    steady stream allocates no frame memory once the pool has warmed up.
+    """
+    def __init__(self, capture, bus, threads=CAPTURE_THREADS, queue_size=FRAME_QUEUE_SIZE,
+                 motion_gate=None):
+        self.capture = capture
+        self.bus = bus
+        self.motion_gate = motion_gate
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='capture')
+        self.frames = 0
+        self.dropped_frames = 0
+        self.capture_interval = Histogram()
+        self.pool = BufferPool(capture.width, capture.height)
+        self._recent = deque(maxlen=CAPTURE_FPS_WINDOW)
+        self._queue = None
+        self._tasks = []
+
+    @property
+    def fps(self):
+        """Capture rate measured over the last CAPTURE_FPS_WINDOW frames"""
+        if len(self._recent) < 2 or self._recent[-1] == self._recent[0]:
+            return 0.0
+        return (len(self._recent) - 1) / (self._recent[-1] - self._recent[0])
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._read_stage()),
+            asyncio.create_task(self._convert_stage()),
+        ]
+        logger.info(f"📸 Capture pipeline started for camera {self.capture.device_id}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Wait for an in-flight read to finish before the camera is released
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown, True)
+        logger.info("📸 Capture pipeline stopped")
+
+    def _read(self, buffer):
+        """Read a frame into ``buffer`` and, if gating, measure motion (on the executor)"""
+        image = self.capture.read_frame(buffer.image)
+        if image is None or self.motion_gate is None:
+            return image, None
+        return image, self.motion_gate.measure(image)
+
+    async def _read_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            buffer = self.pool.acquire()
+            read_started = time.monotonic()
+            image, motion = await loop.run_in_executor(self.executor, self._read, buffer)
+            timestamp = time.monotonic()
+            if image is None:
+                buffer.release()
+                await asyncio.sleep(0.1)
+                continue
+            if image is not buffer.image:
+                # The backend ignored the output buffer (e.g. it delivered another size)
+                if image.shape != buffer.image.shape:
+                    buffer.release()
+                    self.pool.resize(image.shape[1], image.shape[0])
+                    buffer = self.pool.acquire()
+                np.copyto(buffer.image, image)
+            if self._recent:
+                self.capture_interval.observe(timestamp - self._recent[-1])
+            self._recent.append(timestamp)
+            self.frames += 1
+            if motion is not None and not self.motion_gate.admit(*motion, timestamp):
+                buffer.release()
+                continue
+            if self._queue.full():
+                dropped = self._queue.get_nowait()[0]
+                dropped.release()
+                self.dropped_frames += 1
+            self._queue.put_nowait((buffer, read_started, timestamp))
+
+    async def _convert_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            buffer, read_started, timestamp = await self._queue.get()
+            try:
+                await loop.run_in_executor(self.executor, convert_frame, buffer.image, buffer.yuv)
+            except Exception as e:
+                logger.error(f"❌ Error converting frame: {e}")
+                buffer.release()
+                continue
+            self.bus.publish(buffer.image, buffer.yuv, timestamp, buffer, read_started)
+
+class RingPipeline(CapturePipeline):
+    """Feeds the frame bus from a FrameRing written by the capture process
+
+    Stands in for CapturePipeline in the front-end and worker processes of
+    multi-process mode. Each frame is copied out of shared memory into this
+    process's own pooled buffers, so subscribers keep the usual refcount
+    rules; workers only encode, so they skip the BGR image and copy the
+    I420 planes alone.
+    """
+    def __init__(self, ring, bus, copy_image=True):
+        super().__init__(ring, bus, threads=1)
+        self.ring = ring
+        self.copy_image = copy_image
+        self._seq = ring.latest_seq
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._ring_stage())]
+        logger.info(f"📸 Reading frames from shared ring {self.ring.name}")
+
+    async def _ring_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            buffer = self.pool.acquire()
+            image_out = buffer.image if self.copy_image else None
+            result = await loop.run_in_executor(
+                self.executor, self.ring.read, self._seq, image_out, buffer.yuv, FRAME_TIMEOUT
+            )
+            if result is None:
+                buffer.release()
+                continue
+            seq, timestamp, read_started = result
+            if self._seq and seq > self._seq + 1:
+                self.dropped_frames += seq - self._seq - 1
+            self._seq = seq
+            if self._recent:
+                self.capture_interval.observe(timestamp - self._recent[-1])
+            self._recent.append(timestamp)
+            self.frames += 1
+            self.bus.publish(buffer.image, buffer.yuv, timestamp, buffer, read_started)
+
+# How long a track waits for a new frame before falling back to a placeholder
+FRAME_TIMEOUT = 1.0
+# Frames older than this when a track would send them are dropped instead
+LATE_FRAME_THRESHOLD = 0.25
+
+def make_placeholder_frame(width, height):
+    """Build the frame served while the camera is unavailable (done once per camera)"""
+    image = cv2.imread(PLACEHOLDER_IMAGE) if os.path.exists(PLACEHOLDER_IMAGE) else None
+    if image is None:
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+    elif image.shape[:2] != (height, width):
+        image = cv2.resize(image, (width, height))
+    return CapturedFrame(0, time.monotonic(), image, convert_frame(image))
+
+def fallback_frame(bus):
+    """The last good frame while it is recent, otherwise the precomputed placeholder
+
+    The returned frame is restamped with the current time so it paces like a
+    live one.
+    """
+    latest = bus.latest
+    now = time.monotonic()
+    if latest is None or now - latest.timestamp > LAST_FRAME_HOLD:
+        latest = bus.placeholder
+    return CapturedFrame(latest.seq, now, latest.image, latest.yuv, latest.buffer, pyramid=latest.pyramid)
 
-    frame_count = 0
-    while pc.connectionState == 'connected':
+loop_lag_task = None
+inference_stage = None
+worker_pool = None
+recorders = {}  # Camera ID -> SegmentRecorder, in the process that records
+PROCESS_ROLE = 'single'  # 'single', or in multi-process mode 'front', 'worker' or 'capture'
+WORKER_INDEX = None      # This worker's index in multi-process mode
+
+def even(value):
+    return max(int(round(value / 2)) * 2, 2)
+
+def ladder_rung(width, height, fps, step):
+    """A rung of ``width`` x ``height`` at ``fps``, its bitrate scaled from a QUALITY_LADDER step by pixel rate"""
+    step_width = even(step['height'] * 16 / 9)
+    bitrate = step['bitrate'] * (width * height * fps) / (step_width * step['height'] * step['fps'])
+    # Rungs are named like "360p20"; sizes that are not 16:9 spell out their width
+    name = f"{height}p{fps:g}" if width == even(height * 16 / 9) else f"{width}x{height}p{fps:g}"
+    return {'name': name, 'width': width, 'height': height, 'fps': fps, 'bitrate': int(bitrate)}
+
+def quality_ladder(width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT, fps=CAPTURE_FPS):
+    """Rungs for a camera delivering ``width`` x ``height`` at ``fps``, best first
+
+    The top rung is the capture itself, at its full frame rate. Below it
+    come the QUALITY_LADDER steps shorter than the capture, at the
+    capture's aspect ratio and at most its frame rate.
+    """
+    aspect = width / height
+    top = min(QUALITY_LADDER, key=lambda step: abs(step['height'] - height))
+    rungs = [ladder_rung(even(width), even(height), fps, top)]
+    for step in QUALITY_LADDER:
+        if step['height'] < rungs[-1]['height']:
+            rungs.append(ladder_rung(even(step['height'] * aspect), step['height'], min(step['fps'], fps), step))
+    return rungs
+
+# Features that found aiortc's private sender attributes missing, warned about once each
+missing_sender_internals = set()
+
+def has_sender_internals(sender, feature, *names):
+    """Whether an RTCRtpSender still has the private attributes ``feature`` relies on
+
+    Written against aiortc 1.15 (pinned in webrtc_requirements.txt). If an
+    upgrade renames them the feature is skipped, with one warning, instead
+    of failing inside the sender's run loop and stopping the video.
+    """
+    if all(hasattr(sender, name) for name in names):
+        return True
+    if feature not in missing_sender_internals:
+        missing_sender_internals.add(feature)
+        logger.warning(f"⚠️  aiortc's RTCRtpSender lacks {', '.join(names)}; {feature} disabled")
+    return False
+
+class QualityController:
+    """Steps one peer along the quality ladder from its RTCP receiver reports
+
+    Any of high loss, RTT or jitter moves the peer one rung down straight away;
+    it only moves back up after QUALITY_UP_INTERVALS healthy checks in a row.
+    """
+    def __init__(self, device_id, sender, track, ladder):
+        self.device_id = device_id
+        self.sender = sender
+        self.track = track
+        self.ladder = ladder
+        self.rung_index = 0
+        self.loss = None
+        self.rtt = None
+        self.jitter = None
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.encode_seconds = 0.0
+        self._instrumented_encoder = None
+        self._healthy_checks = 0
+        self._last_report = None
+        self._task = None
+
+    @property
+    def rung(self):
+        return self.ladder[self.rung_index]
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def status(self):
+        return {
+            'rung': self.rung['name'],
+            'loss': self.loss,
+            'rtt': self.rtt,
+            'jitter': self.jitter,
+            **self.track.pacer.stats(),
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(QUALITY_INTERVAL)
+            try:
+                stats = await self.sender.getStats()
+            except Exception as e:
+                logger.warning(f"⚠️  Could not read stats for {self.device_id}: {e}")
+                continue
+            for report in stats.values():
+                if report.type == 'remote-inbound-rtp':
+                    self._evaluate(report)
+                elif report.type == 'outbound-rtp':
+                    self.bytes_sent = report.bytesSent
+                    self.packets_sent = report.packetsSent
+            self._apply_bitrate()
+
+    def _evaluate(self, report):
+        # Only react to receiver reports we have not seen yet
+        if report.timestamp == self._last_report:
+            return
+        self._last_report = report.timestamp
+
+        self.loss = (report.fractionLost or 0) / 256
+        self.rtt = report.roundTripTime or 0
+        self.jitter = (report.jitter or 0) / 90000
+
+        if self.loss > QUALITY_LOSS_DOWN or self.rtt > QUALITY_RTT_DOWN or self.jitter > QUALITY_JITTER_DOWN:
+            self._healthy_checks = 0
+            if self.rung_index < len(self.ladder) - 1:
+                self._set_rung(self.rung_index + 1)
+        elif self.loss < QUALITY_LOSS_UP and self.rtt < QUALITY_RTT_UP:
+            self._healthy_checks += 1
+            if self._healthy_checks >= QUALITY_UP_INTERVALS and self.rung_index > 0:
+                self._healthy_checks = 0
+                self._set_rung(self.rung_index - 1)
+        else:
+            self._healthy_checks = 0
+
+    def _set_rung(self, index):
+        previous = self.rung['name']
+        self.rung_index = index
+        logger.info(
+            f"📶 {self.device_id}: {previous} -> {self.rung['name']} "
+            f"(loss {self.loss:.1%}, rtt {self.rtt * 1000:.0f}ms, jitter {self.jitter * 1000:.0f}ms)"
+        )
+        self.track.set_rung(self.rung)
+
+    def _apply_bitrate(self):
+        # Per-peer encoders are private to aiortc's sender; relayed tracks
+        # get their bitrate from the shared encoder of their rung instead.
+        if not has_sender_internals(self.sender, 'per-peer bitrate control', '_RTCRtpSender__encoder'):
+            return
+        encoder = self.sender._RTCRtpSender__encoder
+        if encoder is not None and hasattr(encoder, 'target_bitrate'):
+            encoder.target_bitrate = self.rung['bitrate']
+        if encoder is not None and encoder is not self._instrumented_encoder:
+            self._instrument(encoder)
+
+    def _instrument(self, encoder):
+        """Time a per-peer encoder's encode() calls for /metrics"""
+        encode = encoder.encode
+
+        def timed_encode(frame, force_keyframe=False):
+            started = time.perf_counter()
+            try:
+                return encode(frame, force_keyframe)
+            finally:
+                self.encode_seconds += time.perf_counter() - started
+
+        encoder.encode = timed_encode
+        self._instrumented_encoder = encoder
+
+def encoder_profile(name):
+    """The ENCODER_PROFILES entry called ``name``"""
+    for profile in ENCODER_PROFILES:
+        if profile['name'] == name:
+            return profile
+    raise ValueError(f"Unknown encoder profile: {name} (expected one of "
+                     f"{', '.join(profile['name'] for profile in ENCODER_PROFILES)})")
+
+class EncoderBudget:
+    """Steps every encoder in this process along ENCODER_PROFILES to stay within budget
+
+    Every BUDGET_INTERVAL it measures this process's CPU use, as a share of
+    all cores, and the busiest encoder's load: the time it spent encoding
+    per frame as a share of its frame interval. Either one over budget
+    (CPU_BUDGET, ENCODE_BUDGET) moves to the next cheaper profile straight
+    away; only after BUDGET_UP_INTERVALS checks in a row under
+    BUDGET_HEADROOM of both budgets does it move back up, never above
+    ENCODER_PROFILE. Shared encoders reopen with the new profile on their
+    next frame; per-peer encoders belong to aiortc, so for them only the
+    codec preference of new sessions changes. Every change is logged with
+    its reason.
+    """
+    def __init__(self, start=ENCODER_PROFILE, auto=ENCODER_AUTO):
+        self.ceiling = ENCODER_PROFILES.index(encoder_profile(start))
+        self.index = self.ceiling
+        self.auto = auto
+        self.cpu = None
+        self.encode_load = None
+        self.busiest = None
+        self.changes = {'down': 0, 'up': 0}
+        self.history = deque(maxlen=BUDGET_HISTORY)
+        self._headroom_checks = 0
+        self._last_check = None
+        self._encoders = {}  # encoder -> (encode seconds, frames) at the last check
+        self._task = None
+
+    @property
+    def profile(self):
+        return ENCODER_PROFILES[self.index]
+
+    def start(self):
+        if self.auto:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def _encoders_now(self):
+        """(key, name, fps, encode seconds so far, frames so far) for every encoder in this process"""
+        for feed in cameras.values():
+            for encoder in feed.shared_encoders.values():
+                yield encoder, encoder.name, encoder.fps, encoder.encode_time.sum, encoder.encode_time.count
+        for session in sessions.sessions.values():
+            if session.controller and session.controller.encode_seconds:
+                yield (session.controller, f"{session.camera_id}/{session.device_id}", session.track.pacer.fps,
+                       session.controller.encode_seconds, session.track.pacer.sent_frames)
+
+    def measure(self):
+        """Update ``cpu`` and ``encode_load`` from the time since the last call"""
+        now = time.monotonic(), time.process_time()
+        previous, self._last_check = self._last_check, now
+        if previous is not None and now[0] > previous[0]:
+            self.cpu = (now[1] - previous[1]) / (now[0] - previous[0]) / (os.cpu_count() or 1)
+        self.encode_load, self.busiest = 0.0, None
+        encoders = {}
+        for encoder, name, fps, seconds, frames in self._encoders_now():
+            encoders[encoder] = (seconds, frames)
+            last_seconds, last_frames = self._encoders.get(encoder, (seconds, frames))
+            if frames > last_frames:
+                load = (seconds - last_seconds) / (frames - last_frames) * fps
+                if load > self.encode_load:
+                    self.encode_load, self.busiest = load, name
+        self._encoders = encoders
+
+    def evaluate(self):
+        """Step the profile down or up from the last measurement"""
+        if self.cpu is None:
+            return
+        if self.cpu > CPU_BUDGET:
+            self._headroom_checks = 0
+            self._step(1, f"process CPU {self.cpu:.0%} over budget {CPU_BUDGET:.0%}")
+        elif self.encode_load > ENCODE_BUDGET:
+            self._headroom_checks = 0
+            self._step(1, f"encoder {self.busiest} busy {self.encode_load:.0%} of each frame interval")
+        elif self.cpu < CPU_BUDGET * BUDGET_HEADROOM and self.encode_load < ENCODE_BUDGET * BUDGET_HEADROOM:
+            self._headroom_checks += 1
+            if self._headroom_checks >= BUDGET_UP_INTERVALS:
+                self._headroom_checks = 0
+                self._step(-1, f"headroom for {BUDGET_UP_INTERVALS * BUDGET_INTERVAL:.0f}s "
+                               f"(CPU {self.cpu:.0%}, encoder load {self.encode_load:.0%})")
+        else:
+            self._headroom_checks = 0
+
+    def _step(self, direction, reason):
+        index = self.index + direction
+        if not self.ceiling <= index < len(ENCODER_PROFILES):
+            return
+        previous = self.profile['name']
+        self.index = index
+        self.changes['down' if direction > 0 else 'up'] += 1
+        self.history.append({'at': time.time(), 'from': previous, 'to': self.profile['name'], 'reason': reason})
+        logger.info(f"🎛️  Encoder profile {previous} -> {self.profile['name']}: {reason}")
+        for feed in cameras.values():
+            for encoder in feed.shared_encoders.values():
+                encoder.set_profile(self.profile)
+
+    async def _run(self):
+        self.measure()
+        while True:
+            await asyncio.sleep(BUDGET_INTERVAL)
+            self.measure()
+            self.evaluate()
+
+    def status(self):
+        return {
+            'profile': self.profile['name'],
+            'auto': self.auto,
+            'cpu': round(self.cpu, 3) if self.cpu is not None else None,
+            'encode_load': round(self.encode_load, 3) if self.encode_load is not None else None,
+            'busiest_encoder': self.busiest,
+            'changes': list(self.history),
+        }
+
+class LatencyProbe:
+    """Glass-to-glass latency of one peer, measured with the client's help
+
+    The RTP timestamp a frame is sent under is its frame ID. Every
+    LATENCY_SAMPLE_INTERVAL the probe sends one frame's ID on the peer's
+    "latency" data channel; the client echoes the ID with the time it
+    rendered that frame, and answers pings on the same channel, from which
+    the offset between the two clocks is estimated (NTP-style, keeping the
+    lowest-RTT sample). Each echoed frame is split into stages:
+
+    - capture: time blocked in cap.read(), including the wait for the sensor
+    - convert: BGR to I420 conversion until the frame is on the bus
+    - encode: pacing, encoding and queueing until the RTP sender has the frame
+    - network: packetization, transport, jitter buffer, decode and render
+
+    Messages are JSON with times in milliseconds. Server times are on its
+    monotonic clock; the client may use any clock (performance.now() in a
+    browser) as long as pongs and render times use the same one.
+
+      server -> client  {"type": "frame", "id": rtp_timestamp, "captured": t}
+                        {"type": "ping", "t": t}
+                        {"type": "latency", "id": rtp_timestamp, "stages": {stage: ms}}
+      client -> server  {"type": "pong", "t": echoed t, "now": client time}
+                        {"type": "rendered", "id": rtp_timestamp, "at": client time}
+    """
+    def __init__(self, feed):
+        self.feed = feed
+        self.channel = None
+        self.echoed = 0
+        self.unmatched = 0
+        self.samples = {stage: deque(maxlen=LATENCY_WINDOW) for stage in LATENCY_STAGES}
+        self._origin = None  # RTP timestamp = origin + pts, fixed per sender
+        self._last_pts = None
+        self._pending = OrderedDict()  # frame ID -> (read_started, captured, published, sent)
+        self._clock = deque(maxlen=LATENCY_CLOCK_SAMPLES)  # (rtt, client clock - server clock)
+        self._next_sample = 0.0
+        self._pinger = None
+
+    def watch(self, sender, track):
+        """Stamp each frame as the RTP sender takes it from ``track``
+
+        aiortc picks a random RTP timestamp origin per sender and keeps it
+        to itself, but its send loop is sequential: when it asks for the
+        next frame, every packet of the previous one has gone out, so the
+        last RTP timestamp it sent minus that frame's pts is the origin.
+        Without those sender internals the probe stays idle.
+        """
+        if not has_sender_internals(sender, 'latency probe', '_next_encoded_frame', '_RTCRtpSender__rtp_timestamp'):
+            return
+        next_encoded_frame = sender._next_encoded_frame
+
+        async def stamped_next_encoded_frame(codec):
+            if self._origin is None and self._last_pts is not None:
+                rtp_timestamp = sender._RTCRtpSender__rtp_timestamp
+                if rtp_timestamp is not None:
+                    self._origin = (rtp_timestamp - self._last_pts) % 2**32
+            encoded = await next_encoded_frame(codec)
+            if encoded is not None:
+                try:
+                    self._last_pts = encoded.timestamp
+                    self._sent(encoded.timestamp, track.frame_stamps.pop(encoded.timestamp, None))
+                except Exception as e:
+                    # Never let measurement break the sender's loop
+                    logger.error(f"❌ Error stamping frame for latency probe: {e}")
+            return encoded
+
+        sender._next_encoded_frame = stamped_next_encoded_frame
+
+    def attach(self, channel):
+        self.channel = channel
+        channel.on('message', self._on_message)
+        if self._pinger is None:
+            self._pinger = asyncio.create_task(self._ping_loop())
+
+    def stop(self):
+        if self._pinger:
+            self._pinger.cancel()
+
+    def _send(self, message):
+        if self.channel is not None and self.channel.readyState == 'open':
+            self.channel.send(json.dumps(message))
+
+    def _sent(self, pts, stamps):
+        now = time.monotonic()
+        if stamps is None or self._origin is None or self.channel is None or now < self._next_sample:
+            return
+        self._next_sample = now + LATENCY_SAMPLE_INTERVAL
+        frame_id = (self._origin + pts) % 2**32
+        self._pending[frame_id] = (*stamps, now)
+        while len(self._pending) > LATENCY_PENDING:
+            self._pending.popitem(last=False)
+        self._send({'type': 'frame', 'id': frame_id, 'captured': round(stamps[1] * 1000, 3)})
+
+    async def _ping_loop(self):
+        while True:
+            self._send({'type': 'ping', 't': round(time.monotonic() * 1000, 3)})
+            await asyncio.sleep(LATENCY_PING_INTERVAL)
+
+    @property
+    def clock_offset(self):
+        """Client clock minus server clock (s), from the lowest-RTT ping"""
+        return min(self._clock)[1] if self._clock else None
+
+    def _on_message(self, message):
         try:
-            frame = video_capture.read_frame()
-            if frame is not None:
-                # Convert BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Create video frame
-                video_frame = VideoFrame.from_ndarray(frame_rgb, format="rgb24")
-                
-                # Send frame
-                await video_sender.send(video_frame)
-                
-                frame_count += 1
-                if frame_count % 30 == 0:
-                    logger.info(f"📤 Sent {frame_count} frames to {device_id}")
-            
-            await asyncio.sleep(0.033)  # ~30fps
-        except Exception as e:
-            logger.error(f"❌ Error sending frame: {e}")
-            break
-    
-    logger.info(f"🛑 Video stream stopped for device: {device_id}")
+            data = json.loads(message)
+            kind = data.get('type')
+            if kind == 'pong':
+                now = time.monotonic()
+                sent = data['t'] / 1000
+                self._clock.append((now - sent, data['now'] / 1000 - (sent + now) / 2))
+            elif kind == 'rendered':
+                self._rendered(int(data['id']), data['at'] / 1000)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.warning(f"⚠️  Ignoring malformed latency message: {str(message)[:80]}")
+
+    def _rendered(self, frame_id, client_time):
+        entry = self._pending.pop(frame_id, None)
+        if entry is None or self.clock_offset is None:
+            self.unmatched += 1
+            return
+        read_started, captured, published, sent = entry
+        rendered = client_time - self.clock_offset
+        stages = {
+            'capture': captured - read_started,
+            'convert': published - captured,
+            'encode': sent - published,
+            'network': max(rendered - sent, 0.0),  # Clock error can push it just below zero
+            'total': max(rendered - read_started, 0.0),
+        }
+        self.echoed += 1
+        for stage, seconds in stages.items():
+            self.samples[stage].append(seconds)
+            self.feed.latency[stage].observe(seconds)
+        self._send({
+            'type': 'latency', 'id': frame_id,
+            'stages': {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+        })
+
+    def status(self):
+        if self.channel is None:
+            return None
+        return {
+            'echoed': self.echoed,
+            'unmatched': self.unmatched,
+            'clock_rtt_ms': round(min(self._clock)[0] * 1000, 1) if self._clock else None,
+            **{f'{stage}_ms': percentiles_ms(samples) for stage, samples in self.samples.items()},
+        }
+
+def encode_jpeg(image, quality):
+    ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return data.tobytes()
+
+def encode_poster(image):
+    """Small JPEG of a frame for the poster sent with an answer"""
+    height, width = image.shape[:2]
+    if width > POSTER_WIDTH:
+        image = cv2.resize(image, (POSTER_WIDTH, height * POSTER_WIDTH // width), interpolation=cv2.INTER_AREA)
+    return encode_jpeg(image, POSTER_QUALITY)
+
+class JpegCache:
+    """Encodes each bus frame to JPEG at most once, however many HTTP clients read it
+
+    The first reader of a frame starts the encode on a dedicated thread and
+    every other reader awaits the same future. Only the newest frame's JPEG
+    is kept, so clients that fall behind simply get a later frame.
+    """
+    def __init__(self, quality=MJPEG_QUALITY):
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jpeg')
+        self.encoded_frames = 0
+        self.encode_time = Histogram()
+        self.clients = 0
+        self._seq = None
+        self._future = None
+
+    async def encode(self, captured):
+        """JPEG bytes for a captured frame"""
+        if captured.seq != self._seq or self._future is None:
+            self._seq = captured.seq
+            captured.retain()
+            self._future = asyncio.ensure_future(self._encode(captured))
+        # Shielded so one client disconnecting never cancels the shared encode
+        return await asyncio.shield(self._future)
+
+    async def _encode(self, captured):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            data = await loop.run_in_executor(self.executor, encode_jpeg, captured.image, self.quality)
+        except Exception:
+            self._future = None
+            raise
+        finally:
+            captured.release()
+        self.encode_time.observe(time.monotonic() - started)
+        self.encoded_frames += 1
+        return data
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+class SceneVersion:
+    """Numbers what a camera shows, moving on only when the picture visibly changes
+
+    The frame sequence number changes with every frame, even of a static
+    scene, so it makes a useless snapshot ETag. A frame instead gets the
+    current version unless its motion thumbnail differs from the frame that
+    started that version by MOTION_THRESHOLD or more, as in MotionGate.
+    ``update()`` runs on the JPEG executor, one frame at a time.
+    """
+    def __init__(self, threshold=MOTION_THRESHOLD):
+        self.threshold = threshold
+        self.version = 0
+        self._reference = None
+        self._seq = None
+
+    def update(self, captured):
+        """The scene version of a captured frame"""
+        if captured.seq != self._seq:
+            self._seq = captured.seq
+            grey = motion_thumbnail(captured.image)
+            if motion_score(grey, self._reference) >= self.threshold:
+                self.version += 1
+                self._reference = grey
+        return self.version
+
+# Distinguishes ETags across restarts, since scene versions start over
+ETAG_PREFIX = uuid.uuid4().hex[:8]
+
+async def frame_etag(feed, captured):
+    """ETag for a frame, shared by every frame of an unchanged scene (retain() the frame first)"""
+    version = await asyncio.get_running_loop().run_in_executor(
+        feed.jpeg_cache.executor, feed.scene.update, captured
+    )
+    return f'"{ETAG_PREFIX}-{feed.id}-{version}"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches the given ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+class ClipBuffer:
+    """Ring buffer of recent JPEG frames, capped in bytes rather than frames
+
+    Frames are sampled from the bus at CLIP_FPS and compressed through the
+    shared JpegCache, so a frame already encoded for /mjpeg is not encoded
+    again. Oldest frames are dropped once the total exceeds ``max_bytes``.
+    """
+    def __init__(self, bus, cache, fps=CLIP_FPS, max_bytes=CLIP_BUFFER_BYTES):
+        self.bus = bus
+        self.cache = cache
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (capture timestamp, jpeg bytes)
+        self.bytes = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def append(self, timestamp, data):
+        self.frames.append((timestamp, data))
+        self.bytes += len(data)
+        while self.bytes > self.max_bytes and len(self.frames) > 1:
+            _, dropped = self.frames.popleft()
+            self.bytes -= len(dropped)
+
+    def between(self, start, end):
+        """Buffered frames captured in (start, end]"""
+        return [frame for frame in self.frames if start < frame[0] <= end]
+
+    @property
+    def seconds(self):
+        return self.frames[-1][0] - self.frames[0][0] if self.frames else 0.0
+
+    async def _run(self):
+        subscription = self.bus.subscribe()
+        next_due = 0.0
+        while True:
+            captured = await subscription.next_frame()
+            if captured.timestamp < next_due:
+                continue
+            next_due = captured.timestamp + 1 / self.fps
+            try:
+                data = await self.cache.encode(captured)
+            except Exception as e:
+                logger.warning(f"⚠️ Clip frame dropped: {e}")
+                continue
+            self.append(captured.timestamp, data)
+
+class Clip:
+    """Pre-roll plus post-roll around one trigger, as references to buffered JPEGs"""
+    def __init__(self, camera_id, trigger, pre_roll, post_roll):
+        self.id = uuid.uuid4().hex[:12]
+        self.camera_id = camera_id
+        self.trigger = trigger
+        self.start = trigger - pre_roll
+        self.end = trigger + post_roll
+        self.frames = []
+        self.done = False
+
+    @property
+    def bytes(self):
+        return sum(len(data) for _, data in self.frames)
+
+    def frame(self, name):
+        """JPEG for a frame index, or 'event' for the frame nearest the trigger"""
+        if not self.frames:
+            return None
+        if name == 'event':
+            return min(self.frames, key=lambda frame: abs(frame[0] - self.trigger))[1]
+        try:
+            return self.frames[int(name)][1]
+        except (ValueError, IndexError):
+            return None
+
+    def to_json(self):
+        # Monotonic capture times are reported as wall-clock milliseconds
+        wall = lambda t: int((t - time.monotonic() + time.time()) * 1000)
+        base = public_url()
+        url = f"{base or ''}/clips/{self.id}"
+        return {
+            'clipId': self.id,
+            'cameraId': self.camera_id,
+            'url': url,
+            # Alerts are opened in the mobile app, which cannot resolve a bare path
+            'screenshots': [f"{url}/event.jpg"] if base else [],
+            'status': 'complete' if self.done else 'recording',
+            'start': wall(self.start),
+            'trigger': wall(self.trigger),
+            'end': wall(self.end),
+            'frames': len(self.frames),
+            'bytes': self.bytes,
+        }
+
+_public_url = None
+
+def public_url():
+    """Absolute base URL the mobile app can reach this server at, or None
+
+    WEBRTC_PUBLIC_URL when it is absolute (set it when the app connects
+    through a tunnel), otherwise http:// plus the address of the interface
+    that routes outward and SERVER_PORT. Worked out once; without either,
+    clip JSON carries relative URLs and no screenshots.
+    """
+    global _public_url
+    if _public_url is None:
+        if '://' in PUBLIC_URL:
+            _public_url = PUBLIC_URL.rstrip('/')
+        else:
+            address = None
+            try:
+                # Connecting a UDP socket sends nothing; it only picks the outgoing interface
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                    probe.connect(('192.0.2.1', 9))
+                    address = probe.getsockname()[0]
+            except OSError:
+                pass
+            if address and not address.startswith('127.'):
+                _public_url = f"http://{address}:{SERVER_PORT}"
+            else:
+                _public_url = ''
+            logger.warning(
+                f"⚠️  WEBRTC_PUBLIC_URL is {'not absolute' if PUBLIC_URL else 'unset'}; "
+                + (f"alert links use {_public_url}" if _public_url else "alerts will carry no screenshot links")
+            )
+    return _public_url or None
+
+class ClipStore:
+    """Clips cut from the ClipBuffer, addressable by ID
+
+    A trigger that arrives while the previous clip is still recording its
+    post-roll reuses that clip, so a burst of alerts references one set of
+    frames instead of each carrying its own copy.
+    """
+    def __init__(self, camera_id, buffer, max_bytes=CLIP_STORE_BYTES):
+        self.camera_id = camera_id
+        self.buffer = buffer
+        self.max_bytes = max_bytes
+        self.clips = {}
+        self.reused = 0
+        self._latest = None
+        self._tasks = set()
+
+    def capture(self, pre_roll=CLIP_PRE_ROLL, post_roll=CLIP_POST_ROLL):
+        """Return (clip, reused) for an event happening now"""
+        if self._latest is not None and not self._latest.done:
+            self.reused += 1
+            return self._latest, True
+        clip = Clip(self.camera_id, time.monotonic(), pre_roll, post_roll)
+        clip.frames = self.buffer.between(clip.start, clip.trigger)
+        self.clips[clip.id] = clip
+        self._latest = clip
+        task = asyncio.create_task(self._finish(clip))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"🎞️ Clip {clip.id} started ({len(clip.frames)} pre-roll frames)")
+        return clip, False
+
+    async def _finish(self, clip):
+        await asyncio.sleep(max(clip.end - time.monotonic(), 0))
+        clip.frames += self.buffer.between(clip.trigger, clip.end)
+        clip.done = True
+        self._trim()
+
+    def _trim(self):
+        """Drop the oldest finished clips once stored frames exceed max_bytes"""
+        total = sum(clip.bytes for clip in self.clips.values())
+        for clip_id, clip in list(self.clips.items()):
+            if total <= self.max_bytes or clip is self._latest:
+                break
+            if clip.done:
+                total -= clip.bytes
+                del self.clips[clip_id]
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+class CameraFeed:
+    """One configured camera and everything fed from it
+
+    Each camera has its own supervisor, frame bus and capture pipeline with
+    its own executor threads (cap.read() and cvtColor release the GIL, so
+    cameras capture on separate cores), plus its own shared encoders, JPEG
+    cache and clip buffer. Nothing is shared between feeds.
+
+    The camera opens when the first viewer (a video track, MJPEG client,
+    snapshot or the inference stage) arrives and is released once it has
+    had no viewers for CAMERA_IDLE_TIMEOUT seconds. The clip buffer only
+    records while the camera is open.
+    """
+    def __init__(self, camera_id, device, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT, fps=CAPTURE_FPS):
+        self.id = camera_id
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.camera = CameraSupervisor(device, width, height, fps)
+        self.bus = FrameBus()
+        self.pipeline = None
+        self.capture_to_send = Histogram()
+        self.latency = {stage: Histogram(GLASS_BUCKETS) for stage in LATENCY_STAGES}  # Echoed by LatencyProbes
+        self.shared_encoders = {}  # Keyed by quality rung name
+        self.jpeg_cache = JpegCache()
+        self.scene = SceneVersion()  # Snapshot ETags
+        self.clip_buffer = ClipBuffer(self.bus, self.jpeg_cache) if CLIP_FPS > 0 else None
+        self.clip_store = ClipStore(camera_id, self.clip_buffer) if self.clip_buffer else None
+        self.ring = None  # FrameRing to read from instead of the camera (multi-process mode)
+        self.viewers = 0
+        self._idle_timer = None
+        self._lock = asyncio.Lock()
+        self._poster = None  # (seq, JPEG bytes) of the last poster encoded
+
+    @property
+    def always_open(self):
+        # Rings are always fed; the capture process cannot see viewers in other processes
+        return CAMERA_IDLE_TIMEOUT <= 0 or self.ring is not None or PROCESS_ROLE == 'capture'
+
+    def start(self):
+        # Clips are cut where the HTTP endpoints live, not in workers or the capture process
+        if self.clip_buffer and PROCESS_ROLE in ('single', 'front'):
+            self.clip_buffer.start()
+        if self.always_open:
+            asyncio.create_task(self.open_camera())
+
+    def ensure_placeholder(self):
+        if self.bus.placeholder is None:
+            self.bus.placeholder = make_placeholder_frame(self.width, self.height)
+
+    def add_viewer(self):
+        """Register a consumer, opening the camera if it is closed"""
+        self.viewers += 1
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        # Tracks fall back to the placeholder until the first frame arrives
+        self.ensure_placeholder()
+        if self.pipeline is None:
+            asyncio.create_task(self.open_camera())
+
+    def remove_viewer(self):
+        """Unregister a consumer; the last one starts the idle timer"""
+        self.viewers -= 1
+        if self.viewers == 0 and not self.always_open:
+            self._idle_timer = asyncio.get_running_loop().call_later(
+                CAMERA_IDLE_TIMEOUT, lambda: asyncio.create_task(self.release_camera())
+            )
+
+    def hold(self, seconds):
+        """Keep the camera open for ``seconds``, e.g. to record a clip's post-roll"""
+        self.add_viewer()
+        asyncio.get_running_loop().call_later(seconds, self.remove_viewer)
+
+    async def current_frame(self):
+        """The newest frame, waking the camera for it if nobody is watching"""
+        latest = self.bus.latest
+        if self.pipeline is not None and latest is not None \
+                and time.monotonic() - latest.timestamp <= LAST_FRAME_HOLD:
+            return latest
+        subscription = self.bus.subscribe()
+        if latest is not None:
+            subscription.last_seq = latest.seq  # Wait for a fresh frame, not the stale one
+        self.add_viewer()
+        try:
+            captured = await subscription.next_frame(CAMERA_WAKE_TIMEOUT)
+        finally:
+            self.remove_viewer()
+        return captured or fallback_frame(self.bus)
+
+    async def poster(self):
+        """Poster JPEG of the last frame this camera delivered, or None before its first frame"""
+        latest = self.bus.latest
+        if latest is None:
+            return None
+        if self._poster is None or self._poster[0] != latest.seq:
+            latest.retain()
+            try:
+                data = await asyncio.get_running_loop().run_in_executor(
+                    self.jpeg_cache.executor, encode_poster, latest.image
+                )
+            finally:
+                latest.release()
+            self._poster = (latest.seq, data)
+        return self._poster[1]
+
+    async def open_camera(self):
+        async with self._lock:
+            if self.pipeline is not None:
+                return
+            self.ensure_placeholder()
+            if self.ring is not None:
+                self.pipeline = RingPipeline(self.ring, self.bus, copy_image=PROCESS_ROLE != 'worker')
+            else:
+                self.camera.resume()
+                self.pipeline = CapturePipeline(
+                    self.camera, self.bus, motion_gate=MotionGate() if MOTION_GATE else None
+                )
+            self.pipeline.start()
+
+    async def release_camera(self):
+        async with self._lock:
+            self._idle_timer = None
+            if self.viewers or self.pipeline is None:
+                return
+            self.camera.stop()
+            await self.pipeline.stop()
+            self.pipeline = None
+            self.camera.close()
+            logger.info(f"💤 Camera {self.id} released after {CAMERA_IDLE_TIMEOUT:.0f}s without viewers")
+
+    async def stop(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        if self.clip_buffer:
+            self.clip_store.close()
+            await self.clip_buffer.stop()
+        self.camera.stop()
+        async with self._lock:
+            if self.pipeline:
+                await self.pipeline.stop()
+        self.camera.close()
+        self.jpeg_cache.close()
+        if self.ring is not None:
+            self.ring.close()
+
+    def quality_ladder(self):
+        """Rungs for the size the camera actually delivers, once it has delivered a frame"""
+        latest = self.bus.latest
+        if latest is None:
+            return quality_ladder(self.width, self.height, self.fps)
+        height, width = latest.image.shape[:2]
+        return quality_ladder(width, height, self.fps)
+
+    def shared_encoder(self, rung):
+        if rung['name'] not in self.shared_encoders:
+            from webrtc_media import SharedEncoder
+            self.shared_encoders[rung['name']] = SharedEncoder(
+                f"{self.id}/{rung['name']}", self.bus,
+                rung['width'], rung['height'], rung['fps'], rung['bitrate'], encoder_budget.profile,
+            )
+        return self.shared_encoders[rung['name']]
+
+    def status(self):
+        pipeline = self.pipeline
+        return {
+            'device': self.ring.camera_status() if self.ring is not None else self.camera.status(),
+            'viewers': self.viewers,
+            'fps': round(pipeline.fps, 2) if pipeline else 0,
+            'dropped_frames': pipeline.dropped_frames if pipeline else 0,
+            'buffers': pipeline.pool.status() if pipeline else None,
+            'motion': pipeline.motion_gate.status() if pipeline and pipeline.motion_gate else None,
+            'mjpeg_clients': self.jpeg_cache.clients,
+            'clip_buffer': {
+                'frames': len(self.clip_buffer.frames),
+                'bytes': self.clip_buffer.bytes,
+                'seconds': round(self.clip_buffer.seconds, 2),
+                'clips': len(self.clip_store.clips),
+            } if self.clip_buffer else None,
+            'shared_encoders': {
+                name: {'subscribers': len(encoder.subscribers), 'profile': encoder.profile['name']}
+                for name, encoder in self.shared_encoders.items()
+            },
+        }
+
+def parse_camera_config(spec):
+    """Camera definitions from WEBRTC_CAMERAS (see CAMERAS), defaulting to device 0"""
+    if not spec.strip():
+        return [{'id': '0', 'device': 0}]
+    if spec.strip().startswith('['):
+        entries = json.loads(spec)
+    elif spec.strip().endswith('.json'):
+        with open(spec.strip()) as config_file:
+            entries = json.load(config_file)
+    else:
+        entries = []
+        for item in spec.split(','):
+            camera_id, _, device = item.strip().partition('=')
+            entries.append({'id': camera_id, 'device': device or camera_id})
+    for entry in entries:
+        entry['id'] = str(entry['id'])
+        device = entry.get('device', entry['id'])
+        # Numeric devices are camera indexes, anything else a path or pipeline
+        entry['device'] = int(device) if str(device).isdigit() else device
+    return entries
+
+# Configured cameras by ID; the first one is the default
+cameras = {
+    entry['id']: CameraFeed(
+        entry['id'], entry['device'], entry.get('width', CAPTURE_WIDTH),
+        entry.get('height', CAPTURE_HEIGHT), entry.get('fps', CAPTURE_FPS),
+    )
+    for entry in parse_camera_config(CAMERAS)
+}
+DEFAULT_CAMERA = next(iter(cameras))
+
+class UnknownCameraError(Exception):
+    """Raised when an offer or request names a camera that is not configured"""
+
+def get_camera(camera_id=None):
+    """The feed for a cameraId, or the default camera when none is given"""
+    feed = cameras.get(str(camera_id) if camera_id is not None else DEFAULT_CAMERA)
+    if feed is None:
+        raise UnknownCameraError(f"Unknown camera: {camera_id}")
+    return feed
+
+def find_clip(clip_id):
+    for feed in cameras.values():
+        if feed.clip_store and clip_id in feed.clip_store.clips:
+            return feed.clip_store.clips[clip_id]
+    return None
+
+def alert_clip():
+    """Clip for an alert raised inside this process (see ml_inference)"""
+    clip, _ = get_camera(ML_CAMERA).clip_store.capture()
+    return clip.to_json()
+
+def candidate_from_json(candidate_data):
+    """Parse a browser-style ICE candidate into an aiortc RTCIceCandidate"""
+    from aiortc.sdp import candidate_from_sdp
+    sdp = candidate_data.get('candidate', '')
+    if sdp.startswith('candidate:'):
+        sdp = sdp[len('candidate:'):]
+    candidate = candidate_from_sdp(sdp)
+    candidate.sdpMid = candidate_data.get('sdpMid')
+    candidate.sdpMLineIndex = candidate_data.get('sdpMLineIndex')
+    return candidate
+
+class SignalingChannel:
+    """The answer for one device, held for ``GET /signal``
+
+    aiortc does not trickle: it gathers every local candidate inside
+    setLocalDescription() (ahead of time, with the PeerPool) and emits no
+    "icecandidate" events, so the server's candidates all travel in the
+    answer SDP. Only the client's candidates trickle, towards the server.
+    Long-poll requests wait on a condition while the answer is being
+    negotiated; once it exists there is nothing more to wait for.
+    """
+    def __init__(self):
+        self.answer = None
+        self._condition = asyncio.Condition()
+
+    def has_answer(self):
+        return self.answer is not None
+
+    async def set_answer(self, answer):
+        self.answer = answer
+        await self._notify()
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def wait_for_answer(self, timeout):
+        """Block until the answer is ready (at once if it already is), or the timeout expires"""
+        if self.has_answer():
+            return
+        async with self._condition:
+            try:
+                await asyncio.wait_for(self._condition.wait_for(self.has_answer), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def poll(self):
+        """Return the answer, or nothing before it is ready"""
+        response_data = {}
+        if self.answer:
+            response_data.update(self.answer)
+        return response_data
+
+class SessionLimitError(Exception):
+    """Raised when MAX_SESSIONS connected sessions leave no room for a new one"""
+
+class Session:
+    """One client's peer connection, video track and signaling channel for one camera"""
+    def __init__(self, device_id, pc, channel, camera_id=None):
+        self.id = uuid.uuid4().hex
+        self.device_id = device_id
+        self.camera_id = camera_id
+        self.pc = pc
+        self.channel = channel
+        self.track = None
+        self.controller = None
+        self.latency = None
+        self.created = time.monotonic()
+        self.last_activity = self.created
+
+    @property
+    def key(self):
+        return (self.device_id, self.camera_id)
+
+    @property
+    def connected(self):
+        return self.pc.connectionState == 'connected'
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    async def close(self):
+        if self.controller:
+            self.controller.stop()
+        if self.latency:
+            self.latency.stop()
+        if self.track:
+            self.track.stop()
+        await self.pc.close()
+
+class SessionRegistry:
+    """Bounded registry of sessions keyed by a server-issued session ID
+
+    A new offer from a device closes that device's previous session for the
+    same camera (a device may watch several cameras at once), sessions
+    that are not connected expire after SESSION_IDLE_TTL, and at MAX_SESSIONS
+    the least recently active unconnected session is evicted to make room.
+    A session whose offer fails to negotiate, or whose connection fails, is
+    evicted at once. Evictions are counted per reason.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions = {}
+        self.by_device = {}
+        self.evictions = {'replaced': 0, 'expired': 0, 'capacity': 0, 'failed': 0}
+        self._sweeper = None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def lookup(self, session_id=None, device_id=None, camera_id=None):
+        """Find a session by ID, falling back to the device's current session for a camera"""
+        if session_id:
+            return self.sessions.get(session_id)
+        key = (device_id, str(camera_id) if camera_id is not None else DEFAULT_CAMERA)
+        if key in self.by_device:
+            return self.sessions.get(self.by_device[key])
+        return None
+
+    async def add(self, session):
+        previous = self.lookup(device_id=session.device_id, camera_id=session.camera_id)
+        if previous is not None:
+            await self.evict(previous, 'replaced')
+        while len(self.sessions) >= self.max_sessions:
+            idle = [s for s in self.sessions.values() if not s.connected]
+            if not idle:
+                raise SessionLimitError(f"Session limit reached ({self.max_sessions})")
+            await self.evict(min(idle, key=lambda s: s.last_activity), 'capacity')
+        self.sessions[session.id] = session
+        self.by_device[session.key] = session.id
+
+    def remove(self, session):
+        """Forget a session that ended on its own"""
+        if self.sessions.pop(session.id, None) is not None:
+            if self.by_device.get(session.key) == session.id:
+                del self.by_device[session.key]
+            return True
+        return False
+
+    async def evict(self, session, reason):
+        if self.remove(session):
+            self.evictions[reason] += 1
+            logger.info(f"🧹 Evicted session {session.id[:8]} for {session.device_id} ({reason})")
+            await session.close()
+
+    async def sweep(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if not session.connected and now - session.last_activity > self.idle_ttl:
+                await self.evict(session, 'expired')
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Error sweeping sessions: {e}")
+
+    def start(self):
+        self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close_all(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+        for session in list(self.sessions.values()):
+            self.remove(session)
+            await session.close()
+
+    def status(self):
+        return {
+            'active': len(self.sessions),
+            'connected': sum(1 for s in self.sessions.values() if s.connected),
+            'max': self.max_sessions,
+            'evictions': dict(self.evictions),
+        }
+
+sessions = SessionRegistry()
+
+class JoinStats:
+    """How long new sessions take to start, measured from the offer arriving
+
+    ``answer`` is the time until the answer is ready and ``first_frame``
+    until the first video frame is handed to the RTP sender. Both feed a
+    histogram for /metrics; the last JOIN_WINDOW samples give the
+    percentiles on /health.
+    """
+    STAGES = ('answer', 'first_frame')
+
+    def __init__(self):
+        self.histograms = {stage: Histogram(JOIN_BUCKETS) for stage in self.STAGES}
+        self.recent = {stage: deque(maxlen=JOIN_WINDOW) for stage in self.STAGES}
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+        self.recent[stage].append(seconds)
+
+    def status(self):
+        return {
+            f'time_to_{stage}_ms': {
+                **percentiles_ms(samples),
+                'last': round(samples[-1] * 1000, 1),
+                'count': self.histograms[stage].count,
+            } if samples else None
+            for stage, samples in self.recent.items()
+        }
+
+join_stats = JoinStats()
+
+def rtc_configuration():
+    """RTCConfiguration for new peer connections, from WEBRTC_STUN_SERVERS"""
+    from aiortc import RTCConfiguration, RTCIceServer
+    if STUN_SERVERS is None:
+        return RTCConfiguration()
+    if STUN_SERVERS.strip().lower() == 'none':
+        return RTCConfiguration(iceServers=[])
+    return RTCConfiguration(iceServers=[
+        RTCIceServer(urls=url.strip()) for url in STUN_SERVERS.split(',') if url.strip()
+    ])
+
+class PeerPool:
+    """Peer connections whose ICE candidates were gathered before any offer arrived
+
+    aiortc gathers candidates inside setLocalDescription(), and with a STUN
+    server configured that waits for its reply, for seconds if it is slow or
+    unreachable. Each pooled peer has a send-only video transceiver with its
+    candidates already gathered, which the offer's video section and the
+    video track then reuse, so negotiate() no longer waits on gathering.
+    Candidates cannot be handed from one session to the next (every ICE
+    agent binds its own sockets and credentials), so whole peers are kept
+    ready instead, and replaced once they are PREWARM_MAX_AGE old.
+    """
+    def __init__(self, size=PREWARM_PEERS, max_age=PREWARM_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._ready = deque()  # (created, pc), oldest first
+        self._wanted = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self.size > 0:
+            self._task = asyncio.create_task(self._fill_loop())
+
+    async def _prepare(self):
+        from aiortc import RTCPeerConnection
+        pc = RTCPeerConnection(rtc_configuration())
+        transceiver = pc.addTransceiver('video', direction='sendonly')
+        try:
+            await transceiver.sender.transport.transport.iceGatherer.gather()
+        except Exception:
+            await pc.close()
+            raise
+        return pc
+
+    async def _fill_loop(self):
+        # Load aiortc off the event loop (preload_media() may already be at it)
+        await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, 'aiortc')
+        while True:
+            self._wanted.clear()
+            try:
+                while self._ready and time.monotonic() - self._ready[0][0] > self.max_age:
+                    await self._ready.popleft()[1].close()
+                # Gathered side by side, so a slow STUN server costs one timeout, not one each
+                missing = self.size - len(self._ready)
+                for pc in await asyncio.gather(*(self._prepare() for _ in range(missing))):
+                    self._ready.append((time.monotonic(), pc))
+            except Exception as e:
+                logger.error(f"❌ Error pre-gathering a peer connection: {e}")
+            try:
+                await asyncio.wait_for(self._wanted.wait(), self.max_age / 3)
+            except asyncio.TimeoutError:
+                pass
+
+    def take(self):
+        """The newest pre-gathered peer, or a fresh one if none is ready"""
+        from aiortc import RTCPeerConnection
+        self._wanted.set()
+        if self._ready:
+            self.hits += 1
+            return self._ready.pop()[1]
+        self.misses += 1
+        return RTCPeerConnection(rtc_configuration())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        while self._ready:
+            await self._ready.pop()[1].close()
+
+    def status(self):
+        return {'ready': len(self._ready), 'size': self.size, 'hits': self.hits, 'misses': self.misses}
+
+peer_pool = PeerPool(PREWARM_PEERS if FAST_JOIN else 0)
+
+class TelemetryHub:
+    """Device-agent telemetry fanned out to every peer's "telemetry" data channel
+
+    The device agent (dhttemp.py) POSTs sensor values and control
+    acknowledgements to /telemetry as they happen. Values are merged per
+    source, so a burst of updates to one value collapses into its latest
+    reading, while events are kept in order. At most one message goes out
+    per TELEMETRY_TICK: a change after a quiet spell is sent at once, and
+    changes arriving within a tick of the last message wait for the next
+    one together. Each message is serialized once for all channels. A
+    channel gets the whole current state as soon as it opens.
+
+      {"type": "telemetry", "seq": n, "t": wall-clock seconds, "snapshot": bool,
+       "values": {source: {name: value}}, "events": [{"source": source, ...}]}
+    """
+    def __init__(self, tick=TELEMETRY_TICK):
+        self.tick = tick
+        self.state = {}  # source -> {name: value}, everything received so far
+        self.channels = set()
+        self.updates = 0
+        self.messages_sent = 0
+        self.events_dropped = 0
+        self.delivery = Histogram()  # Update received to message sent
+        self._pending = {}
+        self._events = []
+        self._oldest = None
+        self._last_flush = 0.0
+        self._seq = 0
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def update(self, source, values=None, events=None):
+        if values:
+            self.state.setdefault(source, {}).update(values)
+            self._pending.setdefault(source, {}).update(values)
+        self._events.extend({'source': source, **event} for event in events or ())
+        if len(self._events) > TELEMETRY_MAX_EVENTS:
+            self.events_dropped += len(self._events) - TELEMETRY_MAX_EVENTS
+            del self._events[:-TELEMETRY_MAX_EVENTS]
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self.updates += 1
+        self._changed.set()
+
+    def attach(self, channel):
+        self.channels.add(channel)
+
+        def send_snapshot():
+            self._send(channel, json.dumps(self._message(self.state, [], snapshot=True)))
+
+        if channel.readyState == 'open':
+            send_snapshot()
+        else:
+            channel.on('open', send_snapshot)
+        channel.on('close', lambda: self.channels.discard(channel))
+
+    def _message(self, values, events, snapshot=False):
+        self._seq += 1
+        return {
+            'type': 'telemetry', 'seq': self._seq, 't': time.time(),
+            'snapshot': snapshot, 'values': values, 'events': events,
+        }
+
+    def _send(self, channel, payload):
+        if channel.readyState == 'open':
+            channel.send(payload)
+
+    async def _flush_loop(self):
+        while True:
+            await self._changed.wait()
+            # Changes that arrive while we wait for the tick ride along
+            await asyncio.sleep(max(self._last_flush + self.tick - time.monotonic(), 0))
+            payload = json.dumps(self._message(self._pending, self._events))
+            for channel in list(self.channels):
+                self._send(channel, payload)
+            now = time.monotonic()
+            self.delivery.observe(now - self._oldest)
+            self.messages_sent += 1
+            self._pending, self._events, self._oldest = {}, [], None
+            self._last_flush = now
+            self._changed.clear()
+
+    def status(self):
+        return {
+            'channels': sum(1 for channel in self.channels if channel.readyState == 'open'),
+            'sources': sorted(self.state),
+            'updates': self.updates,
+            'messages_sent': self.messages_sent,
+            'events_dropped': self.events_dropped,
+        }
+
+telemetry = TelemetryHub()
+encoder_budget = EncoderBudget()
+
+async def poster_fields(feed):
+    """Answer fields that let the client show the camera's last frame until video starts"""
+    fields = {'posterUrl': f"/snapshot.jpg?cameraId={feed.id}"}
+    try:
+        data = await feed.poster()
+    except Exception as e:
+        logger.warning(f"⚠️  No poster for camera {feed.id}: {e}")
+        return fields
+    if data is not None and len(data) <= POSTER_MAX_BYTES:
+        fields['poster'] = 'data:image/jpeg;base64,' + base64.b64encode(data).decode('ascii')
+    return fields
+
+async def negotiate(device_id, data):
+    """Create a session for an offer and return the answer"""
+    feed = get_camera(data.get('cameraId'))
+    logger.info(f"📨 Received offer from device: {device_id} (camera {feed.id})")
+
+    # Workers only hold I420 planes, so their front end adds the poster instead
+    poster = None
+    if FAST_JOIN and PROCESS_ROLE == 'single':
+        poster = asyncio.ensure_future(poster_fields(feed))
+
+    # Take a peer connection whose candidates are already gathered
+    pc = peer_pool.take()
+    session = Session(device_id, pc, SignalingChannel(), feed.id)
+    try:
+        await sessions.add(session)
+    except SessionLimitError:
+        if poster is not None:
+            poster.cancel()
+        await pc.close()
+        raise
+    try:
+        return await answer_offer(session, feed, data, poster)
+    except Exception:
+        # A bad offer must not hold a session slot, a viewer or the peer until the idle sweep
+        if poster is not None:
+            poster.cancel()
+        await sessions.evict(session, 'failed')
+        raise
+
+async def answer_offer(session, feed, data, poster=None):
+    """Attach the video track to a registered session and negotiate its answer"""
+    from aiortc import RTCSessionDescription
+    from webrtc_media import LocalVideoTrack, RelayVideoTrack, prefer_codecs, prefer_h264
+    device_id, pc, channel = session.device_id, session.pc, session.channel
+
+    # Add video track
+    logger.info(f"🎥 Adding video track for {device_id}")
+
+    # Relay the shared encoder output when the client can receive H.264,
+    # otherwise fall back to a per-peer encoder
+    ladder = feed.quality_ladder()
+    rung = ladder[0]
+    if RELAY_MODE and 'H264' in data['sdp']:
+        video_track = session.track = RelayVideoTrack(feed, rung)
+        video_sender = pc.addTrack(video_track)
+        prefer_h264(pc)
+        # Forward picture loss indications to whichever shared encoder the track uses
+        if has_sender_internals(video_sender, 'keyframe requests from viewers', '_send_keyframe'):
+            video_sender._send_keyframe = lambda: video_track.encoder.request_keyframe()
+    else:
+        video_track = session.track = LocalVideoTrack(feed, rung)
+        video_sender = pc.addTrack(video_track)
+        prefer_codecs(pc, encoder_budget.profile['codecs'])
+    session.controller = QualityController(device_id, video_sender, video_track, ladder)
+    session.latency = LatencyProbe(feed)
+    session.latency.watch(video_sender, video_track)
+
+    @pc.on("datachannel")
+    def on_datachannel(data_channel):
+        if data_channel.label == LATENCY_CHANNEL:
+            session.latency.attach(data_channel)
+
+    @video_track.on("first_frame")
+    def on_first_frame():
+        join_stats.observe('first_frame', time.monotonic() - session.created)
+
+    # Handle connection state changes
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        logger.info(f"🔗 Connection state for {device_id}: {pc.connectionState}")
+        session.touch()
+        if pc.connectionState == 'connected':
+            # Start adapting quality to the link
+            session.controller.start()
+        elif pc.connectionState == 'failed':
+            # Close the peer too: once out of the registry the sweep can no longer reach it
+            await sessions.evict(session, 'failed')
+        elif pc.connectionState == 'closed':
+            video_track.stop()
+            session.controller.stop()
+            session.latency.stop()
+            sessions.remove(session)
+
+    # Set remote description (offer)
+    offer = RTCSessionDescription(sdp=data['sdp'], type='offer')
+    await pc.setRemoteDescription(offer)
+
+    # Every client that negotiated data channels (any channel in its offer) gets telemetry
+    if 'm=application' in data['sdp']:
+        telemetry.attach(pc.createDataChannel(TELEMETRY_CHANNEL))
+
+    # Create answer
+    answer = await pc.createAnswer()
+    await pc.setLocalDescription(answer)
+
+    answer = {
+        'type': 'answer',
+        'sdp': pc.localDescription.sdp,
+        'sessionId': session.id,
+        'cameraId': feed.id,
+    }
+    if poster is not None:
+        answer.update(await poster)
+    join_stats.observe('answer', time.monotonic() - session.created)
+    logger.info(f"✅ Answer created for {device_id} (session {session.id[:8]})")
+
+    # Store answer for polling
+    await channel.set_answer(answer)
+    return answer
+
+async def add_remote_candidate(session, candidate_data):
+    """Add a client ICE candidate to the session's peer connection"""
+    if session is not None and candidate_data and candidate_data.get('candidate'):
+        session.touch()
+        await session.pc.addIceCandidate(candidate_from_json(candidate_data))
+        logger.info(f"🧊 ICE candidate added for {session.device_id}")
 
 async def handle_offer(request):
     """Handle WebRTC offer from client"""
@@ -92,88 +2388,14 @@ async def handle_offer(request):
         data = await request.json()
         device_id = data.get('deviceId', 'unknown')
         
-        logger.info(f"📨 Received offer from device: {device_id}")
-        
-        # Create peer connection
-        pc = RTCPeerConnection()
-        pcs[device_id] = pc
-        
-        # Add video track
-        logger.info(f"🎥 Adding video track for {device_id}")
-        
-        class LocalVideoTrack(VideoStreamTrack):
-            """A video track that returns frames from the webcam"""
-            async def recv(self):
-                pts, time_base = await self.next_timestamp()
-                frame = video_capture.read_frame()
-                if frame is not None:
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    video_frame = VideoFrame.from_ndarray(frame_rgb, format="rgb24")
-                    video_frame.pts = pts
-                    video_frame.time_base = time_base
-                    return video_frame
-                else:
-                    # Return a black frame if no frame available
-                    black_frame = VideoFrame.from_ndarray(
-                        cv2.cvtColor(
-                            cv2.imread('placeholder.png') or cv2.zeros((720, 1280, 3), dtype='uint8'),
-                            cv2.COLOR_BGR2RGB
-                        ),
-                        format="rgb24"
-                    )
-                    black_frame.pts = pts
-                    black_frame.time_base = time_base
-                    return black_frame
-        
-        video_track = LocalVideoTrack()
-        pc.addTrack(video_track)
-        
-        # Handle ICE candidates
-        @pc.on("icecandidate")
-        async def on_icecandidate(candidate):
-            if candidate:
-                logger.info(f"🧊 New ICE candidate for {device_id}")
-                signaling_data[device_id]['candidates'].append({
-                    'candidate': candidate.candidate,
-                    'sdpMLineIndex': candidate.sdpMLineIndex,
-                    'sdpMid': candidate.sdpMid,
-                })
-        
-        # Handle connection state changes
-        @pc.on("connectionstatechange")
-        async def on_connectionstatechange():
-            logger.info(f"🔗 Connection state for {device_id}: {pc.connectionState}")
-            if pc.connectionState == 'connected':
-                # Start sending video frames
-                asyncio.create_task(send_video_frames(pc, device_id))
-            elif pc.connectionState in ['failed', 'closed']:
-                if device_id in pcs:
-                    del pcs[device_id]
-                if device_id in signaling_data:
-                    del signaling_data[device_id]
-        
-        # Set remote description (offer)
-        offer = RTCSessionDescription(sdp=data['sdp'], type='offer')
-        await pc.setRemoteDescription(offer)
-        
-        # Create answer
-        answer = await pc.createAnswer()
-        await pc.setLocalDescription(answer)
-        
-        logger.info(f"✅ Answer created for {device_id}")
-        
-        # Store answer for polling
-        signaling_data[device_id]['answer'] = {
-            'sdp': pc.localDescription.sdp,
-            'type': 'answer'
-        }
-        
         # Return answer immediately
-        return web.json_response({
-            'type': 'answer',
-            'sdp': pc.localDescription.sdp,
-        })
+        return web.json_response(await negotiate(device_id, data))
     
+    except SessionLimitError as e:
+        logger.warning(f"⚠️  Rejected offer from {device_id}: {e}")
+        return web.json_response({'error': str(e)}, status=503)
+    except UnknownCameraError as e:
+        return web.json_response({'error': str(e), 'cameras': list(cameras)}, status=404)
     except Exception as e:
         logger.error(f"❌ Error handling offer: {e}")
         return web.json_response({'error': str(e)}, status=400)
@@ -182,20 +2404,11 @@ async def handle_ice_candidate(request):
     """Handle ICE candidate from client"""
     try:
         data = await request.json()
-        device_id = data.get('deviceId', 'unknown')
+        session = sessions.lookup(
+            data.get('sessionId'), data.get('deviceId', 'unknown'), data.get('cameraId')
+        )
         
-        if device_id in pcs:
-            pc = pcs[device_id]
-            candidate_data = data.get('candidate', {})
-            
-            candidate = RTCIceCandidate(
-                candidate=candidate_data.get('candidate'),
-                sdpMLineIndex=candidate_data.get('sdpMLineIndex'),
-                sdpMid=candidate_data.get('sdpMid'),
-            )
-            
-            await pc.addIceCandidate(candidate)
-            logger.info(f"🧊 ICE candidate added for {device_id}")
+        await add_remote_candidate(session, data.get('candidate', {}))
         
         return web.json_response({'status': 'ok'})
     
@@ -204,88 +2417,1089 @@ async def handle_ice_candidate(request):
         return web.json_response({'error': str(e)}, status=400)
 
 async def handle_poll(request):
-    """Poll for answer and ICE candidates"""
+    """Poll for the answer, which carries the server's ICE candidates
+
+    With ``?wait=<seconds>`` a request that arrives while the offer is still
+    being negotiated is held open (up to LONG_POLL_MAX) until the answer is
+    ready; once it is, every poll returns straight away.
+    """
     try:
-        device_id = request.query.get('deviceId', 'unknown')
-        
-        response_data = {}
+        session = sessions.lookup(
+            request.query.get('sessionId'), request.query.get('deviceId', 'unknown'),
+            request.query.get('cameraId'),
+        )
+        wait = min(float(request.query.get('wait', 0)), LONG_POLL_MAX)
         
-        # Send answer if available
-        if device_id in signaling_data and signaling_data[device_id]['answer']:
-            response_data.update(signaling_data[device_id]['answer'])
+        if session is None:
+            return web.json_response({})
         
-        # Send ICE candidates
-        if device_id in signaling_data and signaling_data[device_id]['candidates']:
-            response_data['candidates'] = signaling_data[device_id]['candidates']
-            signaling_data[device_id]['candidates'] = []  # Clear after sending
+        session.touch()
+        if wait > 0:
+            await session.channel.wait_for_answer(wait)
         
-        return web.json_response(response_data)
+        return web.json_response(session.channel.poll())
     
     except Exception as e:
         logger.error(f"❌ Error handling poll: {e}")
         return web.json_response({'error': str(e)}, status=400)
 
+async def handle_websocket(request):
+    """WebSocket signaling: offer/answer and the client's trickle ICE over one connection
+
+    Client messages: ``{"type": "offer", "deviceId", "sdp", "cameraId"?}`` and
+    ``{"type": "candidate", "deviceId", "candidate": {...}}``. The server
+    replies with ``{"type": "answer", "sdp"}``, whose SDP already holds all
+    of the server's candidates (see SignalingChannel).
+    """
+    websocket = web.WebSocketResponse(heartbeat=WS_HEARTBEAT)
+    await websocket.prepare(request)
+    device_id = request.query.get('deviceId', 'unknown')
+    session = None
+    logger.info(f"🔌 WebSocket signaling opened for {device_id}")
+
+    try:
+        async for message in websocket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(message.data)
+                device_id = data.get('deviceId', device_id)
+                if data.get('type') == 'offer':
+                    answer = await negotiate(device_id, data)
+                    session = sessions.lookup(answer['sessionId'])
+                    await websocket.send_json(answer)
+                elif data.get('type') == 'candidate':
+                    await add_remote_candidate(session, data.get('candidate'))
+            except Exception as e:
+                logger.error(f"❌ Error handling WebSocket message: {e}")
+                await websocket.send_json({'type': 'error', 'error': str(e)})
+    finally:
+        logger.info(f"🔌 WebSocket signaling closed for {device_id}")
+
+    return websocket
+
 async def handle_health(request):
     """Health check endpoint"""
     return web.json_response({
         'status': 'healthy',
-        'active_connections': len(pcs),
+        'role': PROCESS_ROLE,
+        'active_connections': len(sessions) + (
+            sum(worker.sessions for worker in worker_pool.workers) if worker_pool else 0
+        ),
+        'sessions': sessions.status(),
+        'telemetry': telemetry.status(),
+        'join': {**join_stats.status(), 'prewarmed_peers': peer_pool.status()},
+        'encoder': encoder_budget.status() if PROCESS_ROLE != 'front' else None,
+        'default_camera': DEFAULT_CAMERA,
+        'cameras': {
+            camera_id: {
+                **feed.status(),
+                'peers': {
+                    session.device_id: {**session.controller.status(), 'latency': session.latency.status()}
+                    for session in sessions.sessions.values()
+                    if session.connected and session.camera_id == camera_id
+                },
+            }
+            for camera_id, feed in cameras.items()
+        },
+        'inference': inference_stage.status() if inference_stage else None,
+        'recording': {camera_id: recorder.status() for camera_id, recorder in recorders.items()} or None,
+        'relay_mode': RELAY_MODE,
+        'processes': worker_pool.status() if worker_pool else None,
+        'process_cpu_seconds': round(time.process_time(), 3),
         'timestamp': str(asyncio.get_event_loop().time()),
     })
 
+async def start_capture(app):
+    """Prepare every camera feed; each camera opens when its first viewer arrives"""
+    for feed in cameras.values():
+        feed.start()
+
+def request_camera(request):
+    """The feed named by ?cameraId=, or the default camera"""
+    return get_camera(request.query.get('cameraId'))
+
+async def handle_snapshot(request):
+    """Latest frame as a single JPEG, revalidated with ETag / If-None-Match"""
+    try:
+        feed = request_camera(request)
+    except UnknownCameraError as e:
+        return web.json_response({'error': str(e)}, status=404)
+    captured = await feed.current_frame()
+    captured.retain()
+    try:
+        etag = await frame_etag(feed, captured)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return web.Response(status=304, headers=headers)
+        data = await feed.jpeg_cache.encode(captured)
+    finally:
+        captured.release()
+    return web.Response(body=data, content_type='image/jpeg', headers=headers)
+
+async def handle_mjpeg(request):
+    """multipart/x-mixed-replace stream fed from the shared JPEG cache
+
+    Every write waits for the client to drain, and the next part is always
+    the newest frame, so a slow client skips frames instead of buffering them.
+    """
+    try:
+        feed = request_camera(request)
+    except UnknownCameraError as e:
+        return web.json_response({'error': str(e)}, status=404)
+    jpeg_cache = feed.jpeg_cache
+    response = web.StreamResponse(headers={
+        'Content-Type': f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}',
+        'Cache-Control': 'no-cache, private',
+        'Pragma': 'no-cache',
+    })
+    await response.prepare(request)
+    subscription = feed.bus.subscribe()
+    interval = 1 / MJPEG_FPS
+    feed.add_viewer()
+    jpeg_cache.clients += 1
+    logger.info(f"🖼️ MJPEG client connected to camera {feed.id} ({jpeg_cache.clients} total)")
+    try:
+        while True:
+            started = time.monotonic()
+            captured = await subscription.next_frame(FRAME_TIMEOUT) or fallback_frame(feed.bus)
+            data = await jpeg_cache.encode(captured)
+            await response.write(
+                f'--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                f'Content-Length: {len(data)}\r\n\r\n'.encode() + data + b'\r\n'
+            )
+            await asyncio.sleep(max(started + interval - time.monotonic(), 0))
+    except (ConnectionResetError, ConnectionError):
+        pass
+    finally:
+        feed.remove_viewer()
+        jpeg_cache.clients -= 1
+        logger.info(f"🖼️ MJPEG client disconnected ({jpeg_cache.clients} left)")
+    return response
+
+async def handle_clip_create(request):
+    """Cut a clip around now: pre-roll from the ring buffer plus a post-roll"""
+    if CLIP_FPS <= 0:
+        return web.json_response({'error': 'Clip buffer disabled'}, status=503)
+    try:
+        data = await request.json() if request.can_read_body else {}
+        feed = get_camera(data.get('cameraId'))
+        pre_roll = min(max(float(data.get('preRoll', CLIP_PRE_ROLL)), 0), CLIP_MAX_ROLL)
+        post_roll = min(max(float(data.get('postRoll', CLIP_POST_ROLL)), 0), CLIP_MAX_ROLL)
+    except (ValueError, TypeError, AttributeError):
+        return web.json_response({'error': 'Invalid preRoll/postRoll'}, status=400)
+    except UnknownCameraError as e:
+        return web.json_response({'error': str(e)}, status=404)
+    # An idle camera has no pre-roll to offer, but it records the post-roll
+    feed.hold(post_roll)
+    clip, reused = feed.clip_store.capture(pre_roll, post_roll)
+    return web.json_response({**clip.to_json(), 'reused': reused})
+
+async def handle_clip(request):
+    """Clip metadata with one URL per frame"""
+    clip = find_clip(request.match_info['clip_id'])
+    if clip is None:
+        return web.json_response({'error': 'Unknown clip'}, status=404)
+    info = clip.to_json()
+    info['frameUrls'] = [f"{info['url']}/{index}.jpg" for index in range(len(clip.frames))]
+    return web.json_response(info)
+
+async def handle_clip_frame(request):
+    """One stored JPEG, served as-is (frames never change once captured)"""
+    clip = find_clip(request.match_info['clip_id'])
+    data = clip.frame(request.match_info['frame']) if clip else None
+    if data is None:
+        return web.json_response({'error': 'Unknown clip frame'}, status=404)
+    name = request.match_info['frame']
+    cache = 'no-cache' if name == 'event' and not clip.done else 'public, max-age=86400, immutable'
+    return web.Response(body=data, content_type='image/jpeg', headers={'Cache-Control': cache})
+
+async def start_inference(app):
+    """Start the detection stage when WEBRTC_ML_INFERENCE=1"""
+    global inference_stage
+    if not ML_INFERENCE:
+        return
+    # Imported here so plain streaming does not need requests or the detector
+    from ml_inference import InferenceStage
+    feed = get_camera(ML_CAMERA)
+    feed.add_viewer()  # Detection watches all the time, so this camera never idles
+    inference_stage = InferenceStage(feed.bus, clip_source=alert_clip if feed.clip_store else None)
+    inference_stage.start()
+
+async def start_recording(app):
+    """Record every camera when WEBRTC_RECORD=1
+
+    Recording taps a shared encoder, so it runs where the encoders are: in
+    this process, or in worker 0 in multi-process mode. Any process can
+    answer /recordings from the index files on disk.
+    """
+    if not RECORD or not (PROCESS_ROLE == 'single' or (PROCESS_ROLE == 'worker' and WORKER_INDEX == 0)):
+        return
+    from recorder import SegmentRecorder
+    for feed in cameras.values():
+        ladder = feed.quality_ladder()
+        rung = next((rung for rung in ladder if rung['name'] == RECORD_RUNG), ladder[0])
+        recorder = SegmentRecorder(feed, os.path.join(RECORD_DIR, feed.id), rung)
+        recorder.start()
+        recorders[feed.id] = recorder
+
+recording_indexes = {}  # Camera ID -> read-only SegmentIndex for /recordings
+
+def recording_index(camera_id):
+    """The camera's segment index mapped read-only, or None before anything was recorded"""
+    if camera_id not in recording_indexes:
+        from segment_index import SegmentIndex
+        path = os.path.join(RECORD_DIR, camera_id, 'index.bin')
+        if not os.path.exists(path):
+            return None
+        recording_indexes[camera_id] = SegmentIndex(path)
+    return recording_indexes[camera_id]
+
+def read_file(path):
+    with open(path, 'rb') as segment_file:
+        return segment_file.read()
+
+async def handle_recordings(request):
+    """Recorded segments around a time, as a JSON list or one MPEG-TS stream
+
+    ``?t=`` is wall-clock milliseconds (as in clip JSON, default now),
+    ``before`` / ``after`` are seconds (default RECORD_AROUND each) and
+    ``format=ts`` returns the segments concatenated instead of their URLs.
+    """
+    try:
+        feed = request_camera(request)
+        at = float(request.query.get('t', time.time() * 1000)) / 1000
+        before = min(max(float(request.query.get('before', RECORD_AROUND)), 0), RECORD_MAX_SPAN)
+        after = min(max(float(request.query.get('after', RECORD_AROUND)), 0), RECORD_MAX_SPAN - before)
+    except UnknownCameraError as e:
+        return web.json_response({'error': str(e)}, status=404)
+    except ValueError:
+        return web.json_response({'error': 'Invalid t/before/after'}, status=400)
+    index = recording_index(feed.id)
+    records = index.between(at - before, at + after) if index is not None else []
+    if not records:
+        return web.json_response({'error': f'Nothing recorded around {int(at * 1000)}'}, status=404)
+
+    directory = os.path.join(RECORD_DIR, feed.id)
+    if request.query.get('format') == 'ts':
+        response = web.StreamResponse(headers={'Content-Type': 'video/mp2t', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        loop = asyncio.get_running_loop()
+        for _, _, segment, _ in records:
+            try:
+                data = await loop.run_in_executor(None, read_file, os.path.join(directory, f'{segment:010d}.ts'))
+            except FileNotFoundError:
+                continue  # Deleted for the disk budget since the lookup
+            await response.write(data)
+        await response.write_eof()
+        return response
+
+    url = f"{public_url() or ''}/recordings/{feed.id}"
+    return web.json_response({
+        'cameraId': feed.id,
+        'start': int(records[0][0] * 1000),
+        'end': int(records[-1][1] * 1000),
+        'url': f"{url}?t={int(at * 1000)}&before={before:g}&after={after:g}&format=ts",
+        'segments': [
+            {'url': f"{url}/{segment:010d}.ts", 'start': int(start * 1000), 'end': int(end * 1000), 'bytes': size}
+            for start, end, segment, size in records
+        ],
+    })
+
+async def handle_recording_segment(request):
+    """One recorded segment file (segments never change once indexed)"""
+    camera_id, segment = request.match_info['camera_id'], request.match_info['segment']
+    index = recording_index(camera_id) if camera_id in cameras else None
+    if index is None or not segment.isdigit() or not index.first <= int(segment) < index.next:
+        return web.json_response({'error': 'Unknown segment'}, status=404)
+    path = os.path.join(RECORD_DIR, camera_id, f'{int(segment):010d}.ts')
+    if not os.path.exists(path):
+        return web.json_response({'error': 'Unknown segment'}, status=404)
+    return web.FileResponse(path, headers={
+        'Content-Type': 'video/mp2t', 'Cache-Control': 'public, max-age=86400, immutable',
+    })
+
+def load_media():
+    importlib.import_module('webrtc_media')
+    for feed in cameras.values():
+        feed.ensure_placeholder()
+
+async def preload_media(app):
+    """Load aiortc, av and cv2 in the background so the first peer does not wait for them"""
+    asyncio.get_running_loop().run_in_executor(None, load_media)
+
+def from_device_agent(request):
+    """Whether a request comes straight from this machine, not through a tunnel or proxy"""
+    forwarded = any(header in request.headers for header in ('X-Forwarded-For', 'Cf-Connecting-Ip', 'Forwarded'))
+    return request.remote in ('127.0.0.1', '::1') and not forwarded
+
+async def handle_telemetry_update(request):
+    """Device agent: push sensor values and control acknowledgements to every peer"""
+    if not from_device_agent(request):
+        return web.json_response({'error': 'Telemetry is only accepted from the local device agent'}, status=403)
+    try:
+        data = await request.json()
+        values = data.get('values') or {}
+        events = data.get('events') or []
+        if not isinstance(values, dict) or not isinstance(events, list) \
+                or not all(isinstance(event, dict) for event in events):
+            raise ValueError("Expected {'source': ..., 'values': {...}, 'events': [{...}]}")
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=400)
+    telemetry.update(str(data.get('source', 'device')), values, events)
+    if worker_pool:
+        # Peers live in the workers; each keeps its own hub
+        worker_pool.broadcast('POST', '/telemetry', json=data)
+    return web.json_response({'status': 'ok'})
+
+async def handle_telemetry(request):
+    """Latest telemetry values, for clients without a data channel"""
+    return web.json_response({'values': telemetry.state, 'timestamp': time.time()})
+
+async def start_telemetry(app):
+    """Start flushing telemetry to peers' data channels"""
+    telemetry.start()
+
+async def start_encoder_budget(app):
+    """Start stepping encoder profiles with CPU and encode time where peers are served"""
+    if PROCESS_ROLE != 'front':
+        encoder_budget.start()
+
+async def start_sessions(app):
+    """Start expiring idle sessions and pre-gathering peers where offers are answered"""
+    sessions.start()
+    if PROCESS_ROLE != 'front':
+        peer_pool.start()
+
+def render_metrics():
+    """Build the /metrics page from live pipeline, encoder and session state"""
+    writer = MetricsWriter()
+    feeds = list(cameras.values())
+    # One sample per camera; cameras that are not capturing report 0
+    per_camera = lambda value: [
+        ({'camera': feed.id}, value(feed.pipeline) if feed.pipeline else 0) for feed in feeds
+    ]
+    writer.metric('webrtc_capture_fps', 'gauge', 'Measured camera capture rate',
+                  per_camera(lambda pipeline: round(pipeline.fps, 2)))
+    writer.metric('webrtc_capture_frames_total', 'counter', 'Frames read from the camera',
+                  per_camera(lambda pipeline: pipeline.frames))
+    writer.metric('webrtc_capture_dropped_frames_total', 'counter', 'Frames dropped between capture stages',
+                  per_camera(lambda pipeline: pipeline.dropped_frames))
+    writer.metric('webrtc_frame_buffers', 'gauge', 'Pooled capture frame buffers', [
+        sample for feed in feeds if feed.pipeline for sample in (
+            ({'camera': feed.id, 'state': 'allocated'}, feed.pipeline.pool.allocated),
+            ({'camera': feed.id, 'state': 'free'}, len(feed.pipeline.pool.free)),
+        )
+    ])
+    writer.metric('webrtc_scaled_frames_total', 'counter', 'Frames scaled to each output size, once per frame however many peers use it', [
+        ({'camera': feed.id, 'size': f'{width}x{height}'}, count)
+        for feed in feeds if feed.pipeline for (width, height), count in feed.pipeline.pool.scaled.snapshot().items()
+    ])
+    writer.metric('webrtc_camera_reconnects_total', 'counter', 'Times the camera was reopened', [
+        ({'camera': feed.id}, feed.camera.reconnects) for feed in feeds
+    ])
+    writer.metric('webrtc_camera_open', 'gauge', 'Whether the camera is capturing (it is released when idle)', [
+        ({'camera': feed.id}, int(feed.pipeline is not None)) for feed in feeds
+    ])
+    writer.metric('webrtc_camera_viewers', 'gauge', 'Tracks, MJPEG clients and other consumers of the camera', [
+        ({'camera': feed.id}, feed.viewers) for feed in feeds
+    ])
+    gates = [(feed, feed.pipeline.motion_gate) for feed in feeds
+             if feed.pipeline and feed.pipeline.motion_gate]
+    if gates:
+        writer.metric('webrtc_motion_score', 'gauge', 'Mean grey-level change since the last published frame', [
+            ({'camera': feed.id}, round(gate.score, 3)) for feed, gate in gates
+        ])
+        writer.metric('webrtc_motion_active', 'gauge', '1 while publishing at full rate, 0 while idle', [
+            ({'camera': feed.id}, int(gate.active)) for feed, gate in gates
+        ])
+        writer.metric('webrtc_motion_gated_frames_total', 'counter', 'Frames held back by the motion gate', [
+            ({'camera': feed.id}, gate.gated_frames) for feed, gate in gates
+        ])
+    writer.histogram('webrtc_capture_interval_seconds', 'Time between captured frames', [
+        ({'camera': feed.id}, feed.pipeline.capture_interval) for feed in feeds if feed.pipeline
+    ])
+    writer.histogram('webrtc_capture_to_send_seconds', 'Capture time to hand-off to the RTP sender', [
+        ({'camera': feed.id}, feed.capture_to_send) for feed in feeds
+    ])
+    writer.histogram('webrtc_glass_to_glass_seconds', 'Capture to client render per stage, from peers echoing render times', [
+        ({'camera': feed.id, 'stage': stage}, histogram)
+        for feed in feeds for stage, histogram in feed.latency.items()
+    ])
+    writer.histogram('webrtc_event_loop_lag_seconds', 'Event loop scheduling delay', [
+        ({}, loop_lag),
+    ])
+
+    encoders = [
+        ({'camera': feed.id, 'encoder': name}, encoder)
+        for feed in feeds for name, encoder in feed.shared_encoders.items()
+    ]
+    writer.histogram('webrtc_shared_encode_seconds', 'Shared encoder time per frame', [
+        (labels, encoder.encode_time) for labels, encoder in encoders
+    ])
+    writer.metric('webrtc_shared_encoder_bytes_total', 'counter', 'Bytes produced by shared encoders', [
+        (labels, encoder.bytes_encoded) for labels, encoder in encoders
+    ])
+    writer.metric('webrtc_shared_encoder_subscribers', 'gauge', 'Peers relayed from each shared encoder', [
+        (labels, len(encoder.subscribers)) for labels, encoder in encoders
+    ])
+    writer.metric('webrtc_shared_encoder_gop_replays_total', 'counter', 'Viewers started from the cached GOP instead of a forced keyframe', [
+        (labels, encoder.gop_replays) for labels, encoder in encoders
+    ])
+
+    status = sessions.status()
+    writer.metric('webrtc_sessions', 'gauge', 'Sessions in the registry', [
+        ({'state': 'active'}, status['active']),
+        ({'state': 'connected'}, status['connected']),
+    ])
+    writer.metric('webrtc_session_evictions_total', 'counter', 'Sessions evicted from the registry', [
+        ({'reason': reason}, count) for reason, count in status['evictions'].items()
+    ])
+    writer.metric('webrtc_telemetry_channels', 'gauge', 'Open telemetry data channels', [
+        ({}, telemetry.status()['channels']),
+    ])
+    writer.metric('webrtc_telemetry_messages_total', 'counter', 'Coalesced telemetry messages sent', [
+        ({}, telemetry.messages_sent),
+    ])
+    writer.histogram('webrtc_telemetry_delivery_seconds', 'Telemetry update received to message sent', [
+        ({}, telemetry.delivery),
+    ])
+    writer.histogram('webrtc_time_to_answer_seconds', 'Offer received to answer ready', [
+        ({}, join_stats.histograms['answer']),
+    ])
+    writer.histogram('webrtc_time_to_first_frame_seconds', 'Offer received to first frame handed to the RTP sender', [
+        ({}, join_stats.histograms['first_frame']),
+    ])
+    if PROCESS_ROLE != 'front':
+        writer.metric('webrtc_encoder_profile', 'gauge', 'Encoder profile in use (1 for the current one)', [
+            ({'profile': profile['name']}, int(profile is encoder_budget.profile)) for profile in ENCODER_PROFILES
+        ])
+        writer.metric('webrtc_encoder_profile_changes_total', 'counter', 'Encoder profile steps by direction', [
+            ({'direction': direction}, count) for direction, count in encoder_budget.changes.items()
+        ])
+        writer.metric('webrtc_encoder_cpu_share', 'gauge', 'Process CPU as a share of all cores at the last budget check', [
+            ({}, round(encoder_budget.cpu or 0.0, 4)),
+        ])
+        writer.metric('webrtc_encoder_load', 'gauge', 'Busiest encoder time per frame as a share of its frame interval', [
+            ({}, round(encoder_budget.encode_load or 0.0, 4)),
+        ])
+    pool = peer_pool.status()
+    writer.metric('webrtc_prewarmed_peers', 'gauge', 'Peer connections ready with candidates gathered', [
+        ({}, pool['ready']),
+    ])
+    writer.metric('webrtc_prewarmed_peer_takes_total', 'counter', 'Offers answered from a pre-gathered peer or a fresh one', [
+        ({'result': 'hit'}, pool['hits']),
+        ({'result': 'miss'}, pool['misses']),
+    ])
+
+    peers = [s for s in sessions.sessions.values() if s.connected and s.controller]
+    peer_samples = lambda value: [
+        ({'camera': s.camera_id, 'peer': s.device_id}, value(s)) for s in peers
+    ]
+    writer.metric('webrtc_peer_sent_fps', 'gauge', 'Measured output frame rate per peer',
+                  peer_samples(lambda s: s.track.pacer.stats()['output_fps']))
+    writer.metric('webrtc_peer_sent_frames_total', 'counter', 'Frames handed to the sender per peer',
+                  peer_samples(lambda s: s.track.pacer.sent_frames))
+    writer.metric('webrtc_peer_late_frames_total', 'counter', 'Frames dropped as late per peer',
+                  peer_samples(lambda s: s.track.pacer.late_frames))
+    writer.metric('webrtc_peer_sent_bytes_total', 'counter', 'RTP bytes sent per peer',
+                  peer_samples(lambda s: s.controller.bytes_sent))
+    writer.metric('webrtc_peer_encode_seconds_total', 'counter',
+                  'Per-peer encoder time (0 for relayed peers, see webrtc_shared_encode_seconds)',
+                  peer_samples(lambda s: round(s.controller.encode_seconds, 6)))
+
+    writer.metric('webrtc_mjpeg_clients', 'gauge', 'Connected /mjpeg clients', [
+        ({'camera': feed.id}, feed.jpeg_cache.clients) for feed in feeds
+    ])
+    writer.metric('webrtc_jpeg_encoded_frames_total', 'counter', 'Frames JPEG-encoded for /mjpeg, snapshots and clips', [
+        ({'camera': feed.id}, feed.jpeg_cache.encoded_frames) for feed in feeds
+    ])
+    writer.histogram('webrtc_jpeg_encode_seconds', 'JPEG encode time per frame', [
+        ({'camera': feed.id}, feed.jpeg_cache.encode_time) for feed in feeds
+    ])
+
+    clip_feeds = [feed for feed in feeds if feed.clip_store]
+    if clip_feeds:
+        writer.metric('webrtc_clip_buffer_bytes', 'gauge', 'JPEG bytes held in the pre-event ring buffer', [
+            ({'camera': feed.id}, feed.clip_buffer.bytes) for feed in clip_feeds
+        ])
+        writer.metric('webrtc_clip_buffer_seconds', 'gauge', 'Seconds of video held in the ring buffer', [
+            ({'camera': feed.id}, round(feed.clip_buffer.seconds, 2)) for feed in clip_feeds
+        ])
+        writer.metric('webrtc_clips', 'gauge', 'Clips held in the clip store', [
+            ({'camera': feed.id}, len(feed.clip_store.clips)) for feed in clip_feeds
+        ])
+        writer.metric('webrtc_clips_reused_total', 'counter', 'Clip requests answered with an already-recording clip', [
+            ({'camera': feed.id}, feed.clip_store.reused) for feed in clip_feeds
+        ])
+
+    if recorders:
+        writer.metric('webrtc_recording_bytes', 'gauge', 'Bytes of recorded segments kept on disk', [
+            ({'camera': camera_id}, recorder.bytes) for camera_id, recorder in recorders.items()
+        ])
+        writer.metric('webrtc_recording_segments', 'gauge', 'Recorded segments kept on disk', [
+            ({'camera': camera_id}, len(recorder.index)) for camera_id, recorder in recorders.items()
+        ])
+        writer.metric('webrtc_recording_segments_deleted_total', 'counter', 'Segments deleted to stay within the disk budget', [
+            ({'camera': camera_id}, recorder.segments_deleted) for camera_id, recorder in recorders.items()
+        ])
+        writer.metric('webrtc_recording_dropped_packets_total', 'counter', 'Packets dropped because the disk fell behind', [
+            ({'camera': camera_id}, recorder.dropped_packets) for camera_id, recorder in recorders.items()
+        ])
+
+    if inference_stage:
+        status = inference_stage.status()
+        writer.metric('webrtc_inference_frames_total', 'counter', 'Frames run through the detector', [
+            ({}, status['frames_inferred']),
+        ])
+        writer.metric('webrtc_inference_batches_total', 'counter', 'Detector micro-batches completed', [
+            ({}, status['batches']),
+        ])
+        writer.metric('webrtc_inference_seconds_total', 'counter', 'Wall time spent waiting on detector batches', [
+            ({}, round(inference_stage.infer_seconds, 6)),
+        ])
+        writer.metric('webrtc_inference_alerts_total', 'counter', 'Alerts posted to receiveMLAlertBatch', [
+            ({'result': 'sent'}, status['alerts_sent']),
+            ({'result': 'failed'}, status['alerts_failed']),
+        ])
+
+    if any(feed.ring is not None for feed in feeds):
+        writer.metric('webrtc_ring_torn_reads_total', 'counter',
+                      'Shared-memory frames skipped because the slot was reused mid-copy', [
+            ({'camera': feed.id}, feed.ring.torn_reads) for feed in feeds if feed.ring is not None
+        ])
+    if worker_pool:
+        workers = worker_pool.workers
+        writer.metric('webrtc_worker_up', 'gauge', 'Whether the worker process answered its last health check', [
+            ({'worker': str(worker.index)}, int(worker.alive)) for worker in workers
+        ])
+        writer.metric('webrtc_worker_sessions', 'gauge', 'Sessions reported by each worker process', [
+            ({'worker': str(worker.index)}, worker.sessions) for worker in workers
+        ])
+        writer.metric('webrtc_worker_cpu_seconds_total', 'counter', 'CPU time reported by each worker process', [
+            ({'worker': str(worker.index)}, worker.cpu_seconds) for worker in workers
+        ])
+        writer.metric('webrtc_worker_restarts_total', 'counter', 'Worker processes respawned after exiting', [
+            ({'worker': str(worker.index)}, worker.restarts) for worker in workers
+        ])
+
+    writer.metric('process_cpu_seconds_total', 'counter', 'User and system CPU time of this process', [
+        ({}, round(time.process_time(), 3)),
+    ])
+    return writer.render()
+
+async def handle_metrics(request):
+    """Prometheus text exposition endpoint"""
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+    )
+
+async def monitor_loop_lag():
+    """Measure how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag.observe(max(loop.time() - started - LOOP_LAG_INTERVAL, 0))
+
+async def start_monitoring(app):
+    """Start the event-loop lag probe"""
+    global loop_lag_task
+    loop_lag_task = asyncio.create_task(monitor_loop_lag())
+
 async def cleanup(app):
     """Cleanup on shutdown"""
     logger.info("🛑 Shutting down...")
-    for device_id, pc in pcs.items():
-        await pc.close()
-    video_capture.close()
+    if loop_lag_task:
+        loop_lag_task.cancel()
+    await sessions.close_all()
+    await peer_pool.close()
+    await telemetry.stop()
+    encoder_budget.stop()
+    if inference_stage:
+        await inference_stage.stop()
+    for recorder in recorders.values():
+        await recorder.stop()
+    for index in recording_indexes.values():
+        index.close()
+    for feed in cameras.values():
+        await feed.stop()
+    if worker_pool:
+        await worker_pool.stop()
 
-async def main():
-    """Start WebRTC server"""
-    
-    # CORS middleware
-    @web.middleware
-    async def cors_middleware(request, handler):
-        if request.method == 'OPTIONS':
-            # Handle preflight request - return 200 OK
-            response = web.Response(status=200)
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-            return response
-        else:
-            response = await handler(request)
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-            return response
-    
+def fit_to_ring(captured, ring):
+    """Image and I420 planes of a frame at the ring's geometry"""
+    if captured.image.shape == ring.image_shape:
+        return captured.image, captured.yuv
+    image = cv2.resize(captured.image, (ring.width, ring.height))
+    return image, convert_frame(image)
+
+def write_ring_frame(ring, captured):
+    image, yuv = fit_to_ring(captured, ring)
+    ring.write(image, yuv, captured.timestamp, captured.read_started)
+
+async def feed_ring(feed, ring):
+    """Copy every frame published on a feed's bus into its shared ring"""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ring')
+    subscription = feed.bus.subscribe()
+    try:
+        while True:
+            captured = await subscription.next_frame(timeout=FRAME_TIMEOUT)
+            ring.set_camera_status(feed.camera.state, feed.camera.reconnects)
+            if captured is None:
+                continue
+            captured.retain()
+            try:
+                await loop.run_in_executor(executor, write_ring_frame, ring, captured)
+            finally:
+                captured.release()
+    finally:
+        executor.shutdown(wait=True)
+
+def stop_on_sigterm(stop):
+    """Set ``stop`` on SIGTERM (the worker pool terminates children that way)"""
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, RuntimeError):
+        pass  # No signal handlers on Windows event loops
+
+def attach_rings(ring_specs):
+    """Point every feed at the ring the front end created for it"""
+    for camera_id, (name, width, height, lock) in ring_specs.items():
+        cameras[camera_id].ring = FrameRing(name, width, height, lock)
+
+async def capture_main(ring_specs):
+    """Capture process: run every camera's pipeline and publish frames to its ring"""
+    stop = asyncio.Event()
+    stop_on_sigterm(stop)
+    rings = {camera_id: FrameRing(name, width, height, lock)
+             for camera_id, (name, width, height, lock) in ring_specs.items()}
+    tasks = []
+    for camera_id, ring in rings.items():
+        feed = cameras[camera_id]
+        feed.start()
+        tasks.append(asyncio.create_task(feed_ring(feed, ring)))
+    logger.info(f"📸 Capture process writing {', '.join(rings)} to shared memory")
+    try:
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for feed in cameras.values():
+            await feed.stop()
+        for ring in rings.values():
+            ring.close()
+
+def run_capture_process(ring_specs):
+    """Entry point of the capture process"""
+    global PROCESS_ROLE
+    PROCESS_ROLE = 'capture'
+    try:
+        asyncio.run(capture_main(ring_specs))
+    except KeyboardInterrupt:
+        pass
+
+def run_worker_process(index, port, ring_specs):
+    """Entry point of worker ``index``: serves peers on 127.0.0.1:``port`` from the rings"""
+    global PROCESS_ROLE, WORKER_INDEX
+    PROCESS_ROLE = 'worker'
+    WORKER_INDEX = index
+    attach_rings(ring_specs)
+    logger.info(f"👷 Worker {index} serving peers on port {port}")
+    try:
+        asyncio.run(serve('worker', '127.0.0.1', port))
+    except KeyboardInterrupt:
+        pass
+
+class NoWorkerError(Exception):
+    """Raised when an offer arrives and no worker process is up"""
+
+class WorkerHandle:
+    """The front end's view of one worker process and its last reported load"""
+    def __init__(self, index, port):
+        self.index = index
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = None
+        self.alive = False
+        self.sessions = 0
+        self.connected = 0
+        self.assigned = 0  # Offers routed here since the last load report
+        self.cpu_seconds = 0.0
+        self.restarts = 0
+        self.join = None
+        self.encoder = None
+
+    @property
+    def load(self):
+        return self.sessions + self.assigned
+
+    def status(self):
+        return {
+            'port': self.port,
+            'pid': self.process.pid if self.process else None,
+            'alive': self.alive,
+            'sessions': self.sessions,
+            'connected': self.connected,
+            'cpu_seconds': self.cpu_seconds,
+            'restarts': self.restarts,
+            'join': self.join,
+            'encoder': self.encoder,
+        }
+
+class WorkerPool:
+    """Capture and worker processes behind the signaling front end
+
+    Creates one FrameRing per camera, spawns the capture process that fills
+    them and WORKERS worker processes that serve peers from them. Offers go
+    to the live worker with the fewest sessions, counting offers routed
+    since its last load report, and later candidate and poll requests for
+    the session follow it there. Dead children are respawned.
+    """
+    def __init__(self, count=WORKERS, base_port=WORKER_BASE_PORT):
+        self.workers = [WorkerHandle(index, base_port + index) for index in range(count)]
+        self.rings = {}
+        self.ring_specs = {}
+        self.capture_process = None
+        self.capture_restarts = 0
+        self.routes = OrderedDict()  # sessionId or (deviceId, cameraId) -> WorkerHandle
+        self.http = None
+        self._broadcasts = set()
+        self._context = multiprocessing.get_context('spawn')
+        self._monitor = None
+
+    def start(self):
+        for index, feed in enumerate(cameras.values()):
+            name = f"webrtc_{os.getpid()}_{index}"
+            lock = self._context.Lock()
+            feed.ring = FrameRing(name, feed.width, feed.height, lock, create=True)
+            self.rings[feed.id] = feed.ring
+            self.ring_specs[feed.id] = (name, feed.width, feed.height, lock)
+        self._spawn_capture()
+        for worker in self.workers:
+            self._spawn(worker)
+        self.http = aiohttp.ClientSession()
+        self._monitor = asyncio.create_task(self._monitor_loop())
+        logger.info(f"👷 Started capture process and {len(self.workers)} workers")
+
+    def _spawn_capture(self):
+        self.capture_process = self._context.Process(
+            target=run_capture_process, args=(self.ring_specs,), name='webrtc-capture', daemon=True
+        )
+        self.capture_process.start()
+
+    def _spawn(self, worker):
+        worker.process = self._context.Process(
+            target=run_worker_process, args=(worker.index, worker.port, self.ring_specs),
+            name=f'webrtc-worker-{worker.index}', daemon=True,
+        )
+        worker.process.start()
+        worker.alive = False
+
+    async def _monitor_loop(self):
+        while True:
+            if not self.capture_process.is_alive():
+                logger.warning(f"⚠️  Capture process exited ({self.capture_process.exitcode}), restarting")
+                self.capture_restarts += 1
+                self._spawn_capture()
+            await asyncio.gather(*(self._check(worker) for worker in self.workers))
+            ready = all(worker.alive for worker in self.workers)
+            await asyncio.sleep(WORKER_POLL_INTERVAL if ready else WORKER_START_POLL)
+
+    async def _check(self, worker):
+        if not worker.process.is_alive():
+            logger.warning(f"⚠️  Worker {worker.index} exited ({worker.process.exitcode}), restarting")
+            worker.restarts += 1
+            self._forget(worker)
+            self._spawn(worker)
+            return
+        try:
+            async with self.http.get(worker.url + '/health', timeout=aiohttp.ClientTimeout(total=5)) as response:
+                health = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            worker.alive = False
+            return
+        if not worker.alive:
+            logger.info(f"👷 Worker {worker.index} ready on port {worker.port}")
+        worker.alive = True
+        worker.sessions = health['sessions']['active']
+        worker.connected = health['sessions']['connected']
+        worker.cpu_seconds = health.get('process_cpu_seconds', 0.0)
+        worker.join = health.get('join')
+        worker.encoder = health.get('encoder')
+        worker.assigned = 0
+
+    def choose(self):
+        """The least-loaded live worker for a new offer"""
+        live = [worker for worker in self.workers if worker.alive]
+        if not live:
+            raise NoWorkerError("No worker process is available")
+        worker = min(live, key=lambda worker: worker.load)
+        worker.assigned += 1
+        return worker
+
+    def remember(self, answer, device_id, worker):
+        """Route later requests for an answered session to the worker that made it"""
+        for key in (answer['sessionId'], (device_id, answer.get('cameraId'))):
+            self.routes[key] = worker
+            self.routes.move_to_end(key)
+        while len(self.routes) > ROUTE_CACHE_SIZE:
+            self.routes.popitem(last=False)
+
+    def route(self, session_id, device_id, camera_id):
+        """The worker holding a session, by sessionId or else by device and camera"""
+        worker = self.routes.get(session_id)
+        if worker is None:
+            worker = self.routes.get((device_id, str(camera_id) if camera_id is not None else DEFAULT_CAMERA))
+        return worker
+
+    def _forget(self, worker):
+        for key in [key for key, routed in self.routes.items() if routed is worker]:
+            del self.routes[key]
+
+    async def forward(self, worker, method, path, **kwargs):
+        """Send a signaling request to a worker, returning (status, JSON body)"""
+        try:
+            async with self.http.request(
+                method, worker.url + path, timeout=aiohttp.ClientTimeout(total=LONG_POLL_MAX + 10), **kwargs
+            ) as response:
+                return response.status, await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"❌ Worker {worker.index} unreachable: {e}")
+            return 502, {'error': f"Worker {worker.index} unreachable"}
+
+    def broadcast(self, method, path, **kwargs):
+        """Send a request to every live worker without waiting for the answers"""
+        for worker in self.workers:
+            if worker.alive:
+                task = asyncio.create_task(self.forward(worker, method, path, **kwargs))
+                self._broadcasts.add(task)
+                task.add_done_callback(self._broadcasts.discard)
+
+    def status(self):
+        return {
+            'capture': {
+                'pid': self.capture_process.pid if self.capture_process else None,
+                'alive': bool(self.capture_process and self.capture_process.is_alive()),
+                'restarts': self.capture_restarts,
+            },
+            'workers': {str(worker.index): worker.status() for worker in self.workers},
+        }
+
+    async def stop(self):
+        if self._monitor:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        if self.http:
+            await self.http.close()
+        children = [worker.process for worker in self.workers] + [self.capture_process]
+        children = [process for process in children if process is not None]
+        for process in children:
+            process.terminate()
+        loop = asyncio.get_running_loop()
+        for process in children:
+            await loop.run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.kill()
+        for ring in self.rings.values():
+            ring.unlink()
+        logger.info("👷 Workers stopped")
+
+async def proxy_offer(request):
+    """Front end: send an offer to the least-loaded worker"""
+    try:
+        data = await request.json()
+        device_id = data.get('deviceId', 'unknown')
+        feed = get_camera(data.get('cameraId'))
+        worker = worker_pool.choose()
+    except UnknownCameraError as e:
+        return web.json_response({'error': str(e), 'cameras': list(cameras)}, status=404)
+    except NoWorkerError as e:
+        return web.json_response({'error': str(e)}, status=503)
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=400)
+    # The worker cannot make the poster (it has no BGR frames), so encode it here meanwhile
+    poster = asyncio.ensure_future(poster_fields(feed)) if FAST_JOIN else None
+    status, answer = await worker_pool.forward(worker, 'POST', '/signal', json=data)
+    if status == 200:
+        worker_pool.remember(answer, device_id, worker)
+        logger.info(f"👷 Offer from {device_id} sent to worker {worker.index}")
+        if poster is not None:
+            answer.update(await poster)
+    elif poster is not None:
+        poster.cancel()
+    return web.json_response(answer, status=status)
+
+async def proxy_ice_candidate(request):
+    """Front end: pass a client candidate to the session's worker"""
+    try:
+        data = await request.json()
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=400)
+    worker = worker_pool.route(data.get('sessionId'), data.get('deviceId', 'unknown'), data.get('cameraId'))
+    if worker is None:
+        return web.json_response({'status': 'ok'})
+    status, body = await worker_pool.forward(worker, 'POST', '/signal/candidate', json=data)
+    return web.json_response(body, status=status)
+
+async def proxy_poll(request):
+    """Front end: poll the session's worker for its answer"""
+    query = request.query
+    worker = worker_pool.route(query.get('sessionId'), query.get('deviceId', 'unknown'), query.get('cameraId'))
+    if worker is None:
+        return web.json_response({})
+    status, body = await worker_pool.forward(worker, 'GET', '/signal', params=dict(query))
+    return web.json_response(body, status=status)
+
+async def proxy_websocket(request):
+    """Front end: relay a signaling WebSocket to the least-loaded worker"""
+    try:
+        worker = worker_pool.choose()
+    except NoWorkerError as e:
+        return web.json_response({'error': str(e)}, status=503)
+    websocket = web.WebSocketResponse(heartbeat=WS_HEARTBEAT)
+    await websocket.prepare(request)
+    device_id = request.query.get('deviceId', 'unknown')
+
+    try:
+        upstream = await worker_pool.http.ws_connect(worker.url + '/ws', params=dict(request.query))
+    except aiohttp.ClientError as e:
+        await websocket.send_json({'type': 'error', 'error': f"Worker {worker.index} unreachable"})
+        await websocket.close()
+        return websocket
+
+    async def client_to_worker():
+        async for message in websocket:
+            if message.type == WSMsgType.TEXT:
+                await upstream.send_str(message.data)
+
+    async def worker_to_client():
+        async for message in upstream:
+            if message.type != WSMsgType.TEXT:
+                continue
+            data = json.loads(message.data)
+            if data.get('type') == 'answer':
+                worker_pool.remember(data, device_id, worker)
+            await websocket.send_str(message.data)
+
+    pumps = [asyncio.create_task(client_to_worker()), asyncio.create_task(worker_to_client())]
+    try:
+        await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for pump in pumps:
+            pump.cancel()
+        await asyncio.gather(*pumps, return_exceptions=True)
+        await upstream.close()
+        await websocket.close()
+    return websocket
+
+async def start_workers(app):
+    """Spawn the capture and worker processes (front end only)"""
+    worker_pool.start()
+
+@web.middleware
+async def cors_middleware(request, handler):
+    if request.method == 'OPTIONS':
+        # Handle preflight request - return 200 OK
+        response = web.Response(status=200)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+        return response
+    else:
+        response = await handler(request)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+        return response
+
+def build_app(role):
+    """The aiohttp app for a process role ('single', 'front' or 'worker')"""
     app = web.Application(middlewares=[cors_middleware])
     
-    # Routes
-    app.router.add_post('/signal', handle_offer)
-    app.router.add_post('/signal/candidate', handle_ice_candidate)
-    app.router.add_get('/signal', handle_poll)
+    # Routes: the front end proxies signaling to workers and serves the rest itself
+    if role == 'front':
+        app.router.add_post('/signal', proxy_offer)
+        app.router.add_post('/signal/candidate', proxy_ice_candidate)
+        app.router.add_get('/signal', proxy_poll)
+        app.router.add_get('/ws', proxy_websocket)
+    else:
+        app.router.add_post('/signal', handle_offer)
+        app.router.add_post('/signal/candidate', handle_ice_candidate)
+        app.router.add_get('/signal', handle_poll)
+        app.router.add_get('/ws', handle_websocket)
     app.router.add_get('/health', handle_health)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_post('/telemetry', handle_telemetry_update)
+    app.router.add_get('/telemetry', handle_telemetry)
+    app.router.add_get('/mjpeg', handle_mjpeg)
+    app.router.add_get('/snapshot.jpg', handle_snapshot)
+    app.router.add_post('/clips', handle_clip_create)
+    app.router.add_get('/clips/{clip_id}', handle_clip)
+    app.router.add_get('/clips/{clip_id}/{frame}.jpg', handle_clip_frame)
+    app.router.add_get('/recordings', handle_recordings)
+    app.router.add_get('/recordings/{camera_id}/{segment}.ts', handle_recording_segment)
     
-    # Cleanup on shutdown
+    # Start capture and the session sweeper, cleanup on shutdown
+    if role == 'front':
+        app.on_startup.append(start_workers)
+    app.on_startup.append(start_capture)
+    if role != 'worker':
+        app.on_startup.append(start_inference)
+    app.on_startup.append(start_sessions)
+    app.on_startup.append(start_recording)
+    app.on_startup.append(start_telemetry)
+    app.on_startup.append(start_encoder_budget)
+    app.on_startup.append(start_monitoring)
+    app.on_startup.append(preload_media)
     app.on_cleanup.append(cleanup)
+    return app
+
+async def serve(role, host='0.0.0.0', port=SERVER_PORT):
+    """Run the app for ``role`` until cancelled or sent SIGTERM"""
+    runner = web.AppRunner(build_app(role))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    
+    # Keep running
+    stop = asyncio.Event()
+    stop_on_sigterm(stop)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+async def main():
+    """Start WebRTC server"""
+    global PROCESS_ROLE, worker_pool
+    if WORKERS > 0:
+        PROCESS_ROLE = 'front'
+        worker_pool = WorkerPool()
     
     logger.info("=" * 60)
     logger.info("🎥 WebRTC Video Server")
     logger.info("=" * 60)
-    logger.info("📡 Server running on http://0.0.0.0:8080")
+    logger.info(f"📡 Server running on http://0.0.0.0:{SERVER_PORT}")
     logger.info("🎬 Video endpoint: /signal")
+    logger.info(f"📹 Cameras: {', '.join(cameras)} (default {DEFAULT_CAMERA})")
+    if worker_pool:
+        logger.info(f"👷 Workers: {WORKERS} on ports {WORKER_BASE_PORT}-{WORKER_BASE_PORT + WORKERS - 1}")
+    logger.info("🔌 WebSocket signaling: /ws")
     logger.info("🏥 Health check: /health")
+    logger.info("📊 Metrics: /metrics")
+    logger.info("🖼️ MJPEG fallback: /mjpeg, /snapshot.jpg")
+    logger.info("🎞️ Pre-event clips: POST /clips, GET /clips/{id}")
+    if RECORD:
+        logger.info(f"📼 Recording to {RECORD_DIR}: GET /recordings?t=<ms>")
+    logger.info("📟 Telemetry: POST /telemetry (device agent) -> 'telemetry' data channel")
+    logger.info(f"🎛️  Encoder profile: {ENCODER_PROFILE}" + (f" (CPU budget {CPU_BUDGET:.0%})" if ENCODER_AUTO else " (fixed)"))
     logger.info("=" * 60)
     
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)
-    await site.start()
-    
-    # Keep running
-    await asyncio.Event().wait()
+    await serve(PROCESS_ROLE, '0.0.0.0', SERVER_PORT)
 
 if __name__ == '__main__':
     asyncio.run(main())